@@ -1,15 +1,24 @@
 import streamlit as st
 import pandas as pd
-import paho.mqtt.client as mqtt
-import json
 import time
 import plotly.express as px
 import plotly.graph_objects as go
 from streamlit_option_menu import option_menu 
-import queue
+import threading
 from datetime import datetime, timedelta
 import numpy as np
-import random
+import os
+from luminode.store import TelemetryStore
+from luminode.persist import SQLiteBackend
+from luminode.downsample import downsample_frame
+from luminode.cache import LRUCache
+from luminode.subscriber import MQTTPool, parse_shards
+from luminode.commands import CommandPipeline
+from luminode.faults import select_rules
+from luminode.metrics import METRICS, MetricsExporter
+from luminode.sim import ControlLoopback, FleetSimulator, PoolTransport, run as run_simulation
+from luminode.export import FORMATS as EXPORT_FORMATS, MIME as EXPORT_MIME, head, pq, to_bytes
+from luminode.replay import replay
 
 # =========================================================
 # CONFIG
@@ -19,7 +28,58 @@ BROKER = "broker.hivemq.com"
 PORT = 1883
 TOPIC_SUB = "luminode/v4/stream"
 TOPIC_PUB = "luminode/v4/control"
-TARIFF_PER_KWH = 1600
+# payload codec per topic filter: JSON on the main stream, compact binary records on the sub-topics
+# (struct layout in luminode/decode.py; msgpack only if the package is installed)
+TOPIC_CODECS = {TOPIC_SUB: "json", TOPIC_SUB + "/bin": "struct", TOPIC_SUB + "/msgpack": "msgpack"}
+# sharded fleets publish on TOPIC_SUB/<shard>/...: "8" = shards 0..7, or a comma list of names
+MQTT_SHARDS = parse_shards(os.environ.get("LUMINODE_SHARDS", ""))
+MQTT_CONNECTIONS = int(os.environ.get("LUMINODE_MQTT_CONNECTIONS", 1))  # shards are spread over this many clients
+# control commands: widget changes are debounced, fleet commands batched; with an ack timeout,
+# devices must answer on TOPIC_PUB/ack (current firmware does not, so it is off by default)
+CONTROL_DEBOUNCE_S = float(os.environ.get("LUMINODE_CONTROL_DEBOUNCE", 0.6))
+CONTROL_ACK_TIMEOUT_S = float(os.environ.get("LUMINODE_CONTROL_ACK_TIMEOUT", 0))  # 0 = fire-and-forget
+CONTROL_MAX_RETRIES = int(os.environ.get("LUMINODE_CONTROL_MAX_RETRIES", 3))
+CONTROL_BATCH_SIZE = int(os.environ.get("LUMINODE_CONTROL_BATCH_SIZE", 500))  # node_ids per group message
+CONTROL_MAX_RATE = float(os.environ.get("LUMINODE_CONTROL_MAX_RATE", 50))  # messages per second
+TARIFF_PER_KWH = float(os.environ.get("LUMINODE_TARIFF_PER_KWH", 1600))  # Rp per kWh
+HISTORY_CAPACITY = int(os.environ.get("LUMINODE_HISTORY_CAPACITY", 200_000))
+INGEST_MAX_BATCH = int(os.environ.get("LUMINODE_INGEST_MAX_BATCH", 100_000))
+# bounded buffer between the MQTT thread and the ingest thread
+INGEST_BUFFER_SIZE = int(os.environ.get("LUMINODE_INGEST_BUFFER_SIZE", 200_000))
+INGEST_OVERLOAD_POLICY = os.environ.get("LUMINODE_OVERLOAD_POLICY", "coalesce")  # drop_oldest | sample | coalesce
+# "local": subscribe in this process. "shm": attach to `python -m luminode.worker` (owns MQTT + disk writes)
+# "sim": synthetic fleet (luminode/sim.py) fed in-process, no broker needed
+# "replay": a recorded CSV / Parquet export (luminode/replay.py) fed in-process
+INGEST_MODE = os.environ.get("LUMINODE_INGEST", "local")
+SIM_NODES = int(os.environ.get("LUMINODE_SIM_NODES", 1000))
+SIM_SPEED = float(os.environ.get("LUMINODE_SIM_SPEED", 1.0))  # device seconds per wall second
+SIM_BACKFILL = int(os.environ.get("LUMINODE_SIM_BACKFILL", 120))  # ticks of history at start
+SIM_DB = os.environ.get("LUMINODE_SIM_DB", "")  # used instead of DB_PATH in sim mode; empty = in-memory only
+REPLAY_FILE = os.environ.get("LUMINODE_REPLAY_FILE", "")
+REPLAY_SPEED = float(os.environ.get("LUMINODE_REPLAY_SPEED", 10.0))  # recorded seconds per wall second; 0 = flat out
+REPLAY_DB = os.environ.get("LUMINODE_REPLAY_DB", "")  # like SIM_DB: replayed rows never go to DB_PATH
+EXPORT_CHUNK_ROWS = int(os.environ.get("LUMINODE_EXPORT_CHUNK_ROWS", 50_000))
+EXPORT_MAX_ROWS = int(os.environ.get("LUMINODE_EXPORT_MAX_ROWS", 500_000))  # download button builds the file in memory
+SHM_NAME = os.environ.get("LUMINODE_SHM_NAME", "luminode")
+DB_PATH = os.environ.get("LUMINODE_DB", "luminode.db")  # empty string = in-memory only
+RETENTION_DAYS = int(os.environ.get("LUMINODE_RETENTION_DAYS", 35))
+# downsampling for trend charts: ~pixel width per trace, plus a budget per figure
+CHART_MAX_POINTS = int(os.environ.get("LUMINODE_CHART_MAX_POINTS", 1000))
+CHART_MAX_TOTAL_POINTS = int(os.environ.get("LUMINODE_CHART_MAX_TOTAL_POINTS", 20_000))
+DOWNSAMPLE_METHOD = os.environ.get("LUMINODE_DOWNSAMPLE", "lttb")  # "lttb" or "minmax"
+# liveness: a lamp without a reading for this long turns stale, then offline
+LIVENESS_STALE_S = float(os.environ.get("LUMINODE_STALE_AFTER", 60))
+LIVENESS_OFFLINE_S = float(os.environ.get("LUMINODE_OFFLINE_AFTER", 300))
+# streaming fault rules (luminode/faults.py): comma list of rule names, empty = all
+FAULT_RULES = select_rules(os.environ.get("LUMINODE_FAULT_RULES", ""))
+# Asset Map: above this many markers the cluster grid is coarsened (the browser stays responsive)
+MAP_MAX_MARKERS = int(os.environ.get("LUMINODE_MAP_MAX_MARKERS", 3000))
+# metrics export for monitoring (.json, anything else = Prometheus text); empty = off
+METRICS_FILE = os.environ.get("LUMINODE_METRICS_FILE", "")
+METRICS_INTERVAL = float(os.environ.get("LUMINODE_METRICS_INTERVAL", 10))
+METRICS_PER_NODE = os.environ.get("LUMINODE_METRICS_PER_NODE", "0") == "1"  # one series per lamp
+REFRESH_SECONDS = float(os.environ.get("LUMINODE_REFRESH_SECONDS", 2.0))  # live fragment cadence
+RENDER_CACHE_SIZE = int(os.environ.get("LUMINODE_RENDER_CACHE_SIZE", 256))  # built figures / aggregates
 
 # =========================================================
 # CSS
@@ -49,94 +109,98 @@ st.markdown("""
 # =========================================================
 # SESSION STATE (INISIAL)
 # =========================================================
-if "data_queue" not in st.session_state: st.session_state["data_queue"] = queue.Queue()
-if "latest" not in st.session_state: st.session_state["latest"] = {}
-if "history" not in st.session_state:
-    st.session_state["history"] = pd.DataFrame(columns=["node_id", "timestamp", "voltage", "current", "power", "lux", "fault_code", "status", "energy_total"])
+# telemetry itself lives in the shared TelemetryStore (see get_store); sessions only keep a cursor
 if "control_state" not in st.session_state: st.session_state["control_state"] = {}
 if "map_view" not in st.session_state: st.session_state["map_view"] = {"center": None, "zoom": 12}
 
-# helpers to track changes to avoid unnecessary reruns
-if "last_data_count" not in st.session_state: st.session_state["last_data_count"] = 0
-if "last_latest_sig" not in st.session_state: st.session_state["last_latest_sig"] = ""
+# helpers to track changes to avoid unnecessary rebuilds
+if "nodes_seen" not in st.session_state: st.session_state["nodes_seen"] = 0
 if "last_page" not in st.session_state: st.session_state["last_page"] = None
 if "current_page" not in st.session_state: st.session_state["current_page"] = None
 
 # =========================================================
 # MQTT HANDLERS
 # =========================================================
-def on_message(client, userdata, message):
-    try:
-        raw = message.payload.decode("utf-8")
-        payload = json.loads(raw)
-        if "timestamp" not in payload:
-            payload["timestamp"] = datetime.now()
-        else:
-            if isinstance(payload["timestamp"], str):
-                try:
-                    payload["timestamp"] = datetime.strptime(payload["timestamp"], "%Y-%m-%d %H:%M:%S")
-                except:
-                    try:
-                        payload["timestamp"] = datetime.fromisoformat(payload["timestamp"])
-                    except:
-                        payload["timestamp"] = datetime.now()
-        userdata.put(payload)
-    except Exception:
-        pass
+# decoding + per-shard stats live in luminode/subscriber.py (one paho loop thread per connection)
+@st.cache_resource
+def get_store():
+    # one store per server process, shared by every browser session
+    # synthetic or replayed lamps never go into the real database
+    db_path = {"sim": SIM_DB, "replay": REPLAY_DB}.get(INGEST_MODE, DB_PATH)
+    backend = SQLiteBackend(db_path) if db_path else None
+    shm = INGEST_MODE == "shm"
+    return TelemetryStore(HISTORY_CAPACITY, max_batch=INGEST_MAX_BATCH,
+                          backend=backend, retention_days=RETENTION_DAYS,
+                          buffer_size=INGEST_BUFFER_SIZE, overload_policy=INGEST_OVERLOAD_POLICY,
+                          persist=not shm, stale_after_s=LIVENESS_STALE_S,
+                          offline_after_s=LIVENESS_OFFLINE_S,
+                          fault_rules=FAULT_RULES).start(shm_name=SHM_NAME if shm else None)
+
+@st.cache_resource
+def get_simulator():
+    return FleetSimulator(SIM_NODES) if INGEST_MODE == "sim" else None
 
 @st.cache_resource
 def start_mqtt_client():
-    q = queue.Queue()
-    rnd_id = f"dash_{random.randint(1000,9999)}"
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=rnd_id, userdata=q)
-    client.on_message = on_message
+    q = get_store().queue
+    # in shm mode the worker subscribes; this pool only publishes control commands
+    pool = MQTTPool(BROKER, PORT, q, TOPIC_CODECS, TOPIC_SUB, shards=MQTT_SHARDS,
+                    connections=MQTT_CONNECTIONS, subscribe=INGEST_MODE != "shm")
+    if INGEST_MODE == "sim":
+        sim = get_simulator()
+        threading.Thread(target=run_simulation, args=(sim, PoolTransport(pool), TOPIC_SUB),
+                         kwargs={"speed": SIM_SPEED, "backfill": SIM_BACKFILL},
+                         name="luminode-sim", daemon=True).start()
+        return pool
+    if INGEST_MODE == "replay":
+        threading.Thread(target=replay, args=(REPLAY_FILE, PoolTransport(pool, "replay"), TOPIC_SUB),
+                         kwargs={"speed": REPLAY_SPEED}, name="luminode-replay", daemon=True).start()
+        return pool
     try:
-        client.connect(BROKER, PORT, keepalive=60)
-        client.subscribe(TOPIC_SUB)
-        client.loop_start()
+        pool.start()
     except Exception as e:
         st.error(f"MQTT Error: {e}")
-    return client, q
-
-client, client_queue = start_mqtt_client()
+    return pool
 
-# --- PROCESS QUEUE (MASUKKAN DATA BARU KE SESSION) ---
-start_loop_t = time.time()
-while not client_queue.empty():
-    try:
-        payload = client_queue.get_nowait()
-        nid = payload.get("node_id", "Unknown")
-
-        if nid not in st.session_state["control_state"]:
-            st.session_state["control_state"][nid] = {
-                "mode": "AUTO (Lux)", "lux_threshold": 300, "schedule_start": "18:00", "schedule_end": "06:00"
-            }
-
-        curr_status = payload.get("status", "OFF")
-        try:
-            curr_power = float(payload.get("power", 0))
-        except:
-            curr_power = 0
-
-        if curr_status == "ON" and curr_power < 0.5:
-            payload["fault_code"] = 4
+@st.cache_resource
+def get_commands():
+    # sim: commands go to the simulated lamps; replay: a recording cannot be controlled (None)
+    if INGEST_MODE == "replay":
+        return None
+    loopback = ControlLoopback(get_simulator()) if INGEST_MODE == "sim" else None
+    publish = loopback.publish if loopback else mqtt_pool.client.publish
+    pipeline = CommandPipeline(publish, TOPIC_PUB, debounce_s=CONTROL_DEBOUNCE_S,
+                               ack_timeout_s=CONTROL_ACK_TIMEOUT_S, max_retries=CONTROL_MAX_RETRIES,
+                               batch_size=CONTROL_BATCH_SIZE, max_rate=CONTROL_MAX_RATE)
+    if CONTROL_ACK_TIMEOUT_S:  # fire-and-forget needs no ack subscription
+        if loopback:
+            loopback.ack = pipeline.on_ack
         else:
-            payload["fault_code"] = 0
-
-        st.session_state["latest"][nid] = payload
+            mqtt_pool.route(pipeline.ack_topic, pipeline.on_ack)
+    return pipeline.start()
 
-        new_row = pd.DataFrame([payload])
-        new_row['timestamp'] = pd.to_datetime(new_row['timestamp'])
-        st.session_state["history"] = pd.concat([st.session_state["history"], new_row], ignore_index=True)
-
-        if len(st.session_state["history"]) > 2000:
-            st.session_state["history"] = st.session_state["history"].iloc[-2000:].reset_index(drop=True)
-
-        # limit processing time in this loop
-        if time.time() - start_loop_t > 0.5:
-            break
-    except Exception:
-        break
+@st.cache_resource
+def start_metrics():
+    # gauges are read when a snapshot is taken, never on the hot path
+    buf, cache = store.queue, get_render_cache()
+    METRICS.gauge("queue_size", buf.qsize)
+    METRICS.gauge("queue_high_water", lambda: buf.high_water)
+    METRICS.gauge("queue_dropped", lambda: buf.dropped)
+    METRICS.gauge("queue_coalesced", lambda: buf.coalesced)
+    METRICS.gauge("nodes", lambda: len(store.nodes))
+    METRICS.gauge("store_version", lambda: store.version)
+    METRICS.gauge("render_cache_hits", lambda: cache.hits)
+    METRICS.gauge("render_cache_misses", lambda: cache.misses)
+    if commands is not None:
+        METRICS.gauge("commands_pending", lambda: commands.summary()["pending"])
+    if not METRICS_FILE:
+        return None
+    return MetricsExporter(METRICS, METRICS_FILE, METRICS_INTERVAL,
+                           nodes=store.node_rates if METRICS_PER_NODE else None).start()
+
+store = get_store()
+mqtt_pool = start_mqtt_client()
+commands = get_commands()
 
 # =========================================================
 # HELPERS
@@ -154,19 +218,34 @@ def style_chart(fig, uirev=None):
         fig.update_layout(uirevision=uirev)
     return fig
 
-def get_latest_signature():
+def thin(df, y, by=None):
+    """Downsample a trend frame before it goes to Plotly (per trace when ``by`` is set)."""
+    return downsample_frame(df, "timestamp", y, max_points=CHART_MAX_POINTS, by=by,
+                            method=DOWNSAMPLE_METHOD, max_total=CHART_MAX_TOTAL_POINTS)
+
+@st.cache_resource
+def get_render_cache():
+    # shared by all sessions: figures / aggregates only depend on the data they were built from
+    return LRUCache(RENDER_CACHE_SIZE)
+
+def memo(key, version, build):
     """
-    Build a deterministic signature string for current latest payloads:
-    node_id:ISO_TIMESTAMP|node2:ISO_TIMESTAMP|...
+    Cached figure or aggregate for (current page, *key) built from data ``version``.
+    ``key`` is (name, node filter, period, ...); a newer version replaces the old entry.
     """
-    parts = []
-    for k in sorted(st.session_state["latest"].keys()):
-        v = st.session_state["latest"].get(k, {})
-        ts = v.get("timestamp", "")
-        if isinstance(ts, datetime):
-            ts = ts.isoformat()
-        parts.append(f"{k}:{ts}")
-    return "|".join(parts)
+    def timed():
+        t0 = time.perf_counter()
+        value = build()
+        METRICS.observe("figure" if isinstance(value, go.Figure) else "frame", time.perf_counter() - t0)
+        return value
+    return get_render_cache().get_or_build((st.session_state.get("current_page"),) + tuple(key), version, timed)
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def watch_nodes():
+    # the only full rerun left: node pickers need it when a new lamp shows up
+    if store.nodes_version != st.session_state["nodes_seen"]:
+        st.session_state["nodes_seen"] = store.nodes_version
+        st.rerun()
 
 # =========================================================
 # 1. MAIN DASHBOARD
@@ -176,25 +255,25 @@ def render_dashboard():
     with c_head:
         st.markdown("## 🏙️ Main Dashboard")
     with c_filt:
-        all_nodes = sorted(list(st.session_state["latest"].keys()))
+        all_nodes = sorted(list(store.latest.keys()))
         nodes_list = ["All Nodes"] + all_nodes if all_nodes else ["Waiting Data..."]
         dash_node_filter = st.selectbox("Select Node:", nodes_list, key="dash_select")
 
-    df_latest = st.session_state["latest"]
-    target_data = []
-    if dash_node_filter != "Waiting Data...":
-        if dash_node_filter != "All Nodes" and dash_node_filter in df_latest:
-            target_data = [df_latest[dash_node_filter]]
-        elif dash_node_filter == "All Nodes":
-            target_data = list(df_latest.values())
+    dashboard_live(dash_node_filter)
 
-    total_power = sum(float(d.get('power', 0) or 0) for d in target_data)
-    fault_count = len([d for d in target_data if int(d.get('fault_code', 0) or 0) != 0])
-    active_count = max(0, len(target_data) - fault_count)
+@st.fragment(run_every=REFRESH_SECONDS)
+def dashboard_live(dash_node_filter):
+    node_sel = None if dash_node_filter in ("All Nodes", "Waiting Data...") else dash_node_filter
+    version = store.data_version(node_sel)
+
+    agg = memo(("dash_kpi", dash_node_filter), version, lambda: store.aggregates(node_sel))
+    total_power = agg["power"]
+    fault_count = agg["faults"]
+    active_count = agg["healthy"]
 
     k1, k2, k3, k4 = st.columns(4)
     k1.markdown(f'<div class="intel-card"><div class="card-header">Total Load</div><div class="metric-big">{total_power:.1f} W</div><div class="metric-sub">Real-time</div></div>', unsafe_allow_html=True)
-    k2.markdown(f'<div class="intel-card"><div class="card-header">Total Nodes</div><div class="metric-big">{len(target_data)}</div><div class="metric-sub">Connected</div></div>', unsafe_allow_html=True)
+    k2.markdown(f'<div class="intel-card"><div class="card-header">Total Nodes</div><div class="metric-big">{agg["nodes"]}</div><div class="metric-sub">{agg["online"]} Connected · {agg["stale"]} Stale · {agg["offline"]} Offline</div></div>', unsafe_allow_html=True)
     k3.markdown(f'<div class="intel-card"><div class="card-header">Healthy</div><div class="metric-big">{active_count}</div><div class="metric-sub" style="color:#2ecc71">Online</div></div>', unsafe_allow_html=True)
     k4.markdown(f'<div class="intel-card"><div class="card-header">Faults</div><div class="metric-big" style="color:{"#e74c3c" if fault_count > 0 else "#05CD99"}">{fault_count}</div><div class="metric-sub">Alerts</div></div>', unsafe_allow_html=True)
 
@@ -202,17 +281,21 @@ def render_dashboard():
     with c_left:
         st.markdown('<div class="intel-card"><div class="card-header">Power Trend (Realtime)</div>', unsafe_allow_html=True)
         try:
-            df_hist = st.session_state["history"].copy()
-            if not df_hist.empty:
-                if dash_node_filter != "All Nodes":
-                    df_viz = df_hist[df_hist["node_id"] == dash_node_filter]
-                else:
-                    df_viz = df_hist.copy()
-                df_viz["power"] = pd.to_numeric(df_viz.get("power", 0), errors="coerce").fillna(0)
-                fig = px.area(df_viz, x="timestamp", y="power", color="node_id", template="plotly_dark")
-                # uirevision unique per page to avoid cross-page carry-over
-                uirev = f"{st.session_state.get('current_page','Dashboard')}_dash_pwr"
-                st.plotly_chart(style_chart(fig, uirev), use_container_width=True, key="dash_pwr")
+            hist = store.ring
+            if len(hist) > 0:
+                def build():
+                    if dash_node_filter != "All Nodes":
+                        df_viz = hist.node_frame(dash_node_filter)
+                    else:
+                        df_viz = hist.frame()
+                    df_viz["node_id"] = df_viz["node_id"].cat.remove_unused_categories()
+                    df_viz = thin(df_viz, "power", by="node_id")
+                    fig = px.area(df_viz, x="timestamp", y="power", color="node_id", template="plotly_dark")
+                    # uirevision unique per page to avoid cross-page carry-over
+                    uirev = f"{st.session_state.get('current_page','Dashboard')}_dash_pwr"
+                    return style_chart(fig, uirev)
+                fig = memo(("dash_pwr", dash_node_filter), version, build)
+                st.plotly_chart(fig, use_container_width=True, key="dash_pwr")
             else:
                 st.info("Waiting for data...")
         except Exception:
@@ -222,11 +305,14 @@ def render_dashboard():
     with c_right:
         st.markdown('<div class="intel-card"><div class="card-header">Health Status</div>', unsafe_allow_html=True)
         try:
-            if len(target_data) > 0:
-                fig_p = px.pie(names=["Healthy", "Fault"], values=[active_count, fault_count],
-                              color_discrete_sequence=["#4318FF", "#FFB547"], hole=0.6)
-                uirev = f"{st.session_state.get('current_page','Dashboard')}_dash_pie"
-                st.plotly_chart(style_chart(fig_p, uirev), use_container_width=True, key="dash_pie")
+            if agg["nodes"] > 0:
+                def build_pie():
+                    silent = agg["nodes"] - active_count - fault_count  # no fault, but not reporting
+                    fig_p = px.pie(names=["Healthy", "Fault", "Silent"], values=[active_count, fault_count, silent],
+                                  color_discrete_sequence=["#4318FF", "#FFB547", "#A3AED0"], hole=0.6)
+                    uirev = f"{st.session_state.get('current_page','Dashboard')}_dash_pie"
+                    return style_chart(fig_p, uirev)
+                st.plotly_chart(memo(("dash_pie", dash_node_filter), version, build_pie), use_container_width=True, key="dash_pie")
             else:
                 st.caption("No data available")
         except Exception:
@@ -238,15 +324,18 @@ def render_dashboard():
 # =========================================================
 def render_control():
     st.markdown("## 🎛️ Smart Control")
-    if not st.session_state["latest"]:
+    if commands is None:
+        st.info("Control is off while replaying a recording: there are no lamps to command.")
+        return
+    if not store.latest:
         st.warning("Waiting for nodes...")
         return
 
-    all_nodes = sorted(st.session_state["latest"].keys())
+    all_nodes = sorted(store.latest.keys())
     selected = st.selectbox("Select Node to Control:", all_nodes, key="ctrl_select")
 
     node = selected
-    state = st.session_state["control_state"].get(node, {
+    state = st.session_state["control_state"].setdefault(node, {
         "mode": "AUTO (Lux)",
         "lux_threshold": 300,
         "schedule_start": "18:00",
@@ -262,8 +351,7 @@ def render_control():
         # ========================================================
         with c1:
             st.markdown(f"#### 💡 {node}")
-            curr = st.session_state["latest"].get(node, {})
-            st.caption(f"Status: **{curr.get('status','OFF')}** | Lux: **{curr.get('lux',0)}**")
+            control_status(node)
 
         # ========================================================
         # CENTER PANEL: MODE SELECTOR
@@ -278,13 +366,7 @@ def render_control():
 
             if new_mode != state.get("mode"):
                 st.session_state["control_state"][node]["mode"] = new_mode
-                try:
-                    client.publish(TOPIC_PUB, json.dumps({
-                        "node_id": node,
-                        "mode_update": new_mode
-                    }))
-                except:
-                    pass
+                commands.submit(node, {"mode_update": new_mode})
                 st.toast(f"Mode set: {new_mode}")
 
         # ========================================================
@@ -300,10 +382,8 @@ def render_control():
                 thr = st.slider("Lux", 0, 1000, state.get("lux_threshold", 300), key=f"sl_{node}")
                 if thr != state.get("lux_threshold"):
                     st.session_state["control_state"][node]["lux_threshold"] = thr
-                    client.publish(TOPIC_PUB, json.dumps({
-                        "node_id": node,
-                        "lux_threshold": thr
-                    }))
+                    # debounced: dragging the slider sends only the value it settles on
+                    commands.submit(node, {"lux_threshold": thr})
 
             # ----------------------------------------------
             # MANUAL MODE → ON/OFF buttons
@@ -311,17 +391,9 @@ def render_control():
             elif "MANUAL" in new_mode:
                 b1, b2 = st.columns(2)
                 if b1.button("ON", key=f"bon_{node}"):
-                    client.publish(TOPIC_PUB, json.dumps({
-                        "node_id": node,
-                        "command": "ON",
-                        "mode": "MANUAL"
-                    }))
+                    commands.submit(node, {"command": "ON", "mode": "MANUAL"}, debounce=False)
                 if b2.button("OFF", key=f"boff_{node}"):
-                    client.publish(TOPIC_PUB, json.dumps({
-                        "node_id": node,
-                        "command": "OFF",
-                        "mode": "MANUAL"
-                    }))
+                    commands.submit(node, {"command": "OFF", "mode": "MANUAL"}, debounce=False)
 
             # ----------------------------------------------
             # SCHEDULED MODE → Dropdown Start & End Time
@@ -351,17 +423,74 @@ def render_control():
                     st.session_state["control_state"][node]["schedule_start"] = st_time
                     st.session_state["control_state"][node]["schedule_end"] = ed_time
 
-                    client.publish(TOPIC_PUB, json.dumps({
-                        "node_id": node,
+                    commands.submit(node, {
                         "mode": "SCHEDULED",
                         "schedule_start": st_time,
                         "schedule_end": ed_time
-                    }))
+                    })
 
                     st.toast(f"Schedule updated: {st_time} → {ed_time}")
 
         st.markdown('</div>', unsafe_allow_html=True)
 
+    render_group_control(all_nodes)
+
+CMD_ICONS = {"pending": "⏳", "sent": "📤", "acked": "✅", "failed": "❌"}
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def control_status(node):
+    curr = store.latest.get(node, {})
+    st.caption(f"Status: **{curr.get('status','OFF')}** | Lux: **{curr.get('lux',0)}**")
+    cmd = commands.status(node)
+    if cmd:
+        st.caption(f"Last command: {CMD_ICONS.get(cmd['state'], '')} {cmd['state']} "
+                   f"({', '.join(f'{k}={v}' for k, v in cmd['fields'].items())})")
+
+# ----------------------------------------------
+# FLEET / GROUP COMMANDS → satu pesan per batch node, bukan per node
+# ----------------------------------------------
+def render_group_control(all_nodes):
+    with st.expander("🛰️ Fleet / Group Commands"):
+        g1, g2 = st.columns([2, 1])
+        with g1:
+            target = st.radio("Target", ["All nodes", "Nodes with faults", "Selected nodes"], horizontal=True, key="grp_target")
+            if target == "Selected nodes":
+                group = st.multiselect("Nodes", all_nodes, key="grp_nodes")
+            elif target == "Nodes with faults":
+                group = sorted(n for n, p in store.latest.items() if int(p.get("fault_code", 0) or 0) != 0)
+            else:
+                group = all_nodes
+        with g2:
+            action = st.selectbox("Action", ["Set Mode", "Lux Threshold", "Turn ON", "Turn OFF", "Schedule"], key="grp_action")
+            if action == "Set Mode":
+                fields = {"mode_update": st.selectbox("Mode", ["AUTO (Lux)", "MANUAL", "SCHEDULED"], key="grp_mode")}
+            elif action == "Lux Threshold":
+                fields = {"lux_threshold": st.slider("Lux", 0, 1000, 300, key="grp_lux")}
+            elif action == "Schedule":
+                hours = [f"{h:02d}:00" for h in range(24)]
+                fields = {"mode": "SCHEDULED",
+                          "schedule_start": st.selectbox("Start Time", hours, index=18, key="grp_st"),
+                          "schedule_end": st.selectbox("End Time", hours, index=6, key="grp_et")}
+            else:
+                fields = {"command": "ON" if action == "Turn ON" else "OFF", "mode": "MANUAL"}
+
+        if st.button(f"Send to {len(group):,} node(s)", key="grp_send", disabled=not group):
+            commands.submit_group(group, fields)
+            # keep the per-node panel in sync with what the fleet was told
+            local = {"mode_update": "mode", "mode": "mode", "lux_threshold": "lux_threshold",
+                     "schedule_start": "schedule_start", "schedule_end": "schedule_end"}
+            for n in group:
+                if n in st.session_state["control_state"]:
+                    st.session_state["control_state"][n].update({local[k]: v for k, v in fields.items() if k in local})
+            st.toast(f"{action} queued for {len(group):,} node(s)")
+        command_summary()
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def command_summary():
+    s = commands.summary()
+    st.caption(f"Commands: {s['pending']:,} pending · {s['awaiting_ack']:,} awaiting ack · {s['acked']:,} acked · "
+               f"{s['failed']:,} failed · {s['messages']:,} messages sent ({s['coalesced']:,} coalesced, {s['retries']:,} retries)")
+
 # =========================================================
 # 3. ANALYTICS
 # =========================================================
@@ -371,7 +500,7 @@ def render_analytics():
         st.markdown("## 📈 Analytics")
 
     with c_opt1:
-        nodes = sorted(list(st.session_state["latest"].keys()))
+        nodes = sorted(list(store.latest.keys()))
         ana_node = st.selectbox("Select Node", ["All Nodes"] + nodes, key="ana_node")
 
     with c_opt2:
@@ -380,76 +509,111 @@ def render_analytics():
     if st.button("Refresh Analytics"):
         st.rerun()
 
-    df = st.session_state["history"].copy()
-    if df.empty:
+    if len(store.nodes) == 0:
         st.info("No data yet.")
         return
 
+    with st.expander("⬇️ Export"):
+        # file dibangun per chunk baru saat tombol diklik, bukan tiap rerun
+        formats = [f for f in EXPORT_FORMATS if f != "parquet" or pq is not None]
+        fmt = st.radio("Format", formats, horizontal=True, key="ana_export_fmt", format_func=str.upper)
+        node_sel = None if ana_node == "All Nodes" else ana_node
+        st.download_button(
+            f"Download {fmt.upper()}",
+            data=lambda: to_bytes(head(store.iter_history(node_sel, period_start(period), chunk_rows=EXPORT_CHUNK_ROWS),
+                                       EXPORT_MAX_ROWS), fmt),
+            file_name=f"luminode_{(node_sel or 'all').replace(' ', '_')}_{datetime.now():%Y%m%d_%H%M}.{fmt}",
+            mime=EXPORT_MIME[fmt], key="ana_export")
+        st.caption(f"At most {EXPORT_MAX_ROWS:,} rows; larger ranges: python -m luminode.export (streams straight to disk)")
+
+    analytics_live(ana_node, period)
+
+def period_start(period, now=None):
+    now = now or datetime.now()
+    if period == "Past 1 Hour":
+        return now - timedelta(hours=1)
+    if period == "Past 24 Hours":
+        return now - timedelta(days=1)
+    if period == "Past Week":
+        return now - timedelta(days=7)
+    return now - timedelta(days=30)
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def analytics_live(ana_node, period):
     try:
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        now = datetime.now()
-        if period == "Past 1 Hour":
-            cut = now - timedelta(hours=1)
-        elif period == "Past 24 Hours":
-            cut = now - timedelta(days=1)
-        elif period == "Past Week":
-            cut = now - timedelta(days=7)
-        else:
-            cut = now - timedelta(days=30)
-
-        df = df[df["timestamp"] >= cut]
-        if ana_node != "All Nodes":
-            df = df[df["node_id"] == ana_node]
-
-        latest_data = st.session_state["latest"]
-        total_acc_kwh = 0.0
+        cut = period_start(period)
 
-        if ana_node == "All Nodes":
-            for n in latest_data:
-                total_acc_kwh += float(latest_data[n].get("energy_total", 0))
-        elif ana_node in latest_data:
-            total_acc_kwh = float(latest_data[ana_node].get("energy_total", 0))
+        # trends come from the rollup tier that fits the period, not from raw rows
+        node_sel = None if ana_node == "All Nodes" else ana_node
+        # the window slides with the clock: a node that stopped reporting keeps its data version
+        step = store.rollups.pick((datetime.now() - cut).total_seconds()).width_s
+        version = (store.data_version(node_sel), int(cut.timestamp()) // step)
+        tier, df = memo(("ana_roll", ana_node, period), version, lambda: store.rollup(cut, node_sel, per_node=node_sel is None))
 
-        total_cost_real = total_acc_kwh * TARIFF_PER_KWH
+        # konsumsi per periode dari ledger (delta meter), bukan jumlah meter terakhir
+        energy = memo(("ana_energy", ana_node, period), version, lambda: store.energy_between(cut, node_id=node_sel))
+        period_kwh = energy["kwh"]
+        period_cost = period_kwh * TARIFF_PER_KWH
 
         c1, c2, c3 = st.columns(3)
-        c1.markdown(f'<div class="intel-card"><div class="card-header">Total Energy</div><div class="metric-big">{total_acc_kwh:.4f} kWh</div><div class="metric-sub">Accumulated Meter</div></div>', unsafe_allow_html=True)
-        c2.markdown(f'<div class="intel-card"><div class="card-header">Total Cost</div><div class="metric-big">Rp {total_cost_real:,.0f}</div><div class="metric-sub">Real Bill</div></div>', unsafe_allow_html=True)
+        c1.markdown(f'<div class="intel-card"><div class="card-header">Energy ({period})</div><div class="metric-big">{period_kwh:.4f} kWh</div><div class="metric-sub">Metered consumption</div></div>', unsafe_allow_html=True)
+        c2.markdown(f'<div class="intel-card"><div class="card-header">Cost ({period})</div><div class="metric-big">Rp {period_cost:,.0f}</div><div class="metric-sub">@ Rp {TARIFF_PER_KWH:,.0f}/kWh</div></div>', unsafe_allow_html=True)
 
-        faults = df[df.get("fault_code", 0) != 0] if "fault_code" in df.columns else pd.DataFrame()
-        c3.markdown(f'<div class="intel-card"><div class="card-header">Fault Events</div><div class="metric-big">{len(faults)}</div></div>', unsafe_allow_html=True)
+        fault_events = int(df["faults"].sum())
+        c3.markdown(f'<div class="intel-card"><div class="card-header">Fault Events</div><div class="metric-big">{fault_events}</div></div>', unsafe_allow_html=True)
 
         g1, g2 = st.columns(2)
         with g1:
-            st.markdown('<div class="intel-card"><div class="card-header">Power Trend</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="intel-card"><div class="card-header">Power Trend ({tier.name} avg)</div>', unsafe_allow_html=True)
             if not df.empty:
-                df["power"] = pd.to_numeric(df.get("power", 0), errors="coerce").fillna(0)
-                fig = px.line(df, x="timestamp", y="power", color="node_id" if ana_node == "All Nodes" else None)
-                uirev = f"{st.session_state.get('current_page','Analytics')}_ana_pwr"
-                st.plotly_chart(style_chart(fig, uirev), use_container_width=True, key="ana_pwr")
+                def build_pwr():
+                    df_pwr = thin(df, "power", by="node_id" if ana_node == "All Nodes" else None)
+                    fig = px.line(df_pwr, x="timestamp", y="power", color="node_id" if ana_node == "All Nodes" else None)
+                    uirev = f"{st.session_state.get('current_page','Analytics')}_ana_pwr"
+                    return style_chart(fig, uirev)
+                st.plotly_chart(memo(("ana_pwr", ana_node, period), version, build_pwr), use_container_width=True, key="ana_pwr")
             st.markdown('</div>', unsafe_allow_html=True)
 
         with g2:
             st.markdown('<div class="intel-card"><div class="card-header">V/I Trend</div>', unsafe_allow_html=True)
             if not df.empty:
-                if ana_node == "All Nodes":
-                    df_viz = df.groupby("timestamp")[["voltage", "current"]].mean().reset_index()
-                else:
-                    df_viz = df
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=df_viz["timestamp"], y=df_viz["voltage"], name="V", line=dict(color="#4318FF")))
-                fig.add_trace(go.Scatter(x=df_viz["timestamp"], y=df_viz["current"], name="I", line=dict(color="#FFB547"), yaxis="y2"))
-                fig.update_layout(yaxis2=dict(overlaying="y", side="right", title="I"))
-                uirev = f"{st.session_state.get('current_page','Analytics')}_ana_vi"
-                st.plotly_chart(style_chart(fig, uirev), use_container_width=True, key="ana_vi")
+                def build_vi():
+                    if ana_node == "All Nodes":
+                        _, df_viz = store.rollup(cut)
+                    else:
+                        df_viz = df
+                    df_v, df_i = thin(df_viz, "voltage"), thin(df_viz, "current")
+                    fig = go.Figure()
+                    fig.add_trace(go.Scatter(x=df_v["timestamp"], y=df_v["voltage"], name="V", line=dict(color="#4318FF")))
+                    fig.add_trace(go.Scatter(x=df_i["timestamp"], y=df_i["current"], name="I", line=dict(color="#FFB547"), yaxis="y2"))
+                    fig.update_layout(yaxis2=dict(overlaying="y", side="right", title="I"))
+                    uirev = f"{st.session_state.get('current_page','Analytics')}_ana_vi"
+                    return style_chart(fig, uirev)
+                st.plotly_chart(memo(("ana_vi", ana_node, period), version, build_vi), use_container_width=True, key="ana_vi")
             st.markdown('</div>', unsafe_allow_html=True)
 
+        st.markdown("### 🔎 Anomaly Watch")
+        df_anom = memo(("ana_anom", ana_node), version, lambda: store.anomalies(node_sel))
+        if not df_anom.empty and df_anom["score"].max() > 0:
+            st.caption("Score = smoothed largest |z| of voltage / current / power / lux against each lamp's own EWMA baseline (≥ 3 is unusual).")
+            st.dataframe(df_anom, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Anomaly baselines are still warming up.")
+
         st.markdown("### ⚠️ Fault Logs")
-        df_broken = df[df.get("fault_code", 0) == 4].copy() if "fault_code" in df.columns else pd.DataFrame()
+        def build_faults():
+            # straight from the fault engine's event log; lamps going stale / offline / back online next to it
+            df_f = store.fault_events(node_sel, since=cut)
+            events = store.liveness_events(node_sel, since=cut)
+            if events.empty:
+                return df_f
+            events = events.rename(columns={"status": "event"}).assign(fault="liveness", value=np.nan)
+            return pd.concat([df_f, events], ignore_index=True)
+        df_broken = memo(("ana_faults", ana_node, period), version, build_faults)
 
         if not df_broken.empty:
             st.dataframe(
-                df_broken[["timestamp", "node_id", "status", "power", "voltage"]].sort_values("timestamp", ascending=False),
+                df_broken[["timestamp", "node_id", "fault", "event", "value"]].sort_values("timestamp", ascending=False),
                 use_container_width=True,
                 hide_index=True
             )
@@ -464,42 +628,143 @@ def render_analytics():
 # =========================================================
 def render_map():
     st.markdown("## 🗺️ Asset Map")
-    if st.session_state["latest"]:
-        if st.button("Refresh Map"):
-            st.rerun()
-        try:
-            df = pd.DataFrame(list(st.session_state["latest"].values()))
-            for c in ["lat", "lng"]:
-                df[c] = pd.to_numeric(df.get(c, 0), errors="coerce")
-            df = df.dropna(subset=["lat", "lng"])
-            if not df.empty:
-                if not st.session_state["map_view"]["center"]:
-                    st.session_state["map_view"] = {"center": {"lat": df["lat"].mean(), "lon": df["lng"].mean()}, "zoom": 12}
-
-                df["color"] = df.get("fault_code", 0).apply(lambda x: "#E74C3C" if int(x) != 0 else "#05CD99")
-                st.markdown('<div class="intel-card" style="padding:10px;">', unsafe_allow_html=True)
-                fig = px.scatter_mapbox(df, lat="lat", lon="lng", color="color", size_max=15,
-                                        zoom=st.session_state["map_view"]["zoom"], height=500,
-                                        color_discrete_map="identity",
-                                        hover_name="node_id",
-                                        hover_data={"lat": False, "lng": False, "color": False, "status": True, "power": ":.1f", "energy_total": ":.4f"})
-                fig.update_layout(mapbox_style="carto-positron", margin={"r": 0, "t": 0, "l": 0, "b": 0}, mapbox_center=st.session_state["map_view"]["center"])
-                uirev = f"{st.session_state.get('current_page','Asset Map')}_map_u"
-                st.plotly_chart(style_chart(fig, uirev), use_container_width=True, key="map_u")
-                st.markdown('</div>', unsafe_allow_html=True)
-        except Exception:
-            pass
+    if store.latest:
+        c_zoom, c_btn = st.columns([3, 1])
+        with c_zoom:
+            # zoom menentukan ukuran cluster: satu marker per sel ~60 px di layar
+            zoom = st.select_slider("Zoom", options=list(range(8, 19)), value=st.session_state["map_view"]["zoom"], key="map_zoom")
+            st.session_state["map_view"]["zoom"] = zoom
+        with c_btn:
+            if st.button("Refresh Map"):
+                st.rerun()
+        map_live(zoom)
     else:
         st.info("Waiting GPS...")
 
+# plotly >= 5.24 renders with MapLibre (scatter_map); older releases only have the mapbox variant
+if hasattr(px, "scatter_map"):
+    scatter_map, MAP_LAYOUT = px.scatter_map, "map"
+else:
+    scatter_map, MAP_LAYOUT = px.scatter_mapbox, "mapbox"
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def map_live(zoom):
+    try:
+        # index only depends on positions; status counts are re-aggregated per version
+        index = memo(("geo_index",), store.positions_version, store.geo_index)
+        if not len(index):
+            return
+        view = st.session_state["map_view"]
+        if not view["center"]:
+            view["center"] = index.center()
+        center = view["center"]
+
+        def build():
+            faulted, online = store.node_flags()
+            cl = index.clusters(index.fit_zoom(zoom, MAP_MAX_MARKERS), faulted, online)
+            df = pd.DataFrame(cl)
+            single = df["code"] >= 0
+            names = store.nodes.names
+            # detail per lampu hanya untuk marker yang berisi satu node
+            df["label"] = [names[c] if c >= 0 else f"{n:,} lamps" for c, n in zip(df["code"].tolist(), df["count"].tolist())]
+            df["liveness"] = "-"
+            df["active"] = "-"
+            df["anomaly"] = np.nan
+            if single.any():
+                one = df.loc[single, "code"].tolist()
+                df.loc[single, "liveness"] = [store.liveness.state_of(c) for c in one]
+                df.loc[single, "active"] = [", ".join(store.faults.active(c)) or "-" for c in one]
+                df.loc[single, "anomaly"] = [store.anomaly.score_of(c) for c in one]
+            df["color"] = np.where(df["faults"] > 0, "#E74C3C", np.where(df["online"] > 0, "#05CD99", "#A3AED0"))
+            df["size"] = np.sqrt(df["count"])
+            fig = scatter_map(df, lat="lat", lon="lng", color="color", size="size", size_max=30,
+                              zoom=zoom, height=500, color_discrete_map="identity",
+                              hover_name="label",
+                              hover_data={"lat": False, "lng": False, "color": False, "size": False, "code": False,
+                                          "count": True, "online": True, "faults": True,
+                                          "liveness": True, "active": True, "anomaly": ":.2f"})
+            fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0},
+                              **{f"{MAP_LAYOUT}_style": "carto-positron", f"{MAP_LAYOUT}_center": center})
+            uirev = f"{st.session_state.get('current_page','Asset Map')}_map_u"
+            return style_chart(fig, uirev)
+
+        # figures are shared across sessions: the view belongs in the key
+        fig = memo(("map_u", zoom, center["lat"], center["lon"]), store.version, build)
+        st.markdown('<div class="intel-card" style="padding:10px;">', unsafe_allow_html=True)
+        st.plotly_chart(fig, use_container_width=True, key="map_u")
+        st.markdown('</div>', unsafe_allow_html=True)
+    except Exception:
+        pass
+
+# =========================================================
+# 5. SYSTEM (PIPELINE METRICS)
+# =========================================================
+def render_system():
+    st.markdown("## 🩺 System")
+    st.caption("Where the time goes: MQTT receive → decode → queue → drain → normalize/apply/persist → frames & figures → rerun. "
+               + (f"Exported to `{METRICS_FILE}` every {METRICS_INTERVAL:g}s." if METRICS_FILE else "Set LUMINODE_METRICS_FILE to export."))
+    system_live()
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def system_live():
+    snap = METRICS.snapshot()
+    stages, gauges, counters = METRICS.stages_frame(), snap["gauges"], snap["counters"]
+    rates = store.node_rates()
+    lag = snap["stages"].get("e2e_lag", {})
+    hits, misses = gauges.get("render_cache_hits", 0), gauges.get("render_cache_misses", 0)
+
+    k1, k2, k3, k4 = st.columns(4)
+    k1.markdown(f'<div class="intel-card"><div class="card-header">Ingest Rate</div><div class="metric-big">{rates["msg_per_s"].sum():,.1f}/s</div><div class="metric-sub">{counters.get("rows", 0):,} rows · {counters.get("rejected", 0):,} rejected</div></div>', unsafe_allow_html=True)
+    k2.markdown(f'<div class="intel-card"><div class="card-header">End-to-End Lag</div><div class="metric-big">{lag.get("p50", 0):.2f} s</div><div class="metric-sub">p99 {lag.get("p99", 0):.2f} s</div></div>', unsafe_allow_html=True)
+    k3.markdown(f'<div class="intel-card"><div class="card-header">Ingest Queue</div><div class="metric-big">{gauges.get("queue_size", 0):,.0f}</div><div class="metric-sub">high water {gauges.get("queue_high_water", 0):,.0f} · {gauges.get("queue_dropped", 0):,.0f} dropped</div></div>', unsafe_allow_html=True)
+    k4.markdown(f'<div class="intel-card"><div class="card-header">Render Cache</div><div class="metric-big">{hits / max(1, hits + misses):.0%}</div><div class="metric-sub">{hits:,.0f} hits · {misses:,.0f} builds</div></div>', unsafe_allow_html=True)
+
+    c_left, c_right = st.columns([3, 2])
+    with c_left:
+        st.markdown('<div class="intel-card"><div class="card-header">Stage Latency (ms)</div>', unsafe_allow_html=True)
+        if not stages.empty:
+            fig = go.Figure()
+            fig.add_trace(go.Bar(x=stages["stage"], y=stages["p50"], name="p50", marker_color="#4318FF"))
+            fig.add_trace(go.Bar(x=stages["stage"], y=stages["p99"], name="p99", marker_color="#FFB547"))
+            fig.update_layout(barmode="group", yaxis_type="log")
+            st.plotly_chart(style_chart(fig, "System_sys_stages"), use_container_width=True, key="sys_stages")
+            st.dataframe(stages, use_container_width=True, hide_index=True)
+        else:
+            st.caption("No traffic measured yet.")
+        st.markdown('</div>', unsafe_allow_html=True)
+    with c_right:
+        st.markdown('<div class="intel-card"><div class="card-header">Per-Node Rate & Lag</div>', unsafe_allow_html=True)
+        # yang paling telat dulu; tabel dibatasi supaya tetap ringan di armada besar
+        st.dataframe(rates.sort_values("lag_s", ascending=False).head(500), use_container_width=True, hide_index=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with st.expander("Counters & gauges"):
+        st.json({"uptime_s": round(snap["uptime_s"], 1), "counters": counters, "gauges": gauges})
+
 # =========================================================
 # MAIN
 # =========================================================
 def main():
+    start_metrics()
     with st.sidebar:
         st.image("https://cdn-icons-png.flaticon.com/512/3665/3665923.png", width=50)
         st.markdown("### LumiNode Manager")
-        sel = option_menu(None, ["Dashboard", "Control Center", "Analytics", "Asset Map"], icons=["grid", "toggles", "bar-chart", "map"], default_index=0)
+        sel = option_menu(None, ["Dashboard", "Control Center", "Analytics", "Asset Map", "System"], icons=["grid", "toggles", "bar-chart", "map", "activity"], default_index=0)
+        buf = store.queue.stats()
+        if buf["dropped"] or buf["coalesced"]:
+            st.caption(f"⚠️ Ingest overload ({buf['policy']}): {buf['dropped']:,} dropped, {buf['coalesced']:,} coalesced")
+        if INGEST_MODE == "sim":
+            st.caption(f"🧪 Simulated fleet: {SIM_NODES:,} lamps")
+        if INGEST_MODE == "replay":
+            st.caption(f"⏪ Replaying {os.path.basename(REPLAY_FILE)} (x{REPLAY_SPEED:g})")
+        if INGEST_MODE == "shm" and store.shared is None:
+            st.caption("⏳ Waiting for ingestion worker (python -m luminode.worker)")
+        elif store.shm_lost:
+            st.caption(f"⚠️ Ingestion worker outran the dashboard: {store.shm_lost:,} rows skipped")
+        if MQTT_SHARDS and INGEST_MODE != "shm":
+            with st.expander("📡 MQTT shards"):
+                st.dataframe(pd.DataFrame(mqtt_pool.stats()).set_index("shard")[["connection", "msg_per_s", "lag_s", "idle_s"]],
+                             use_container_width=True)
 
     # set current page so renderers can use it for uirevision
     st.session_state["current_page"] = sel
@@ -507,7 +772,7 @@ def main():
     # reset per-page chart session keys when page actually changes (cleans any leftover keys)
     if st.session_state["last_page"] != sel:
         # delete only chart-related keys stored in session_state (if any)
-        for k in ["dash_pwr", "dash_pie", "ana_pwr", "ana_vi", "map_u"]:
+        for k in ["dash_pwr", "dash_pie", "ana_pwr", "ana_vi", "map_u", "sys_stages"]:
             if k in st.session_state:
                 del st.session_state[k]
         st.session_state["last_page"] = sel
@@ -522,28 +787,15 @@ def main():
             render_analytics()
         elif sel == "Asset Map":
             render_map()
+        elif sel == "System":
+            render_system()
 
     # -----------------------------
-    # Kondisional rerun: hanya kalau data/latest berubah atau halaman berganti.
-    # Ini mencegah rerun terus-menerus yang menyebabkan ghosting/blinking.
+    # Tidak ada lagi full rerun per pesan: tiap halaman punya fragment live yang
+    # refresh sendiri tiap REFRESH_SECONDS dan hanya rebuild kalau versinya berubah.
     # -----------------------------
-    current_count = len(st.session_state.get("history", []))
-    current_sig = get_latest_signature()
-    page = st.session_state.get("current_page")
-
-    data_changed = (current_count != st.session_state.get("last_data_count")) or (current_sig != st.session_state.get("last_latest_sig"))
-    page_changed = (page != st.session_state.get("last_page"))
-
-    if data_changed or page_changed:
-        # update trackers BEFORE rerun to avoid immediate repeated rerun
-        st.session_state["last_data_count"] = current_count
-        st.session_state["last_latest_sig"] = current_sig
-        st.session_state["last_page"] = page
-        # short sleep to allow UI to settle (keeps behavior responsive but avoids tight loop)
-        time.sleep(0.1)
-        # replaced experimental_rerun() -> use st.rerun() for compatibility
-        st.rerun()
-    # else: jangan rerun — biarkan app idle sampai ada perubahan
+    watch_nodes()
 
 if __name__ == "__main__":
-    main()
+    with METRICS.time("rerun"):
+        main()
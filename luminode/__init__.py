@@ -0,0 +1,7 @@
+"""
+LumiNode telemetry engine.
+
+Everything in this package is plain Python / NumPy / pandas and can be
+imported without Streamlit, so the dashboard, the ingestion worker and the
+tooling scripts share the same code paths.
+"""
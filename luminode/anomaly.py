@@ -0,0 +1,113 @@
+"""
+Per-node streaming anomaly scores.
+
+For every node and field the detector keeps an EWMA mean and variance
+(O(1) memory per node). A batch is scored against the statistics as they
+were before it, then folded in per node with ``np.bincount``: the batch's
+mean / variance enter the EWMA with an effective weight of
+``1 - (1 - alpha) ** k`` for ``k`` readings, so nothing is ever re-scanned.
+
+A reading's score is its largest |z| over the fields; a node's score is an
+EWMA of its readings' scores. Current and power only count while the lamp
+is ON (switching off is not an anomaly).
+"""
+import numpy as np
+import pandas as pd
+
+FIELDS = ("voltage", "current", "power", "lux")
+ON_ONLY = ("current", "power")
+
+
+class AnomalyDetector:
+    def __init__(self, alpha=0.02, score_alpha=0.3, warmup=20, rel_floor=0.01):
+        self.alpha = alpha              # weight of one reading in the mean / variance EWMA
+        self.score_alpha = score_alpha  # weight of one reading in the node score EWMA
+        self.warmup = warmup            # readings per field before it is scored
+        self.rel_floor = rel_floor      # std floor relative to |mean|, so flat signals do not explode
+        n = 64
+        self._mean = np.zeros((n, len(FIELDS)))
+        self._var = np.zeros((n, len(FIELDS)))
+        self._nobs = np.zeros((n, len(FIELDS)), dtype=np.int64)
+        self._z = np.zeros((n, len(FIELDS)), dtype=np.float32)  # |z| of each node's newest reading
+        self.score = np.zeros(n)
+
+    def _grow(self, n):
+        cap = len(self.score)
+        if n <= cap:
+            return
+        size = 2 * n
+
+        def grow(a):
+            out = np.zeros((size,) + a.shape[1:], dtype=a.dtype)
+            out[:cap] = a
+            return out
+
+        self._mean, self._var, self._nobs, self._z = grow(self._mean), grow(self._var), grow(self._nobs), grow(self._z)
+        self.score = grow(self.score)
+
+    def update(self, cols):
+        node = np.asarray(cols["node"])
+        if not len(node):
+            return
+        self._grow(int(node.max()) + 1)
+        x = np.column_stack([np.asarray(cols[f], dtype=np.float64) for f in FIELDS])
+        valid = np.ones(x.shape, dtype=bool)
+        on = np.asarray(cols["status"]) == 1
+        for f in ON_ONLY:
+            valid[:, FIELDS.index(f)] = on
+
+        # score against the statistics from before this batch
+        mean, var = self._mean[node], self._var[node]
+        sd = np.sqrt(var) + np.maximum(1e-3, self.rel_floor * np.abs(mean))
+        scored = valid & (self._nobs[node] >= self.warmup)
+        z = np.where(scored, np.abs(x - mean) / sd, 0.0)
+        row_score = z.max(axis=1)
+
+        uniq, inv = np.unique(node, return_inverse=True)
+        for f in range(len(FIELDS)):
+            w = valid[:, f].astype(np.float64)
+            cnt = np.bincount(inv, weights=w, minlength=len(uniq))
+            has = cnt > 0
+            if not has.any():
+                continue
+            xs = np.where(valid[:, f], x[:, f], 0.0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                m_b = np.bincount(inv, weights=xs, minlength=len(uniq)) / cnt
+                v_b = np.maximum(0.0, np.bincount(inv, weights=xs * xs, minlength=len(uniq)) / cnt - m_b * m_b)
+            u, cnt, m_b, v_b = uniq[has], cnt[has], m_b[has], v_b[has]
+            m0, v0 = self._mean[u, f], self._var[u, f]
+            a = 1 - (1 - self.alpha) ** cnt
+            first = self._nobs[u, f] == 0
+            d = m_b - m0
+            self._mean[u, f] = np.where(first, m_b, m0 + a * d)
+            self._var[u, f] = np.where(first, v_b, (1 - a) * (v0 + a * d * d) + a * v_b)
+            self._nobs[u, f] += cnt.astype(np.int64)
+
+        cnt = np.bincount(inv)
+        b = 1 - (1 - self.score_alpha) ** cnt
+        self.score[uniq] += b * (np.bincount(inv, weights=row_score) / cnt - self.score[uniq])
+        last = len(node) - 1 - np.unique(node[::-1], return_index=True)[1]
+        self._z[uniq] = z[last]
+
+    # -----------------------------------------------------
+    # READ
+    # -----------------------------------------------------
+    def score_of(self, code):
+        return float(self.score[code]) if 0 <= code < len(self.score) else 0.0
+
+    def frame(self, names, codes=None):
+        """node_id, score and the newest per-field |z| for ``codes`` (default: every node)."""
+        n = min(len(names), len(self.score))
+        codes = np.arange(n) if codes is None else np.asarray([c for c in codes if 0 <= c < n], dtype=np.int64)
+        out = {"node_id": [names[c] for c in codes.tolist()], "score": self.score[codes].round(2)}
+        for i, f in enumerate(FIELDS):
+            out["z_" + f] = self._z[codes, i].round(2)
+        return pd.DataFrame(out)
+
+    def top(self, names, k=10):
+        n = min(len(names), len(self.score))
+        k = min(k, n)
+        if not k:
+            return self.frame(names, [])
+        idx = np.argpartition(-self.score[:n], k - 1)[:k]
+        return self.frame(names, idx[np.argsort(-self.score[idx])])
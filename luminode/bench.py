@@ -0,0 +1,195 @@
+"""
+Benchmark suite for the ingest hot paths: ``python -m luminode.bench``.
+
+Every case runs on a seeded synthetic fleet (see sim.py) at each of the
+``--nodes`` sizes:
+
+- ``receive``: raw JSON through ``MQTTPool.deliver`` (decode, stats, buffer)
+- ``drain``: one ``IngestBuffer.drain`` of a full tick
+- ``ingest``: ``TelemetryStore.ingest`` per tick (normalize, faults,
+  ring, rollups, anomaly, liveness), no disk
+- ``memory``: traced allocations of a store after ``--ticks`` ticks
+- ``page``: one full script run per dashboard page via Streamlit's AppTest,
+  against ``LUMINODE_INGEST=sim`` (in a subprocess per fleet size, so cached
+  resources never leak between sizes)
+
+``--json out.json`` saves the results; ``--baseline out.json`` compares
+against an earlier run and exits 1 when a case got worse by more than
+``--tolerance``.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from .buffer import IngestBuffer
+from .metrics import METRICS
+from .sim import FleetSimulator, encode
+from .store import TelemetryStore
+from .subscriber import MQTTPool
+
+TOPIC = "luminode/v4/stream"
+PAGES = ("Dashboard", "Control Center", "Analytics", "Asset Map", "System")
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dashboard_real.py")
+
+
+def result(case, nodes, value, unit, better):
+    return {"case": case, "nodes": nodes, "value": round(float(value), 3), "unit": unit, "better": better}
+
+
+def bench_receive(sim, ticks):
+    buf = IngestBuffer(len(sim) * (ticks + 1), "drop_oldest")
+    pool = MQTTPool("localhost", 1883, buf, {TOPIC: "json"}, TOPIC, subscribe=False)
+    raw = [encode(p) for _ in range(ticks) for p in sim.tick()]
+    t0 = time.perf_counter()
+    for r in raw:
+        pool.deliver(TOPIC, r)
+    return result("receive", len(sim), len(raw) / (time.perf_counter() - t0), "msg/s", "higher")
+
+
+def bench_drain(sim, ticks):
+    times = []
+    for _ in range(ticks):
+        buf = IngestBuffer(len(sim) + 1, "drop_oldest")
+        for p in sim.tick():
+            buf.put(p)
+        t0 = time.perf_counter()
+        buf.drain(len(sim))
+        times.append(time.perf_counter() - t0)
+    return result("drain", len(sim), statistics.median(times) * 1e3, "ms/tick", "lower")
+
+
+def _store(sim):
+    return TelemetryStore(capacity=max(200_000, 4 * len(sim)), max_batch=len(sim), backend=None)
+
+
+def bench_ingest(sim, ticks):
+    store = _store(sim)
+    batches = [sim.tick() for _ in range(ticks + 1)]
+    store.ingest(batches[0])  # warm-up: first sight of every node (codes, array growth)
+    t0 = time.perf_counter()
+    for b in batches[1:]:
+        store.ingest(b)
+    return result("ingest", len(sim), len(sim) * ticks / (time.perf_counter() - t0), "rows/s", "higher")
+
+
+def bench_memory(sim, ticks):
+    batches = [sim.tick() for _ in range(ticks)]
+    gc.collect()
+    tracemalloc.start()
+    try:
+        store = _store(sim)
+        base = tracemalloc.get_traced_memory()[0]
+        for b in batches:
+            store.ingest(b)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return [result("memory", len(sim), current / 2**20, "MiB", "lower"),
+            result("memory_growth", len(sim), (current - base) / len(sim), "B/node", "lower"),
+            result("memory_peak", len(sim), peak / 2**20, "MiB", "lower")]
+
+
+def bench_pages(nodes, repeat):
+    """One subprocess per fleet size; the child prints its results as JSON."""
+    proc = subprocess.run([sys.executable, "-m", "luminode.bench", "--pages-child", str(nodes), "--repeat", str(repeat)],
+                          capture_output=True, text=True, cwd=os.path.dirname(APP))
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        return []
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _pages_child(nodes, repeat):
+    os.environ.update({"LUMINODE_INGEST": "sim", "LUMINODE_SIM_NODES": str(nodes), "LUMINODE_SIM_SPEED": "1",
+                       "LUMINODE_SIM_BACKFILL": "12"})
+    import streamlit_option_menu
+    from streamlit.testing.v1 import AppTest
+
+    page = {"name": PAGES[0]}
+    # the sidebar menu is a custom component AppTest cannot click: pick the page directly
+    streamlit_option_menu.option_menu = lambda *a, **k: page["name"]
+    at = AppTest.from_file(APP, default_timeout=600)
+    at.run()
+    deadline = time.monotonic() + 600
+    while METRICS.counters.get("rows", 0) < nodes * 12 and time.monotonic() < deadline:
+        time.sleep(0.2)
+    out = []
+    for name in PAGES:
+        page["name"] = name
+        at.run()  # first visit builds the page's figures
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            at.run()
+            times.append(time.perf_counter() - t0)
+        failed = [e.value for e in at.exception]
+        out.append(result(f"page:{name}", nodes, statistics.median(times) * 1e3, "ms", "lower"))
+        if failed:
+            out[-1]["error"] = str(failed[0])[:200]
+    print(json.dumps(out))
+
+
+def compare(results, baseline, tolerance):
+    """Cases that got worse than ``baseline`` by more than ``tolerance`` (a fraction)."""
+    base = {(r["case"], r["nodes"]): r for r in baseline}
+    worse = []
+    for r in results:
+        b = base.get((r["case"], r["nodes"]))
+        if b is None or not b["value"]:
+            continue
+        change = (r["value"] - b["value"]) / b["value"]
+        if (r["better"] == "higher" and change < -tolerance) or (r["better"] == "lower" and change > tolerance):
+            worse.append((r, b, change))
+    return worse
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m luminode.bench", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--nodes", default="1000,10000", help="comma list of fleet sizes, e.g. 1000,10000,100000")
+    p.add_argument("--ticks", type=int, default=5, help="readings per lamp per case")
+    p.add_argument("--cases", default="receive,drain,ingest,memory", help="comma list; add 'pages' for page renders")
+    p.add_argument("--repeat", type=int, default=3, help="timed runs per page")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", help="write the results here")
+    p.add_argument("--baseline", help="results of an earlier run to compare against")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a case counts as worse")
+    p.add_argument("--pages-child", type=int, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    if args.pages_child:
+        return _pages_child(args.pages_child, args.repeat)
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    runners = {"receive": bench_receive, "drain": bench_drain, "ingest": bench_ingest, "memory": bench_memory}
+    results = []
+    for n in (int(s) for s in args.nodes.split(",") if s.strip()):
+        for case in cases:
+            if case == "pages":
+                out = bench_pages(n, args.repeat)
+            else:
+                out = runners[case](FleetSimulator(n, seed=args.seed), args.ticks)
+            for r in out if isinstance(out, list) else [out]:
+                results.append(r)
+                print(f"{r['case']:<22} {r['nodes']:>8,} nodes  {r['value']:>14,.3f} {r['unit']}"
+                      + (f"  ({r['error']})" if "error" in r else ""), flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            worse = compare(results, json.load(f), args.tolerance)
+        for r, b, change in worse:
+            print(f"REGRESSION {r['case']} @ {r['nodes']:,}: {b['value']:,.3f} -> {r['value']:,.3f} {r['unit']} ({change:+.0%})")
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
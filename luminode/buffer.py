@@ -0,0 +1,159 @@
+"""
+Bounded ingest buffer between the MQTT callback and the ingest thread.
+
+Drop-in for the ``queue.Queue`` it replaces (put / get / get_nowait raise
+``queue.Empty`` the same way) but never grows past ``maxsize``. What happens
+when it is full depends on the overload policy:
+
+- ``drop_oldest``: the oldest pending payload makes room for the new one.
+- ``sample``: only every ``sample_every``-th new payload is admitted (evicting
+  the oldest), the rest are dropped.
+- ``coalesce``: overflow is folded into a per-node "latest only" map, so a
+  reconnect storm costs one slot per lamp instead of one per message.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+POLICIES = ("drop_oldest", "sample", "coalesce")
+DRAIN_CHUNK = 4096  # payloads popped per lock acquisition in drain()
+
+
+class IngestBuffer:
+    def __init__(self, maxsize=200_000, policy="coalesce", sample_every=10, key="node_id"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overload policy {policy!r}, expected one of {POLICIES}")
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        self.sample_every = max(1, int(sample_every))
+        self.key = key
+        self._items = deque()
+        self._overflow = {}  # node_id -> newest payload (coalesce policy only)
+        self._cond = threading.Condition(threading.Lock())
+        self._seen_while_full = 0
+        # monotonic time the oldest pending payload arrived (approx.: when the buffer last became non-empty)
+        self._since = None
+        self.last_wait = 0.0  # how long the oldest payload of the last get / drain had waited
+        # counters
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+
+    def qsize(self):
+        return len(self._items) + len(self._overflow)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def put(self, payload, block=False, timeout=None):
+        with self._cond:
+            self.received += 1
+            if self._since is None:
+                self._since = time.monotonic()
+            if self._overflow and isinstance(payload, dict) and payload.get(self.key) in self._overflow:
+                # keep per-node order: once a lamp is coalesced, its newer readings go there too
+                self._overflow[payload[self.key]] = payload
+                self.coalesced += 1
+            elif len(self._items) + len(self._overflow) < self.maxsize:
+                self._items.append(payload)
+            elif self.policy == "drop_oldest":
+                self._items.popleft()
+                self._items.append(payload)
+                self.dropped += 1
+            elif self.policy == "sample":
+                self._seen_while_full += 1
+                if self._seen_while_full % self.sample_every == 0:
+                    self._items.popleft()
+                    self._items.append(payload)
+                self.dropped += 1
+            else:
+                self._coalesce(payload)
+            size = len(self._items) + len(self._overflow)
+            if size > self.high_water:
+                self.high_water = size
+            self._cond.notify()
+
+    def _coalesce(self, payload):
+        nid = payload.get(self.key) if isinstance(payload, dict) else None
+        if nid in self._overflow:
+            self._overflow[nid] = payload
+            self.coalesced += 1
+        elif self._items:
+            # make room for one more lamp: its first overflow reading replaces the oldest queued one
+            self._items.popleft()
+            self._overflow[nid] = payload
+            self.dropped += 1
+        else:
+            self.dropped += 1
+
+    put_nowait = put
+
+    def get(self, block=True, timeout=None):
+        with self._cond:
+            if block and not self._items and not self._overflow:
+                self._cond.wait(timeout)
+            return self._pop()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def _popped(self):
+        now = time.monotonic()
+        if self._since is not None:
+            self.last_wait = now - self._since
+        self._since = now if (self._items or self._overflow) else None
+
+    def _pop(self):
+        if self._items:
+            item = self._items.popleft()
+        elif self._overflow:
+            # coalesced readings are newer than anything that was still queued
+            item = self._overflow.pop(next(iter(self._overflow)))
+        else:
+            raise queue.Empty
+        self._popped()
+        return item
+
+    def drain(self, max_items, max_seconds=None):
+        """
+        Pop up to ``max_items`` payloads, or what ``max_seconds`` allow. Works
+        in chunks of DRAIN_CHUNK so the MQTT callbacks never wait long on the lock.
+        """
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        out = []
+        while len(out) < max_items:
+            with self._cond:
+                items, room = self._items, min(DRAIN_CHUNK, max_items - len(out))
+                if len(items) <= room:
+                    chunk = list(items)
+                    items.clear()
+                else:
+                    chunk = [items.popleft() for _ in range(room)]
+                room -= len(chunk)
+                if room > 0 and self._overflow:
+                    keys = list(islice(self._overflow, room))
+                    chunk.extend(self._overflow.pop(k) for k in keys)
+                if chunk:
+                    self._popped()
+                    if not out:
+                        wait = self.last_wait  # the first chunk holds the oldest payload
+                    else:
+                        self.last_wait = wait
+            out.extend(chunk)
+            if not chunk or (deadline is not None and time.monotonic() > deadline):
+                break
+        return out
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "high_water": self.high_water,
+            "received": self.received,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
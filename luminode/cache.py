@@ -0,0 +1,50 @@
+"""
+Bounded LRU cache for built figures and computed aggregates.
+
+Entries are keyed by what they show (page, node filter, period, chart name)
+and stamped with the data version they were built from. A lookup with a
+newer version rebuilds and replaces the stale entry in place, so superseded
+versions never pile up; the least recently used keys are dropped beyond
+``maxsize``.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = int(maxsize)
+        self._data = OrderedDict()  # key -> (version, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, version):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or hit[0] != version:
+                self.misses += 1
+                return None, False
+            self._data.move_to_end(key)
+            self.hits += 1
+            return hit[1], True
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._data[key] = (version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_build(self, key, version, build):
+        value, ok = self.get(key, version)
+        if not ok:
+            # built outside the lock: two sessions may race on a miss, both results are valid
+            value = build()
+            self.put(key, version, value)
+        return value
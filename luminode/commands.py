@@ -0,0 +1,243 @@
+"""
+Control-command pipeline between the Control Center and the broker.
+
+- Debounce: ``submit`` only records the wish; a node's command goes out once
+  its widgets have been quiet for ``debounce_s`` (a dragged slider sends one
+  message, not one per rerun).
+- Coalesce: pending fields per node are merged, newer values win; a group
+  command drops the same fields from pending single-node commands, and a
+  newer command stops retries of older ones it supersedes.
+- Batch: nodes that end up with identical fields share one message
+  (``"node_ids": [...]``, up to ``batch_size`` per message), and publishing
+  is capped at ``max_rate`` messages per second.
+- Ack: devices answer on ``<topic>/ack`` with ``{"cmd_id", "node_id"}`` (or
+  ``"node_ids"``); unacked nodes are re-sent after ``ack_timeout_s`` up to
+  ``max_retries`` times, then marked failed.
+
+Single-node messages keep the old shape (``{"node_id", ...fields}``) plus a
+``cmd_id``.
+"""
+import itertools
+import json
+import logging
+import threading
+import time
+
+PENDING, SENT, ACKED, FAILED = "pending", "sent", "acked", "failed"
+TICK_S = 0.1
+
+log = logging.getLogger("luminode.commands")
+
+
+class Command:
+    __slots__ = ("cmd_id", "fields", "unacked", "attempts", "sent_at", "to_send")
+
+    def __init__(self, cmd_id, fields, nodes):
+        self.cmd_id = cmd_id
+        self.fields = fields
+        self.unacked = set(nodes)
+        self.attempts = 0
+        self.sent_at = 0.0
+        self.to_send = []  # nodes of the current attempt not published yet
+
+
+class CommandPipeline:
+    def __init__(self, publish, topic, debounce_s=0.5, ack_timeout_s=5.0, max_retries=3,
+                 batch_size=500, max_rate=100.0, qos=1):
+        """``publish(topic, payload, qos)`` is e.g. ``client.publish``; ``ack_timeout_s=0`` disables ack tracking."""
+        self.publish = publish
+        self.topic = topic
+        self.ack_topic = topic + "/ack"
+        self.debounce_s = debounce_s
+        self.ack_timeout_s = ack_timeout_s
+        self.max_retries = max_retries
+        self.batch_size = max(1, int(batch_size))
+        self.max_rate = float(max_rate)
+        self.qos = qos
+        self._pending = {}   # node -> [fields, due]
+        self._inflight = {}  # cmd_id -> Command
+        self._status = {}    # node -> {"cmd_id", "state", "fields", "at"}
+        self._ids = itertools.count(int(time.time()) * 1000)
+        self._cond = threading.Condition()
+        self._tokens = self.max_rate
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {"submitted": 0, "coalesced": 0, "messages": 0, "retries": 0, "acked": 0, "failed": 0}
+
+    # -----------------------------------------------------
+    # SUBMIT (any session)
+    # -----------------------------------------------------
+    def submit(self, node_id, fields, debounce=True):
+        due = time.monotonic() + (self.debounce_s if debounce else 0.0)
+        with self._cond:
+            self.stats["submitted"] += 1
+            entry = self._pending.get(node_id)
+            if entry is None:
+                self._pending[node_id] = [dict(fields), due]
+            else:
+                self.stats["coalesced"] += 1
+                entry[0].update(fields)
+                entry[1] = due
+            # everything that will go out for the node, not just this call's fields
+            self._status[node_id] = {"cmd_id": None, "state": PENDING, "fields": dict(self._pending[node_id][0]),
+                                     "at": time.time()}
+            self._cond.notify()
+
+    def submit_group(self, node_ids, fields):
+        """Same fields for many nodes, sent right away as batched messages."""
+        nodes = list(dict.fromkeys(node_ids))
+        if not nodes:
+            return None
+        fields = dict(fields)
+        with self._cond:
+            self.stats["submitted"] += 1
+            for n in nodes:
+                entry = self._pending.get(n)
+                if entry is not None:
+                    # the group command supersedes these fields of a pending single-node command
+                    for k in fields:
+                        entry[0].pop(k, None)
+                    if not entry[0]:
+                        del self._pending[n]
+                    self.stats["coalesced"] += 1
+            cmd = Command(next(self._ids), fields, nodes)
+            self._supersede(cmd)
+            self._inflight[cmd.cmd_id] = cmd
+            now = time.time()
+            for n in nodes:
+                self._status[n] = {"cmd_id": cmd.cmd_id, "state": PENDING, "fields": fields, "at": now}
+            self._cond.notify()
+            return cmd.cmd_id
+
+    def on_ack(self, payload):
+        """Handle a raw or decoded ack message."""
+        if isinstance(payload, (bytes, str)):
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                return
+        if not isinstance(payload, dict):
+            return
+        nodes = payload.get("node_ids") or [payload.get("node_id")]
+        with self._cond:
+            cmd = self._inflight.get(payload.get("cmd_id"))
+            if cmd is None:
+                return
+            acked = [n for n in nodes if n in cmd.unacked]
+            cmd.unacked.difference_update(acked)
+            self.stats["acked"] += len(acked)
+            self._mark(cmd, acked, ACKED, time.time())
+            if not cmd.unacked:
+                del self._inflight[cmd.cmd_id]
+
+    # -----------------------------------------------------
+    # READ
+    # -----------------------------------------------------
+    def status(self, node_id):
+        return self._status.get(node_id)
+
+    def summary(self):
+        with self._cond:
+            out = dict(self.stats)
+            out["pending"] = len(self._pending)
+            out["awaiting_ack"] = sum(len(c.unacked) for c in self._inflight.values() if c.attempts) \
+                if self.ack_timeout_s else 0
+            return out
+
+    # -----------------------------------------------------
+    # SEND LOOP
+    # -----------------------------------------------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="luminode-commands", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _supersede(self, cmd):
+        # older commands whose fields are all overridden stop retrying for these nodes
+        keys = set(cmd.fields)
+        for old in list(self._inflight.values()):
+            if old.unacked and set(old.fields) <= keys:
+                old.unacked -= cmd.unacked
+                if not old.unacked:
+                    del self._inflight[old.cmd_id]
+
+    def _collect_due(self, now):
+        due = [n for n, (_, t) in self._pending.items() if t <= now]
+        groups = {}
+        for n in due:
+            fields = self._pending.pop(n)[0]
+            groups.setdefault(json.dumps(fields, sort_keys=True), (fields, []))[1].append(n)
+        for fields, nodes in groups.values():
+            cmd = Command(next(self._ids), fields, nodes)
+            self._supersede(cmd)
+            self._inflight[cmd.cmd_id] = cmd
+            for n in nodes:
+                self._status[n] = {"cmd_id": cmd.cmd_id, "state": PENDING, "fields": fields, "at": time.time()}
+
+    def _mark(self, cmd, nodes, state, now):
+        for n in nodes:
+            st = self._status.get(n)
+            if st is not None and st["cmd_id"] == cmd.cmd_id:
+                st.update(state=state, at=now)
+
+    def _send(self, cmd, now):
+        """Publish the rest of the current attempt in chunks until the rate budget runs out."""
+        while cmd.to_send and self._tokens >= 1:
+            chunk = [n for n in cmd.to_send[:self.batch_size] if n in cmd.unacked]
+            if chunk:
+                if len(chunk) == 1:
+                    msg = {"cmd_id": cmd.cmd_id, "node_id": chunk[0], **cmd.fields}
+                else:
+                    msg = {"cmd_id": cmd.cmd_id, "node_ids": chunk, **cmd.fields}
+                try:
+                    info = self.publish(self.topic, json.dumps(msg), self.qos)
+                except Exception:
+                    return
+                if getattr(info, "rc", 0) != 0:
+                    return  # not connected: try again next tick
+                self._tokens -= 1
+                self.stats["messages"] += 1
+                self._mark(cmd, chunk, SENT, now)
+            del cmd.to_send[:self.batch_size]
+            cmd.sent_at = now
+
+    def _tick(self):
+        now_m, now = time.monotonic(), time.time()
+        with self._cond:
+            self._collect_due(now_m)
+            for cmd in list(self._inflight.values()):
+                if not cmd.to_send:
+                    if cmd.attempts and not self.ack_timeout_s:
+                        del self._inflight[cmd.cmd_id]  # fire-and-forget
+                        continue
+                    if cmd.attempts and now - cmd.sent_at < self.ack_timeout_s:
+                        continue
+                    if cmd.attempts > self.max_retries:
+                        self._mark(cmd, cmd.unacked, FAILED, now)
+                        self.stats["failed"] += len(cmd.unacked)
+                        del self._inflight[cmd.cmd_id]
+                        continue
+                    if cmd.attempts:
+                        self.stats["retries"] += 1
+                    cmd.attempts += 1
+                    cmd.to_send = sorted(cmd.unacked)
+                self._send(cmd, now)
+                if self._tokens < 1:
+                    break  # out of budget: the rest goes out next tick
+
+    def _run(self):
+        last = time.monotonic()
+        while not self._stop.is_set():
+            with self._cond:
+                self._cond.wait(TICK_S)
+            now = time.monotonic()
+            self._tokens = min(self.max_rate, self._tokens + (now - last) * self.max_rate)
+            last = now
+            try:
+                self._tick()
+            except Exception:
+                log.exception("command tick failed")
@@ -0,0 +1,180 @@
+"""
+Message decoding for the MQTT network thread.
+
+- JSON goes through orjson when it is installed, else the stdlib.
+- Timestamps in the device format are parsed by slicing (no strptime) and
+  memoized, since a burst carries the same second many times over.
+- Topics can be mapped to a compact binary codec: a fixed ``struct`` record
+  or MessagePack (when ``msgpack`` is installed).
+- ``validate`` rejects malformed payloads with plain type checks, so bad
+  messages cost a few isinstance calls instead of a raised exception; only
+  numeric fields sent as strings are test-parsed.
+- A timestamp string that does not parse is a rejection ("timestamp"), not
+  a silent fallback to the receive time. A missing timestamp still means
+  "now".
+"""
+import json
+import struct
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # optional fast path
+    orjson = None
+    _loads = json.loads
+
+try:
+    import msgpack
+except ImportError:  # optional codec
+    msgpack = None
+
+NUMERIC_FIELDS = ("voltage", "current", "power", "lux", "energy_total", "lat", "lng")
+
+# fixed binary record: node_id, epoch seconds, V, I, P, lux, kWh meter, status, lat, lng
+STRUCT_FORMAT = "<16sdffffdBdd"
+_STRUCT = struct.Struct(STRUCT_FORMAT)
+STRUCT_SIZE = _STRUCT.size
+
+# per-topic codec lookups kept by a Decoder (per-node topics can be unbounded)
+MAX_TOPICS = 4096
+
+
+@lru_cache(maxsize=8192)
+def parse_timestamp(s):
+    """'YYYY-MM-DD HH:MM:SS' by slicing, ISO-8601 as fallback; None if neither fits."""
+    if len(s) == 19 and s[4] == "-" and s[7] == "-" and s[10] in " T" and s[13] == ":" and s[16] == ":":
+        d = s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] + s[17:19]
+        if d.isdigit():
+            try:
+                return datetime(int(d[0:4]), int(d[4:6]), int(d[6:8]), int(d[8:10]), int(d[10:12]), int(d[12:14]))
+            except ValueError:  # e.g. month 13
+                return None
+    try:
+        ts = datetime.fromisoformat(s)
+    except ValueError:
+        return None
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def _is_number(s):
+    try:
+        float(s)
+    except ValueError:
+        return False
+    return True
+
+
+def validate(payload):
+    """Reason string if ``payload`` is malformed, else None."""
+    if not isinstance(payload, dict):
+        return "not_object"
+    nid = payload.get("node_id")
+    if not nid or not isinstance(nid, (str, int)) or isinstance(nid, bool):
+        return "node_id"
+    for f in NUMERIC_FIELDS:
+        v = payload.get(f)
+        if v is None or isinstance(v, (int, float)):
+            continue
+        if not isinstance(v, str) or not _is_number(v):
+            return f
+    status = payload.get("status")
+    if status is not None and not isinstance(status, str):
+        return "status"
+    return None
+
+
+def encode_struct(payload):
+    """Pack a payload dict into the fixed binary record (used by devices / the simulator)."""
+    ts = payload.get("timestamp")
+    if isinstance(ts, str):
+        ts = parse_timestamp(ts)
+    epoch = ts.timestamp() if isinstance(ts, datetime) else float(ts or 0)
+    return _STRUCT.pack(
+        str(payload.get("node_id", "")).encode("utf-8")[:16], epoch,
+        *(float(payload.get(f, 0) or 0) for f in ("voltage", "current", "power", "lux", "energy_total")),
+        1 if payload.get("status") == "ON" else 0,
+        float(payload.get("lat", 0) or 0), float(payload.get("lng", 0) or 0),
+    )
+
+
+def _decode_struct(raw):
+    if len(raw) != STRUCT_SIZE:
+        return None
+    nid, epoch, v, i, p, lux, kwh, status, lat, lng = _STRUCT.unpack(raw)
+    return {
+        "node_id": nid.rstrip(b"\0").decode("utf-8", "replace"),
+        "timestamp": datetime.fromtimestamp(epoch) if epoch > 0 else None,
+        "voltage": v, "current": i, "power": p, "lux": lux, "energy_total": kwh,
+        "status": "ON" if status else "OFF", "lat": lat, "lng": lng,
+    }
+
+
+def _decode_json(raw):
+    try:
+        return _loads(raw)
+    except ValueError:  # json.JSONDecodeError and orjson.JSONDecodeError both subclass it
+        return None
+
+
+def _decode_msgpack(raw):
+    try:
+        return msgpack.unpackb(raw, raw=False)
+    except Exception:
+        return None
+
+
+CODECS = {"json": _decode_json, "struct": _decode_struct}
+if msgpack is not None:
+    CODECS["msgpack"] = _decode_msgpack
+
+
+def topic_matches(sub, topic):
+    """MQTT filter match with '+' and '#' wildcards."""
+    s, t = sub.split("/"), topic.split("/")
+    for i, part in enumerate(s):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(s) == len(t)
+
+
+class Decoder:
+    def __init__(self, topic_codecs=None, default="json"):
+        """``topic_codecs`` maps MQTT topic filters to codec names ("json", "struct", "msgpack")."""
+        self.topic_codecs = {k: v for k, v in (topic_codecs or {}).items() if v in CODECS}
+        self.default = default
+        self._by_topic = {}
+        self.decoded = 0
+        self.rejected = {}
+
+    def codec_for(self, topic):
+        fn = self._by_topic.get(topic)
+        if fn is None:
+            name = next((c for f, c in self.topic_codecs.items() if topic_matches(f, topic)), self.default)
+            if len(self._by_topic) >= MAX_TOPICS:
+                del self._by_topic[next(iter(self._by_topic))]  # oldest first
+            fn = self._by_topic[topic] = CODECS[name]
+        return fn
+
+    def _reject(self, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return None
+
+    def decode(self, topic, raw):
+        payload = self.codec_for(topic)(raw)
+        if payload is None:
+            return self._reject("decode")
+        reason = validate(payload)
+        if reason is not None:
+            return self._reject(reason)
+        ts = payload.get("timestamp")
+        if isinstance(ts, str):
+            ts = parse_timestamp(ts)
+            if ts is None:
+                return self._reject("timestamp")
+        payload["timestamp"] = ts if ts is not None else datetime.now()
+        self.decoded += 1
+        return payload
@@ -0,0 +1,95 @@
+"""
+Shape-preserving downsampling for trend charts.
+
+``lttb`` (Largest-Triangle-Three-Buckets) keeps the visually dominant point
+of every bucket; ``minmax`` keeps each bucket's minimum and maximum so spikes
+and dips always survive. Both return row indices, so callers can slice
+whichever columns they need.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").view(np.int64)
+        return (x - x[0]).astype(np.float64) / 1e9
+    return x.astype(np.float64)
+
+
+def lttb(x, y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.nan_to_num(_as_float(y))
+
+    # n_out - 2 buckets over the points between the first and the last one
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    csx = np.concatenate(([0.0], np.cumsum(x)))
+    csy = np.concatenate(([0.0], np.cumsum(y)))
+    cnt = ends - starts
+    # anchor for bucket i is the average of bucket i + 1 (the last point for the final bucket)
+    avg_x = np.append(((csx[ends] - csx[starts]) / cnt)[1:], x[-1])
+    avg_y = np.append(((csy[ends] - csy[starts]) / cnt)[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        s, e = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i]) * (y[s:e] - ay) - (ax - x[s:e]) * (avg_y[i] - ay))
+        a = s + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax(y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = np.nan_to_num(_as_float(y))
+    size = -(-n // (n_out // 2))  # ceil
+    n_buckets = -(-n // size)      # so every bucket holds at least one real value
+    base = np.arange(n_buckets) * size
+    # pad the tail so the series reshapes into (bucket, size); padding never wins
+    grid = np.full(n_buckets * size, np.inf)
+    grid[:n] = y
+    lo = base + np.argmin(grid.reshape(n_buckets, size), axis=1)
+    grid[n:] = -np.inf
+    hi = base + np.argmax(grid.reshape(n_buckets, size), axis=1)
+    return np.unique(np.concatenate(([0, n - 1], lo, hi)))
+
+
+def pick(x, y, n_out, method="lttb"):
+    return minmax(y, n_out) if method == "minmax" else lttb(x, y, n_out)
+
+
+def downsample_frame(df, x, y, max_points=1000, by=None, method="lttb", max_total=None):
+    """
+    Cap the rows of a long-format frame to ``max_points`` per trace (one trace
+    per value of ``by``). With ``max_total`` the per-trace cap shrinks so that
+    the whole figure stays within that budget.
+    """
+    if df.empty:
+        return df
+    if by is None:
+        idx = pick(df[x].to_numpy(), df[y].to_numpy(), max_points, method)
+        return df.iloc[idx] if len(idx) < len(df) else df
+
+    codes = pd.factorize(df[by])[0] if not isinstance(df[by].dtype, pd.CategoricalDtype) \
+        else df[by].cat.codes.to_numpy()
+    order = np.argsort(codes, kind="stable")
+    groups, first = np.unique(codes[order], return_index=True)
+    cap = max_points if not max_total else max(50, min(max_points, max_total // max(1, len(groups))))
+    if len(df) <= cap:
+        return df
+    xs, ys = df[x].to_numpy(), df[y].to_numpy()
+    keep = []
+    for rows in np.split(order, first[1:]):
+        keep.append(rows[pick(xs[rows], ys[rows], cap, method)] if len(rows) > cap else rows)
+    idx = np.sort(np.concatenate(keep))
+    return df.iloc[idx] if len(idx) < len(df) else df
@@ -0,0 +1,226 @@
+"""
+Incremental energy accounting from cumulative ``energy_total`` meters.
+
+Per node the ledger keeps the last meter reading and its timestamp. Each
+batch is turned into consumption deltas in one vectorized pass (rows grouped
+per node, sorted by time, the first row of a group diffed against the
+carried reading):
+
+- a meter that goes backwards was reset; the new reading is what it
+  counted since the reset,
+- a delta above ``max_kw`` x elapsed time cannot be a lamp (meter swap,
+  corrupted reading) and is dropped,
+- readings older than the carried one are ignored, and timestamps ahead
+  of the local clock are clamped (``clamp_future``) so one bad device clock
+  neither blocks its node nor moves the tiers' rings forward,
+- a delta is spread evenly over the hours between its two readings, so a
+  gap after an outage does not land in a single hour.
+
+The pieces are folded into hourly / daily / monthly tiers (calendar
+buckets, per node and fleet-wide) with ``np.add.at``; the energy of any node
+or period is then a sum over a handful of buckets, the edge buckets
+weighted by how much of them falls inside the period.
+"""
+import threading
+
+import numpy as np
+
+from .liveness import clamp_future, now_ns
+
+HOUR_NS = 3600 * 10**9
+RESET_EPS_KWH = 1e-3     # meter noise below this is not a reset
+SLACK_KWH = 0.01         # tolerance on the max_kw plausibility check
+MAX_SPREAD_H = 24 * 62   # longer gaps: only the newest part is spread
+
+# name, numpy datetime unit, buckets kept
+DEFAULT_TIERS = (
+    ("hourly", "h", 72),    # 3 days
+    ("daily", "D", 62),     # 2 months
+    ("monthly", "M", 25),   # 2 years
+)
+
+
+class EnergyTier:
+    def __init__(self, name, unit, n_buckets, node_capacity=64):
+        self.name = name
+        self.unit = unit
+        self.n_buckets = int(n_buckets)
+        self._bucket_of_slot = np.full(self.n_buckets, -1, dtype=np.int64)
+        self._data = np.zeros((self.n_buckets, node_capacity), dtype=np.float32)
+        self._total = np.zeros(self.n_buckets)  # fleet-wide, float64
+        self.newest = -1
+
+    def bucket(self, ts_ns):
+        return np.asarray(ts_ns, dtype=np.int64).view("datetime64[ns]").astype(f"datetime64[{self.unit}]").astype(np.int64)
+
+    def start_ns(self, buckets):
+        return np.asarray(buckets, dtype=np.int64).astype(f"datetime64[{self.unit}]").astype("datetime64[ns]").astype(np.int64)
+
+    def oldest_ns(self):
+        return int(self.start_ns(self.newest - self.n_buckets + 1)) if self.newest >= 0 else None
+
+    def _ensure_nodes(self, n):
+        cap = self._data.shape[1]
+        if n > cap:
+            grown = np.zeros((self.n_buckets, max(n, 2 * cap)), dtype=np.float32)
+            grown[:, :cap] = self._data
+            self._data = grown
+
+    def add(self, node, ts, kwh):
+        bucket = self.bucket(ts)
+        self.newest = max(self.newest, int(bucket.max()))
+        keep = bucket > self.newest - self.n_buckets
+        if not keep.all():
+            node, bucket, kwh = node[keep], bucket[keep], kwh[keep]
+            if not len(node):
+                return
+        self._ensure_nodes(int(node.max()) + 1)
+        new_buckets = np.unique(bucket)
+        new_slots = new_buckets % self.n_buckets
+        stale = self._bucket_of_slot[new_slots] != new_buckets
+        if stale.any():
+            self._data[new_slots[stale]] = 0
+            self._total[new_slots[stale]] = 0
+            self._bucket_of_slot[new_slots[stale]] = new_buckets[stale]
+        slot = bucket % self.n_buckets
+        np.add.at(self._data, (slot, node), kwh.astype(np.float32))
+        np.add.at(self._total, slot, kwh)
+
+    def kwh(self, start_ns, end_ns=None, code=None):
+        """Energy in [start, end); edge buckets count pro rata."""
+        if self.newest < 0:
+            return 0.0
+        lo = max(int(self.bucket(start_ns)), self.newest - self.n_buckets + 1)
+        hi = self.newest if end_ns is None else int(self.bucket(end_ns))
+        buckets = np.arange(lo, hi + 1, dtype=np.int64)
+        slots = buckets % self.n_buckets
+        live = self._bucket_of_slot[slots] == buckets
+        buckets, slots = buckets[live], slots[live]
+        if not len(buckets):
+            return 0.0
+        b0, b1 = self.start_ns(buckets), self.start_ns(buckets + 1)
+        # the current bucket only holds data up to now: pro-rate over its elapsed part
+        b_end = np.maximum(np.minimum(b1, now_ns()), b0 + 1)
+        top = b_end if end_ns is None else np.minimum(b_end, end_ns)
+        w = np.clip((top - np.maximum(b0, start_ns)) / (b_end - b0), 0.0, 1.0)
+        if code is None:
+            values = self._total[slots]
+        elif 0 <= code < self._data.shape[1]:
+            values = self._data[slots, code].astype(np.float64)
+        else:
+            return 0.0
+        return float((values * w).sum())
+
+
+class EnergyLedger:
+    def __init__(self, tiers=DEFAULT_TIERS, max_kw=2.0):
+        self.tiers = [EnergyTier(*t) for t in tiers]
+        self.max_kw = float(max_kw)  # more than this per lamp is a bad reading, not consumption
+        n = 64
+        self._meter = np.full(n, np.nan)
+        self._ts = np.zeros(n, dtype=np.int64)
+        self.consumed = np.zeros(n)  # kWh since this process started counting
+        self.stats = {"resets": 0, "rejected": 0, "out_of_order": 0}
+        self._lock = threading.Lock()
+
+    def _grow(self, n):
+        cap = len(self._meter)
+        if n <= cap:
+            return
+        size = 2 * n
+
+        def grow(a, fill=0):
+            out = np.full(size, fill, dtype=a.dtype)
+            out[:cap] = a
+            return out
+
+        self._meter, self._ts, self.consumed = grow(self._meter, np.nan), grow(self._ts), grow(self.consumed)
+
+    def update(self, cols, carry=True):
+        """
+        Fold ring columns into the ledger. ``carry=False`` (history replayed
+        from disk) diffs the rows among themselves and leaves the per-node
+        meter state of the live stream alone.
+        """
+        node = np.asarray(cols["node"])
+        if not len(node):
+            return
+        ts = clamp_future(np.asarray(cols["timestamp"]).view(np.int64))
+        meter = np.asarray(cols["energy_total"], dtype=np.float64)
+        order = np.lexsort((ts, node))
+        node, ts, meter = node[order], ts[order], meter[order]
+        with self._lock:
+            self._grow(int(node.max()) + 1)
+            if carry:
+                fresh = ts > self._ts[node]
+                self.stats["out_of_order"] += int((~fresh).sum())
+                node, ts, meter = node[fresh], ts[fresh], meter[fresh]
+                if not len(node):
+                    return
+            first = np.r_[True, node[1:] != node[:-1]]
+            prev_meter = np.r_[np.nan, meter[:-1]]
+            prev_ts = np.r_[0, ts[:-1]]
+            prev_meter[first] = self._meter[node[first]] if carry else np.nan
+            prev_ts[first] = self._ts[node[first]] if carry else 0
+
+            delta = meter - prev_meter
+            valid = ~np.isnan(prev_meter)
+            reset = valid & (delta < -RESET_EPS_KWH)
+            kwh = np.where(reset, meter, delta)
+            hours = (ts - prev_ts) / HOUR_NS
+            bad = valid & (kwh > self.max_kw * hours + SLACK_KWH)
+            use = valid & ~bad & (kwh > 0)
+            self.stats["resets"] += int(reset.sum())
+            self.stats["rejected"] += int(bad.sum())
+
+            if carry:
+                last = np.r_[np.flatnonzero(first)[1:], len(node)] - 1
+                self._meter[node[last]] = meter[last]
+                self._ts[node[last]] = ts[last]
+            if use.any():
+                np.add.at(self.consumed, node[use], kwh[use])
+                self._spread(node[use], prev_ts[use], ts[use], kwh[use])
+
+    def add_deltas(self, node, t0, t1, kwh):
+        """Consumption already diffed elsewhere (``backend.iter_energy_deltas``): ``kwh`` between ``t0`` and ``t1``."""
+        if not len(node):
+            return
+        with self._lock:
+            self._grow(int(node.max()) + 1)
+            np.add.at(self.consumed, node, kwh)
+            self._spread(node, t0, t1, kwh)
+
+    def _spread(self, node, t0, t1, kwh):
+        """Split every delta over the hours between its two readings, pro rata by time."""
+        t0 = np.maximum(t0, t1 - MAX_SPREAD_H * HOUR_NS)
+        h0, h1 = t0 // HOUR_NS, t1 // HOUR_NS
+        k = h1 - h0 + 1
+        rows = np.repeat(np.arange(len(node)), k)
+        h = h0[rows] + (np.arange(len(rows)) - np.repeat(np.cumsum(k) - k, k))
+        seg0 = np.maximum(h * HOUR_NS, t0[rows])
+        seg1 = np.minimum((h + 1) * HOUR_NS, t1[rows])
+        span = (t1 - t0)[rows]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.where(span > 0, (seg1 - seg0) / span, 1.0)
+        piece_node, piece_ts, piece_kwh = node[rows], seg0, kwh[rows] * frac
+        for tier in self.tiers:
+            tier.add(piece_node, piece_ts, piece_kwh)
+
+    # -----------------------------------------------------
+    # READ
+    # -----------------------------------------------------
+    def pick(self, start_ns):
+        """Finest tier that still reaches back to ``start_ns``."""
+        for tier in self.tiers:
+            oldest = tier.oldest_ns()
+            if oldest is None or oldest <= start_ns:
+                return tier
+        return self.tiers[-1]
+
+    def kwh(self, start, end=None, code=None):
+        """(kWh consumed in [start, end), tier used) for one node code or the fleet (``code=None``)."""
+        start_ns = int(np.datetime64(start, "ns").astype(np.int64))
+        end_ns = None if end is None else int(np.datetime64(end, "ns").astype(np.int64))
+        with self._lock:
+            tier = self.pick(start_ns)
+            return tier.kwh(start_ns, end_ns, code), tier.name
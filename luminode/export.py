@@ -0,0 +1,129 @@
+"""
+Chunked telemetry export: ``python -m luminode.export``.
+
+Rows come from ``TelemetryStore.iter_history`` / ``backend.iter_query`` as a
+generator of frames (at most ``chunk_rows`` each), and every writer here
+consumes that generator one chunk at a time: CSV is appended chunk by chunk,
+Parquet gets one row group per chunk. Memory stays flat however long the
+range is. Parquet needs ``pyarrow`` (optional, like ``orjson`` / ``msgpack``
+in decode.py).
+
+The files carry the ring's frame columns (node_id, timestamp, readings,
+fault_code, status) plus each node's last known lat / lng, and can be fed
+back with ``python -m luminode.replay``.
+"""
+import argparse
+import io
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional
+    pa = pq = None
+
+FORMATS = ("csv", "parquet")
+MIME = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+def _plain(df):
+    # categoricals as plain strings: every chunk then has the same schema
+    return df.astype({"node_id": str, "status": str})
+
+
+def csv_chunks(chunks):
+    """CSV text per chunk, header only on the first one (e.g. for a streaming response)."""
+    header = True
+    for df in chunks:
+        if len(df):
+            yield _plain(df).to_csv(index=False, header=header)
+            header = False
+
+
+def write_csv(chunks, out):
+    """Write to a path or text file object; returns the number of rows."""
+    rows = 0
+    f = open(out, "w", encoding="utf-8", newline="") if isinstance(out, (str, os.PathLike)) else out
+    try:
+        for df in chunks:
+            if len(df):
+                _plain(df).to_csv(f, index=False, header=rows == 0)
+                rows += len(df)
+    finally:
+        if f is not out:
+            f.close()
+    return rows
+
+
+def write_parquet(chunks, out):
+    """Write to a path or binary file object, one row group per chunk; returns the number of rows."""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    rows, writer = 0, None
+    try:
+        for df in chunks:
+            if not len(df):
+                continue
+            table = pa.Table.from_pandas(_plain(df), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write(chunks, out, fmt="csv"):
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}, expected one of {FORMATS}")
+    return write_parquet(chunks, out) if fmt == "parquet" else write_csv(chunks, out)
+
+
+def head(chunks, max_rows):
+    """The first ``max_rows`` rows of ``chunks``; the source is not read past them."""
+    left = max_rows
+    if left <= 0:
+        return
+    for df in chunks:
+        yield df.iloc[:left]
+        left -= len(df)
+        if left <= 0:
+            return
+
+
+def to_bytes(chunks, fmt="csv"):
+    """Whole file in memory, for download buttons (cap it with ``head``); use ``write`` for large ranges."""
+    if fmt == "csv":
+        return "".join(csv_chunks(chunks)).encode("utf-8")
+    buf = io.BytesIO()
+    write_parquet(chunks, buf)
+    return buf.getvalue()
+
+
+def main(argv=None):
+    from .persist import SQLiteBackend
+
+    env = os.environ.get
+    p = argparse.ArgumentParser(prog="python -m luminode.export", description=__doc__.strip().splitlines()[0])
+    p.add_argument("out", help="output file; the format follows the extension unless --format is given")
+    p.add_argument("--db", default=env("LUMINODE_DB", "luminode.db"))
+    p.add_argument("--node", default=None, help="one node_id (default: every node)")
+    p.add_argument("--start", default=None, help='e.g. "2024-05-01" or "2024-05-01 18:00"')
+    p.add_argument("--end", default=None, help="exclusive")
+    p.add_argument("--format", choices=FORMATS, default=None)
+    p.add_argument("--chunk-rows", type=int, default=50_000)
+    args = p.parse_args(argv)
+
+    fmt = args.format or ("parquet" if args.out.endswith((".parquet", ".pq")) else "csv")
+    backend = SQLiteBackend(args.db)
+    try:
+        rows = write(backend.iter_query(args.node, args.start, args.end, args.chunk_rows), args.out, fmt)
+    finally:
+        backend.close()
+    print(f"[luminode.export] {rows:,} rows -> {args.out} ({fmt})", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Streaming rule-based fault detection.
+
+Every batch is evaluated in one vectorized pass: rows are grouped per node
+(sorted by time), each rule yields a "set" and a "clear" condition per row,
+and the per-node state machine (hysteresis + debounce) is resolved with
+run-length / forward-fill tricks instead of a Python loop. Per-node state
+(debounce counters, active flags, power baseline, flap score) carries over
+to the next batch.
+
+A rule raises after ``debounce`` consecutive readings meet its set
+condition and clears after ``debounce`` consecutive readings meet its clear
+condition; readings between the two thresholds hold the current state.
+Raise / clear events go to ``FaultLog``; the row's ``fault_code`` becomes
+the code of the first active rule (0 when none).
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+FLAP_TAU_S = 600.0     # flap score decays with this time constant
+DRIFT_ALPHA = 0.05     # EWMA weight for the per-node power baseline
+
+
+class Rule:
+    def __init__(self, name, code, set_when, clear_when, debounce=1, value="power"):
+        """``set_when`` / ``clear_when`` map a context dict of arrays to boolean arrays."""
+        self.name = name
+        self.code = code
+        self.set_when = set_when
+        self.clear_when = clear_when
+        self.debounce = max(1, int(debounce))
+        self.value = value  # context column logged with the event
+
+
+def _drift(c):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.abs(c["power"] - c["baseline"]) / c["baseline"]
+
+
+DEFAULT_RULES = (
+    # fault_code 4 kept from the old inline check: lamp ON but drawing (almost) nothing
+    Rule("lamp_dead", 4, lambda c: c["on"] & (c["power"] < 0.5),
+         lambda c: ~c["on"] | (c["power"] >= 0.5), debounce=1),
+    Rule("over_voltage", 1, lambda c: c["voltage"] > 250,
+         lambda c: c["voltage"] < 245, debounce=3, value="voltage"),
+    Rule("under_voltage", 2, lambda c: (c["voltage"] > 0) & (c["voltage"] < 190),
+         lambda c: c["voltage"] > 195, debounce=3, value="voltage"),
+    Rule("daylight_on", 3, lambda c: c["on"] & (c["lux"] > 500),
+         lambda c: ~c["on"] | (c["lux"] < 400), debounce=5, value="lux"),
+    Rule("power_drift", 5, lambda c: c["on"] & (c["baseline"] > 0) & (_drift(c) > 0.30),
+         lambda c: c["on"] & (_drift(c) < 0.15), debounce=5),
+    Rule("flapping", 6, lambda c: c["flap"] > 6,
+         lambda c: c["flap"] < 2, debounce=1, value="flap"),
+)
+
+
+def select_rules(spec, rules=DEFAULT_RULES):
+    """Rules named in a comma list such as "lamp_dead,over_voltage"; empty means all of them."""
+    names = {s.strip() for s in (spec or "").split(",") if s.strip()}
+    return tuple(r for r in rules if not names or r.name in names)
+
+
+def _runs(b, gstart, carry):
+    """Length of the run of True ending at each row; the first run of a group continues ``carry``."""
+    idx = np.arange(len(b))
+    last_false = np.maximum.accumulate(np.where(~b, idx, -1))
+    return np.where(last_false >= gstart, idx - last_false, carry + idx - gstart + 1)
+
+
+def _ffill_state(raise_at, clear_at, gstart, carry):
+    """State after each row: the latest raise / clear event in the group wins, else ``carry``."""
+    idx = np.arange(len(raise_at))
+    last = np.maximum.accumulate(np.where(raise_at | clear_at, idx, -1))
+    inside = last >= gstart
+    return np.where(inside, raise_at[np.maximum(last, 0)], carry)
+
+
+class FaultLog:
+    """Bounded columnar log of raise / clear events with a per-node index."""
+
+    def __init__(self, capacity=100_000):
+        self.capacity = int(capacity)
+        self._ts = np.zeros(self.capacity, dtype=np.int64)
+        self._node = np.zeros(self.capacity, dtype=np.int32)
+        self._rule = np.zeros(self.capacity, dtype=np.int16)
+        self._raised = np.zeros(self.capacity, dtype=bool)
+        self._value = np.zeros(self.capacity, dtype=np.float32)
+        self.head = 0
+        self._by_node = {}  # code -> absolute positions of its events
+        self._in_order = True  # timestamps never went backwards: time queries can bisect
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    def append(self, ts, node, rule, raised, value):
+        n = len(ts)
+        if not n:
+            return
+        order = np.argsort(ts, kind="stable")
+        ts, node, rule, raised, value = ts[order], node[order], rule[order], raised[order], value[order]
+        with self._lock:
+            if self.head and ts[0] < self._ts[(self.head - 1) % self.capacity]:
+                self._in_order = False
+            pos = self.head + np.arange(n)
+            slots = pos % self.capacity
+            self._ts[slots], self._node[slots], self._rule[slots] = ts, node, rule
+            self._raised[slots], self._value[slots] = raised, value
+            self.head += n
+            oldest = self.head - self.capacity
+            for code, p in zip(node.tolist(), pos.tolist()):
+                lst = self._by_node.setdefault(code, [])
+                lst.append(p)
+                if lst[0] < oldest and len(lst) > 64:
+                    del lst[:np.searchsorted(lst, oldest)]
+
+    def positions(self, since=None, node_code=None):
+        """Absolute positions of the live events newer than ``since`` (optionally one node)."""
+        with self._lock:
+            head = self.head
+            lo = max(0, head - self.capacity)
+            if node_code is not None:
+                pos = np.asarray(self._by_node.get(node_code, ()), dtype=np.int64)
+                pos = pos[pos >= lo]
+            else:
+                pos = np.arange(lo, head, dtype=np.int64)
+            if since is not None and pos.size:
+                t = np.int64(np.datetime64(since, "ns").astype(np.int64))
+                ts = self._ts[pos % self.capacity]
+                pos = pos[np.searchsorted(ts, t):] if self._in_order else pos[ts >= t]
+            return pos
+
+    def frame(self, names, rules, since=None, node_code=None):
+        slots = self.positions(since, node_code) % self.capacity
+        rule_names = {r.code: r.name for r in rules}
+        return pd.DataFrame({
+            "timestamp": self._ts[slots].view("datetime64[ns]"),
+            "node_id": [names[c] if c < len(names) else "?" for c in self._node[slots].tolist()],
+            "fault": [rule_names.get(c, str(c)) for c in self._rule[slots].tolist()],
+            "event": np.where(self._raised[slots], "RAISED", "CLEARED"),
+            "value": self._value[slots],
+        })
+
+
+class FaultEngine:
+    def __init__(self, rules=DEFAULT_RULES, log_capacity=100_000):
+        self.rules = tuple(rules)
+        self.log = FaultLog(log_capacity)
+        n = 64
+        self._active = np.zeros((len(self.rules), n), dtype=bool)
+        self._set_run = np.zeros((len(self.rules), n), dtype=np.int32)
+        self._clear_run = np.zeros((len(self.rules), n), dtype=np.int32)
+        self._last_status = np.full(n, -1, dtype=np.int8)
+        self._flap = np.zeros(n, dtype=np.float64)
+        self._flap_ts = np.zeros(n, dtype=np.int64)
+        self._baseline = np.full(n, np.nan, dtype=np.float64)
+
+    def _grow(self, n):
+        cap = self._last_status.shape[0]
+        if n <= cap:
+            return
+        size = 2 * n
+
+        def grow(a, fill=0):
+            out = np.full(a.shape[:-1] + (size,), fill, dtype=a.dtype)
+            out[..., :cap] = a
+            return out
+
+        self._active, self._set_run, self._clear_run = grow(self._active), grow(self._set_run), grow(self._clear_run)
+        self._last_status = grow(self._last_status, -1)
+        self._flap, self._flap_ts = grow(self._flap), grow(self._flap_ts)
+        self._baseline = grow(self._baseline, np.nan)
+
+    def evaluate(self, cols):
+        """Fault code per row (in the batch's original order); logs raise / clear events."""
+        node_all = np.asarray(cols["node"])
+        n = len(node_all)
+        if not n:
+            return np.zeros(0, dtype=np.int16)
+        self._grow(int(node_all.max()) + 1)
+        ts_all = np.asarray(cols["timestamp"]).view(np.int64)
+        order = np.lexsort((ts_all, node_all))
+        node, ts = node_all[order], ts_all[order]
+        first = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+        sizes = np.diff(np.r_[first, n])
+        gstart = np.repeat(first, sizes)
+        last = np.r_[first[1:], n] - 1
+        is_first = np.zeros(n, dtype=bool)
+        is_first[first] = True
+        gnode = node[first]
+
+        status = np.asarray(cols["status"])[order].astype(np.int8)
+        ctx = {f: np.asarray(cols[f], dtype=np.float64)[order] for f in ("voltage", "current", "power", "lux")}
+        ctx["on"] = status == 1
+        ctx["baseline"] = self._baseline[node]
+
+        # flapping: status changes, on top of the carried score decayed to the group's first reading
+        prev = np.where(is_first, self._last_status[node], np.r_[-1, status[:-1]])
+        flips = ((prev >= 0) & (prev != status)).astype(np.float64)
+        dt = np.maximum(0, ts[first] - self._flap_ts[gnode]) / 1e9
+        carried = self._flap[gnode] * np.exp(-dt / FLAP_TAU_S)
+        csum = np.cumsum(flips)
+        ctx["flap"] = np.repeat(carried - (csum[first] - flips[first]), sizes) + csum
+
+        code = np.zeros(n, dtype=np.int16)
+        ev_rows, ev_rule, ev_raised = [], [], []
+        for r, rule in enumerate(self.rules):
+            set_c = np.asarray(rule.set_when(ctx), dtype=bool)
+            clear_c = np.asarray(rule.clear_when(ctx), dtype=bool) & ~set_c
+            set_run = _runs(set_c, gstart, self._set_run[r, node])
+            clear_run = _runs(clear_c, gstart, self._clear_run[r, node])
+            state = _ffill_state(set_run >= rule.debounce, clear_run >= rule.debounce, gstart,
+                                 self._active[r, node])
+            before = np.where(is_first, self._active[r, node], np.r_[False, state[:-1]])
+            changed = np.flatnonzero(state != before)
+            if changed.size:
+                ev_rows.append(changed)
+                ev_rule.append(np.full(changed.size, rule.code, dtype=np.int16))
+                ev_raised.append(state[changed])
+            code = np.where((code == 0) & state, np.int16(rule.code), code)
+            self._set_run[r, gnode] = set_run[last]
+            self._clear_run[r, gnode] = clear_run[last]
+            self._active[r, gnode] = state[last]
+
+        # carry-over: status, flap score, and the power baseline from healthy ON readings
+        self._last_status[gnode] = status[last]
+        self._flap[gnode] = ctx["flap"][last]
+        self._flap_ts[gnode] = ts[last]
+        good = ctx["on"] & (code == 0)
+        if good.any():
+            g_nodes, inv = np.unique(node[good], return_inverse=True)
+            cnt = np.bincount(inv)
+            mean = np.bincount(inv, weights=ctx["power"][good]) / cnt
+            base = self._baseline[g_nodes]
+            alpha = 1 - (1 - DRIFT_ALPHA) ** cnt
+            self._baseline[g_nodes] = np.where(np.isnan(base), mean, base + alpha * (mean - base))
+
+        if ev_rows:
+            rows = np.concatenate(ev_rows)
+            rule_codes = np.concatenate(ev_rule)
+            values = np.zeros(rows.size, dtype=np.float32)
+            by_code = {rule.code: rule for rule in self.rules}
+            for c in np.unique(rule_codes).tolist():
+                m = rule_codes == c
+                values[m] = ctx[by_code[c].value][rows[m]]
+            self.log.append(ts[rows], node[rows].astype(np.int32), rule_codes, np.concatenate(ev_raised), values)
+
+        out = np.empty(n, dtype=np.int16)
+        out[order] = code
+        return out
+
+    def active(self, code):
+        """Names of the rules currently active for node ``code``."""
+        if not 0 <= code < self._active.shape[1]:
+            return []
+        return [rule.name for r, rule in enumerate(self.rules) if self._active[r, code]]
+
+    def events(self, names, since=None, node_code=None):
+        return self.log.frame(names, self.rules, since, node_code)
@@ -0,0 +1,90 @@
+"""
+Spatial index and zoom-aware clustering for the Asset Map.
+
+Positions are projected once to normalized Web-Mercator coordinates (0..1,
+the same plane map tiles use). At zoom ``z`` the plane is cut into square
+cells of ``CELL_PX`` screen pixels; every cell with nodes in it becomes one
+marker. The node -> cell assignment per zoom level is cached in the index,
+so a redraw only re-counts faults / online nodes with ``np.bincount``.
+``fit_zoom`` coarsens the grid when a zoom level would still produce more
+markers than the browser can handle.
+
+The index itself only depends on positions: the store bumps
+``positions_version`` when a node appears or moves, and the dashboard
+rebuilds the index on that version alone (see ``TelemetryStore.geo_index``).
+"""
+import numpy as np
+
+TILE_PX = 256
+CELL_PX = 60      # cluster cell edge, in screen pixels
+MAX_ZOOM = 20
+
+
+def project(lat, lng):
+    """Web-Mercator x / y in 0..1 (y grows southwards, like tile rows)."""
+    x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    s = np.clip(np.sin(np.radians(np.asarray(lat, dtype=np.float64))), -0.9999, 0.9999)
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * np.pi)
+    return x, y
+
+
+class GeoIndex:
+    def __init__(self, codes, lat, lng):
+        """``codes``: node codes of the positioned nodes; ``lat`` / ``lng``: their coordinates."""
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self._x, self._y = project(self.lat, self.lng)
+        self._cells = {}  # zoom -> (cell of every node, number of cells)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def center(self):
+        if not len(self):
+            return None
+        return {"lat": float(self.lat.mean()), "lon": float(self.lng.mean())}
+
+    def _assign(self, zoom):
+        hit = self._cells.get(zoom)
+        if hit is None:
+            cells_per_side = TILE_PX * 2.0 ** zoom / CELL_PX
+            cx = np.floor(self._x * cells_per_side).astype(np.int64)
+            cy = np.floor(self._y * cells_per_side).astype(np.int64)
+            _, inv = np.unique((cx << 32) | cy, return_inverse=True)
+            hit = self._cells[zoom] = (inv.ravel(), int(inv.max()) + 1 if len(inv) else 0)
+        return hit
+
+    def fit_zoom(self, zoom, max_markers):
+        """Largest clustering zoom <= ``zoom`` that yields at most ``max_markers`` markers."""
+        zoom = int(min(max(zoom, 0), MAX_ZOOM))
+        while zoom > 0 and self._assign(zoom)[1] > max_markers:
+            zoom -= 1
+        return zoom
+
+    def clusters(self, zoom, faulted=None, online=None):
+        """
+        One entry per non-empty cell at ``zoom``: centroid, member count,
+        faulted / online members and, for single-node cells, that node's code
+        (-1 otherwise). ``faulted`` / ``online`` are boolean arrays by node code.
+        """
+        zoom = int(min(max(zoom, 0), MAX_ZOOM))
+        inv, k = self._assign(zoom)
+        count = np.bincount(inv, minlength=k)
+        out = {
+            "lat": np.bincount(inv, weights=self.lat, minlength=k) / np.maximum(count, 1),
+            "lng": np.bincount(inv, weights=self.lng, minlength=k) / np.maximum(count, 1),
+            "count": count,
+        }
+        for key, flags in (("faults", faulted), ("online", online)):
+            member = np.zeros(len(self), dtype=np.float64)
+            if flags is not None:
+                flags = np.asarray(flags, dtype=bool)
+                ok = self.codes < len(flags)
+                member[ok] = flags[self.codes[ok]]
+            out[key] = np.bincount(inv, weights=member, minlength=k).astype(np.int64)
+        single = np.full(k, -1, dtype=np.int64)
+        one = count[inv] == 1
+        single[inv[one]] = self.codes[one]
+        out["code"] = single
+        return out
@@ -0,0 +1,112 @@
+"""
+Batch ingestion: turn a batch of payload dicts drained from the ingest
+buffer (see buffer.py) into ring-buffer columns in one vectorized pass.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .ringbuffer import FLOAT_FIELDS, STATUS_LABELS
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_timestamps(values, now=None):
+    """
+    Vectorized timestamp parsing. The fixed device format is tried first in one
+    C-level pass; only entries that fail fall back to ISO / epoch parsing, and
+    anything unparseable gets the receive time.
+    """
+    raw = pd.Series(values, dtype=object)
+    ts = pd.to_datetime(raw, format=TS_FORMAT, errors="coerce").to_numpy(dtype="datetime64[ns]")
+    missing = np.flatnonzero(np.isnat(ts))
+    if missing.size:
+        now = now or datetime.now()
+        for i in missing:
+            ts[i] = np.datetime64(_parse_one(raw.iat[i], now), "ns")
+    return ts
+
+
+def _parse_one(v, now):
+    try:
+        if isinstance(v, str):
+            d = datetime.fromisoformat(v)
+            return d.astimezone().replace(tzinfo=None) if d.tzinfo else d
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return datetime.fromtimestamp(v)
+    except (ValueError, OverflowError, OSError):
+        pass
+    return now
+
+
+def to_float_array(values):
+    try:
+        arr = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        arr = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+    return np.nan_to_num(arr, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def normalize_batch(payloads, nodes):
+    """
+    Turn a list of payload dicts into ring columns (see ringbuffer.COLUMNS),
+    all but ``fault_code``, which ``FaultEngine.evaluate`` fills in.
+    ``nodes`` is the NodeIndex used to intern node ids.
+    """
+    n = len(payloads)
+    get = dict.get
+    names = [get(p, "node_id", "Unknown") for p in payloads]
+    cols = {
+        "node": nodes.encode(names),
+        "timestamp": parse_timestamps([get(p, "timestamp") for p in payloads]),
+        "status": np.fromiter((get(p, "status") == "ON" for p in payloads), dtype=np.int8, count=n),
+    }
+    for f in FLOAT_FIELDS:
+        cols[f] = to_float_array([get(p, f, 0) for p in payloads])
+    return cols
+
+
+def last_per_node(codes):
+    """Index of the last occurrence of every distinct code in ``codes``."""
+    rev = codes[::-1]
+    uniq, first_in_rev = np.unique(rev, return_index=True)
+    return uniq, len(codes) - 1 - first_in_rev
+
+
+def update_latest(latest, payloads, cols, nodes):
+    """Keep only the newest payload per node in ``latest``."""
+    uniq, idx = last_per_node(cols["node"])
+    ts = cols["timestamp"]
+    fault = cols["fault_code"]
+    for code, i in zip(uniq.tolist(), idx.tolist()):
+        nid = nodes.name(code)
+        p = payloads[i]
+        p["timestamp"] = pd.Timestamp(ts[i]).to_pydatetime()
+        p["fault_code"] = int(fault[i])
+        latest[nid] = p
+
+
+def coordinates(payloads):
+    """lat / lng columns (NaN where a payload has none), for the shared-memory ring."""
+    return {f: pd.to_numeric(pd.Series([p.get(f) for p in payloads], dtype=object),
+                             errors="coerce").to_numpy(dtype=np.float64)
+            for f in ("lat", "lng")}
+
+
+def latest_from_columns(latest, cols, nodes):
+    """``update_latest`` for rows that arrive without payload dicts (shared-memory mode)."""
+    uniq, idx = last_per_node(cols["node"])
+    for code, i in zip(uniq.tolist(), idx.tolist()):
+        nid = nodes.name(code)
+        p = {
+            "node_id": nid,
+            "timestamp": pd.Timestamp(cols["timestamp"][i]).to_pydatetime(),
+            **{f: float(cols[f][i]) for f in FLOAT_FIELDS},
+            "status": STATUS_LABELS[int(cols["status"][i])],
+            "fault_code": int(cols["fault_code"][i]),
+        }
+        for f in ("lat", "lng"):
+            if f in cols and not np.isnan(cols[f][i]):
+                p[f] = float(cols[f][i])
+        latest[nid] = p
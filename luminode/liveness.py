@@ -0,0 +1,138 @@
+"""
+Node liveness: online -> stale -> offline from heartbeat deadlines.
+
+A node's deadlines hang off its newest reading timestamp. Every node has at
+most one entry in a min-heap; a heartbeat only writes ``last`` (vectorized
+per batch), and an entry that pops early because the node reported since is
+pushed back with its new deadline. A tick therefore costs O(expired), not
+O(fleet).
+
+Timestamps are datetime64[ns] as int64, in the same local wall-clock domain
+as the ring buffer.
+"""
+import heapq
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+UNKNOWN, ONLINE, STALE, OFFLINE = 0, 1, 2, 3
+STATE_LABELS = ["unknown", "online", "stale", "offline"]
+MAX_CLOCK_SKEW_S = 60  # device clocks may run this far ahead before their timestamps get clamped
+
+
+def now_ns():
+    return int(np.datetime64(datetime.now(), "ns").astype(np.int64))
+
+
+def clamp_future(ts, now=None, skew_s=MAX_CLOCK_SKEW_S):
+    """
+    ``ts`` (int64 ns) capped at now + ``skew_s``. Bucket rings keep a
+    high-water mark; one reading from 2099 must not move it for good.
+    """
+    now = now_ns() if now is None else now
+    return np.minimum(np.asarray(ts, dtype=np.int64), now + int(skew_s * 1e9))
+
+
+class LivenessIndex:
+    def __init__(self, stale_after_s=60, offline_after_s=300, history=5000):
+        self.stale_ns = int(stale_after_s * 1e9)
+        self.offline_ns = int(max(offline_after_s, stale_after_s) * 1e9)
+        self._last = np.zeros(64, dtype=np.int64)
+        self._state = np.zeros(64, dtype=np.int8)
+        self._armed = np.zeros(64, dtype=bool)  # node has an entry in the heap
+        self._heap = []  # (deadline ns, code, state it leads to)
+        self.transitions = deque(maxlen=history)  # (at ns, code, old state, new state)
+        self._lock = threading.Lock()
+
+    def _grow(self, n):
+        if n <= len(self._last):
+            return
+        size = 2 * n
+
+        def grow(a):
+            out = np.zeros(size, dtype=a.dtype)
+            out[:len(a)] = a
+            return out
+
+        self._last, self._state, self._armed = grow(self._last), grow(self._state), grow(self._armed)
+
+    def heartbeat(self, codes, ts, now=None):
+        """``codes``: distinct node codes of a batch; ``ts``: their newest timestamps (int64 ns)."""
+        if not len(codes):
+            return
+        now = now_ns() if now is None else now
+        with self._lock:
+            self._grow(int(codes.max()) + 1)
+            ts = np.minimum(ts, now)  # a clock running ahead must not keep a lamp alive
+            newer = ts > self._last[codes]
+            codes, ts = codes[newer], ts[newer]
+            self._last[codes] = ts
+            fresh = ts > now - self.stale_ns
+            back = codes[fresh & (self._state[codes] != ONLINE)]
+            if back.size:
+                for c, old in zip(back.tolist(), self._state[back].tolist()):
+                    if old != UNKNOWN:
+                        self.transitions.append((now, c, old, ONLINE))
+                self._state[back] = ONLINE
+            for c in codes[~self._armed[codes]].tolist():
+                heapq.heappush(self._heap, (int(self._last[c]) + self.stale_ns, c, STALE))
+            self._armed[codes] = True
+
+    def tick(self, now=None):
+        """Apply every expired deadline; returns the codes that changed state."""
+        now = now_ns() if now is None else now
+        changed = []
+        with self._lock:
+            heap, last, state = self._heap, self._last, self._state
+            while heap and heap[0][0] <= now:
+                _, c, kind = heapq.heappop(heap)
+                if state[c] == ONLINE:
+                    kind = STALE  # came back since this entry was pushed
+                due = int(last[c]) + (self.stale_ns if kind == STALE else self.offline_ns)
+                if due > now:
+                    heapq.heappush(heap, (due, c, kind))
+                    continue
+                old = int(state[c])
+                if old != kind:
+                    state[c] = kind
+                    if old != UNKNOWN:
+                        self.transitions.append((now, c, old, kind))
+                    changed.append(c)
+                if kind == STALE:
+                    heapq.heappush(heap, (int(last[c]) + self.offline_ns, c, OFFLINE))
+                else:
+                    self._armed[c] = False
+        return np.asarray(changed, dtype=np.int64)
+
+    # -----------------------------------------------------
+    # READ
+    # -----------------------------------------------------
+    def states(self, n):
+        """State code of nodes 0..n-1."""
+        out = np.zeros(n, dtype=np.int8)
+        m = min(n, len(self._state))
+        out[:m] = self._state[:m]
+        return out
+
+    def state_of(self, code):
+        return STATE_LABELS[int(self._state[code])] if 0 <= code < len(self._state) else STATE_LABELS[UNKNOWN]
+
+    def counts(self, mask):
+        """online / stale / offline among the nodes selected by the boolean ``mask``."""
+        s = self.states(len(mask))[mask]
+        return {"online": int((s == ONLINE).sum()), "stale": int((s == STALE).sum()),
+                "offline": int((s == OFFLINE).sum())}
+
+    def events_frame(self, names, since=None, code=None):
+        """Transitions as fault-log rows (timestamp, node_id, status), newest last."""
+        rows = list(self.transitions)
+        lo = int(np.datetime64(since, "ns").astype(np.int64)) if since is not None else None
+        rows = [r for r in rows if (lo is None or r[0] >= lo) and (code is None or r[1] == code)]
+        return pd.DataFrame({
+            "timestamp": np.array([r[0] for r in rows], dtype=np.int64).view("datetime64[ns]"),
+            "node_id": [names[r[1]] if r[1] < len(names) else "?" for r in rows],
+            "status": [STATE_LABELS[r[3]].upper() for r in rows],
+        })
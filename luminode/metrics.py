@@ -0,0 +1,279 @@
+"""
+Hot-path instrumentation: counters, latency histograms, per-node rates.
+
+Histograms use fixed log-spaced buckets (1-2-5 steps from 10 us to 1000 s),
+so ``observe`` is a bisect plus two additions and never allocates; batch
+paths use ``observe_many`` (one ``searchsorted`` + ``bincount``). Quantiles
+are read from the buckets, exact to within one bucket.
+
+Like the shard stats in subscriber.py, nothing on the hot path takes a lock:
+counters are plain ints written mostly by one thread, and a rare lost
+increment under contention is the price for leaving this on in production.
+
+``METRICS`` is the process-wide registry; ``MetricsExporter`` writes its
+snapshot to a file (``.json``, anything else gets Prometheus text format)
+for the monitoring agent to scrape.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+# pipeline stages, in flow order (see the System page)
+STAGES = ("receive", "decode", "queue_wait", "drain", "normalize", "apply", "persist",
+          "e2e_lag", "frame", "figure", "rerun")
+
+BOUNDS = tuple(m * 10.0 ** e for e in range(-5, 3) for m in (1, 2, 5)) + (1000.0,)  # seconds
+_BOUNDS = np.asarray(BOUNDS)
+RATE_ALPHA = 0.2  # EWMA weight of a node's newest inter-batch rate / lag sample
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)  # last bucket: above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def observe_many(self, seconds):
+        seconds = np.asarray(seconds, dtype=np.float64)
+        if not seconds.size:
+            return
+        hits = np.bincount(np.searchsorted(_BOUNDS, seconds), minlength=len(self.counts))
+        for i in np.flatnonzero(hits).tolist():
+            self.counts[i] += int(hits[i])
+        self.count += int(seconds.size)
+        self.sum += float(seconds.sum())
+        self.max = max(self.max, float(seconds.max()))
+
+    def quantile(self, q):
+        """``q`` quantile, interpolated linearly inside the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = BOUNDS[i - 1] if i else 0.0
+                hi = min(BOUNDS[i], self.max) if i < len(BOUNDS) else self.max
+                return lo + max(0.0, hi - lo) * (rank - seen) / c
+            seen += c
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "mean": self.sum / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+                "max": self.max}
+
+
+class _Timer:
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {s: Histogram() for s in STAGES}
+        self._gauges = {}  # name -> callable, evaluated at snapshot time
+        self.started = time.time()
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def hist(self, stage):
+        h = self.histograms.get(stage)
+        if h is None:
+            h = self.histograms.setdefault(stage, Histogram())
+        return h
+
+    def observe(self, stage, seconds):
+        self.hist(stage).observe(seconds)
+
+    def observe_many(self, stage, seconds):
+        self.hist(stage).observe_many(seconds)
+
+    def time(self, stage):
+        """``with METRICS.time("drain"): ...``"""
+        return _Timer(self.hist(stage))
+
+    def gauge(self, name, fn):
+        """Register ``fn()`` as a gauge; re-registering a name replaces it."""
+        self._gauges[name] = fn
+
+    # -----------------------------------------------------
+    # READ / EXPORT
+    # -----------------------------------------------------
+    def gauges(self):
+        out = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                out[name] = float(fn())
+            except Exception:
+                continue
+        return out
+
+    def stages_frame(self):
+        """One row per stage that saw traffic; latencies in milliseconds."""
+        rows = []
+        for stage, h in list(self.histograms.items()):
+            if h.count:
+                s = h.summary()
+                rows.append({"stage": stage, "count": s["count"],
+                             **{k: round(s[k] * 1e3, 3) for k in ("mean", "p50", "p90", "p99", "max")}})
+        return pd.DataFrame(rows, columns=["stage", "count", "mean", "p50", "p90", "p99", "max"])
+
+    def snapshot(self):
+        return {
+            "uptime_s": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": self.gauges(),
+            "stages": {s: h.summary() for s, h in list(self.histograms.items()) if h.count},
+        }
+
+    def to_json(self, nodes=None):
+        snap = self.snapshot()
+        if nodes is not None:
+            snap["nodes"] = nodes.to_dict(orient="records")
+        return json.dumps(snap, default=float)
+
+    def to_text(self, nodes=None):
+        """Prometheus text exposition format."""
+        lines = [f"luminode_uptime_seconds {time.time() - self.started:.3f}"]
+        for name, v in sorted(self.counters.items()):
+            lines.append(f"luminode_{name}_total {v}")
+        for name, v in sorted(self.gauges().items()):
+            lines.append(f"luminode_{name} {v:g}")
+        for stage, h in list(self.histograms.items()):
+            if not h.count:
+                continue
+            metric = "luminode_stage_seconds"
+            cum = 0
+            for bound, c in zip(BOUNDS, h.counts):
+                cum += c
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:g}"}} {cum}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {h.sum:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {h.count}')
+        if nodes is not None:
+            for r in nodes.itertuples(index=False):
+                lines.append(f'luminode_node_msg_per_second{{node="{r.node_id}"}} {r.msg_per_s:g}')
+                lines.append(f'luminode_node_lag_seconds{{node="{r.node_id}"}} {r.lag_s:g}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class NodeRates:
+    """Per-node message count, EWMA message rate and EWMA end-to-end lag."""
+
+    def __init__(self):
+        n = 64
+        self.messages = np.zeros(n, dtype=np.int64)
+        self.rate = np.zeros(n)
+        self.lag = np.zeros(n)
+        self._seen = np.zeros(n)  # time.time() of the node's last batch, 0 = never
+
+    def _grow(self, n):
+        cap = len(self.messages)
+        if n <= cap:
+            return
+        size = 2 * n
+
+        def grow(a):
+            out = np.zeros(size, dtype=a.dtype)
+            out[:cap] = a
+            return out
+
+        self.messages, self.rate, self.lag, self._seen = grow(self.messages), grow(self.rate), grow(self.lag), grow(self._seen)
+
+    def update(self, codes, counts, lag_s, now=None):
+        """``codes``: distinct nodes of a batch; ``counts``: their rows; ``lag_s``: lag of their newest row."""
+        if not len(codes):
+            return
+        now = time.time() if now is None else now
+        self._grow(int(codes.max()) + 1)
+        seen = self._seen[codes]
+        known = seen > 0
+        inst = counts / np.maximum(now - seen, 1e-3)
+        rate = self.rate[codes]
+        self.rate[codes] = np.where(known, np.where(rate > 0, rate + RATE_ALPHA * (inst - rate), inst), 0.0)
+        self.lag[codes] = np.where(known, self.lag[codes] + RATE_ALPHA * (lag_s - self.lag[codes]), lag_s)
+        self.messages[codes] += counts
+        self._seen[codes] = now
+
+    def frame(self, names, now=None):
+        """node_id, messages, msg/s, lag and silence; a silent node's rate decays as 1 / silence."""
+        now = time.time() if now is None else now
+        n = min(len(names), len(self.messages))
+        seen = self._seen[:n]
+        silent = np.where(seen > 0, now - seen, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.minimum(self.rate[:n], np.where(silent > 0, 1.0 / silent, np.inf))
+        return pd.DataFrame({
+            "node_id": list(names[:n]),
+            "messages": self.messages[:n],
+            "msg_per_s": np.nan_to_num(rate).round(3),
+            "lag_s": self.lag[:n].round(3),
+            "silent_s": np.nan_to_num(silent, nan=0.0).round(1),
+        })
+
+
+class MetricsExporter:
+    """Writes ``metrics`` to ``path`` every ``interval_s`` (atomic replace, so a scraper never reads half a file)."""
+
+    def __init__(self, metrics, path, interval_s=10.0, nodes=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval_s = interval_s
+        self.nodes = nodes  # optional callable returning the per-node frame
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self):
+        nodes = self.nodes() if self.nodes is not None else None
+        body = self.metrics.to_json(nodes) if self.path.endswith(".json") else self.metrics.to_text(nodes)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp, self.path)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="luminode-metrics", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.write()
+            except Exception:
+                pass
@@ -0,0 +1,291 @@
+"""
+Durable time-series backends.
+
+The ingest thread hands every normalized batch to ``backend.append``; the
+Analytics page calls ``backend.query`` for windows older than what the
+in-memory ring still holds, and exports page through ``iter_query``. On
+start the store rebuilds its rollups and energy ledger from
+``iter_rollup_cells`` / ``iter_energy_deltas``, aggregated by the database.
+"""
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from .energy import HOUR_NS, RESET_EPS_KWH, SLACK_KWH
+from .ringbuffer import FLOAT_FIELDS, FRAME_COLUMNS, STATUS_LABELS
+from .rollup import FIELDS as ROLLUP_FIELDS
+
+
+class TimeSeriesBackend:
+    """Interface for persistent stores. ``cols`` are ring columns (see ringbuffer.COLUMNS)."""
+
+    def load_nodes(self):
+        """Node names in code order, so a fresh NodeIndex gets the same codes."""
+        return []
+
+    def append(self, cols, nodes):
+        raise NotImplementedError
+
+    def query(self, node_id=None, start=None, end=None):
+        raise NotImplementedError
+
+    def iter_query(self, node_id=None, start=None, end=None, chunk_rows=50_000):
+        """``query`` as a generator of frames of at most ``chunk_rows`` rows (exports)."""
+        df = self.query(node_id, start, end)
+        for i in range(0, len(df), chunk_rows):
+            yield df.iloc[i:i + chunk_rows]
+
+    def iter_rollup_cells(self, width_s, start, end):
+        """
+        (node_id, bucket indices, cells) per node, one row per ``width_s``
+        bucket in [start, end); cells in the fleet layout of rollup.py (count, faults,
+        sum / min / max per field). Optional: without it the store folds raw rows.
+        """
+        raise NotImplementedError
+
+    def iter_energy_deltas(self, start, end, max_kw):
+        """
+        (node_id, t0, t1, kWh) per node: meter deltas in [start, end), with the
+        reset / plausibility rules of energy.py. Optional, like ``iter_rollup_cells``.
+        """
+        raise NotImplementedError
+
+    def prune(self, older_than):
+        pass
+
+    def close(self):
+        pass
+
+
+# =========================================================
+# SQLITE (WAL)
+# =========================================================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    code    INTEGER PRIMARY KEY,
+    node_id TEXT NOT NULL UNIQUE,
+    lat     REAL,  -- last reported position
+    lng     REAL
+);
+-- clustered on (node, ts): a single-node range query reads only that node's pages
+CREATE TABLE IF NOT EXISTS telemetry (
+    node         INTEGER NOT NULL,
+    ts           INTEGER NOT NULL,  -- datetime64[ns] as int64
+    seq          INTEGER NOT NULL,  -- tie-breaker for equal timestamps
+    voltage      REAL,
+    current      REAL,
+    power        REAL,
+    lux          REAL,
+    energy_total REAL,
+    status       INTEGER,
+    fault_code   INTEGER,
+    PRIMARY KEY (node, ts, seq)
+) WITHOUT ROWID;
+-- fleet-wide ranges (exports, Analytics) read in time order without a full scan + sort
+CREATE INDEX IF NOT EXISTS telemetry_ts ON telemetry (ts);
+"""
+
+_VALUE_COLUMNS = ["voltage", "current", "power", "lux", "energy_total", "status", "fault_code"]
+
+
+class SQLiteBackend(TimeSeriesBackend):
+    def __init__(self, path="luminode.db"):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._known_nodes = 0
+        self._seq = time.time_ns()  # unique across restarts without a MAX(seq) scan
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        have = {r[1] for r in conn.execute("PRAGMA table_info(nodes)")}
+        for c in ("lat", "lng"):
+            if c not in have:  # database from before positions were kept
+                conn.execute(f"ALTER TABLE nodes ADD COLUMN {c} REAL")
+        conn.commit()
+        self._positions = {code: (lat, lng) for code, lat, lng in
+                           conn.execute("SELECT code, lat, lng FROM nodes WHERE lat IS NOT NULL")}
+
+    def _conn(self):
+        # one connection per thread: WAL lets readers run while the ingest thread writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_nodes(self):
+        rows = self._conn().execute("SELECT node_id FROM nodes ORDER BY code").fetchall()
+        self._known_nodes = len(rows)
+        return [r[0] for r in rows]
+
+    def append(self, cols, nodes):
+        n = len(cols["node"])
+        if n == 0:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            names = nodes.names
+            seq = np.arange(self._seq, self._seq + n, dtype=np.int64)
+            self._seq += n
+            rows = zip(
+                cols["node"].tolist(),
+                cols["timestamp"].astype(np.int64).tolist(),
+                seq.tolist(),
+                *(np.asarray(cols[c]).tolist() for c in _VALUE_COLUMNS),
+            )
+            with conn:
+                if len(names) > self._known_nodes:
+                    conn.executemany("INSERT OR IGNORE INTO nodes (code, node_id) VALUES (?, ?)",
+                                     [(c, str(names[c])) for c in range(self._known_nodes, len(names))])
+                    self._known_nodes = len(names)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO telemetry (node, ts, seq, voltage, current, power, lux, energy_total, status, fault_code) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                if "lat" in cols:
+                    moved = self._moved(cols)
+                    if moved:
+                        conn.executemany("UPDATE nodes SET lat = ?, lng = ? WHERE code = ?", moved)
+
+    def _moved(self, cols):
+        """(lat, lng, code) of every node whose newest position in ``cols`` differs from the stored one."""
+        lat, lng = np.asarray(cols["lat"]), np.asarray(cols["lng"])
+        ok = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng)))
+        node = np.asarray(cols["node"])[ok]
+        _, last = np.unique(node[::-1], return_index=True)  # newest row per node
+        out = []
+        for i in ok[len(node) - 1 - last].tolist():
+            code, pos = int(cols["node"][i]), (float(lat[i]), float(lng[i]))
+            if self._positions.get(code) != pos:
+                self._positions[code] = pos
+                out.append((*pos, code))
+        return out
+
+    def _select(self, conn, node_id, start, end):
+        """(sql, args) for a range query, or None when ``node_id`` is unknown."""
+        where, args = [], []
+        if node_id is not None:
+            row = conn.execute("SELECT code FROM nodes WHERE node_id = ?", (str(node_id),)).fetchone()
+            if row is None:
+                return None
+            where.append("node = ?")
+            args.append(row[0])
+        if start is not None:
+            where.append("ts >= ?")
+            args.append(_ns(start))
+        if end is not None:
+            where.append("ts < ?")
+            args.append(_ns(end))
+        sql = "SELECT node, ts, " + ", ".join(_VALUE_COLUMNS) + " FROM telemetry"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts" if node_id is None else " ORDER BY node, ts"
+        return sql, args
+
+    def query(self, node_id=None, start=None, end=None):
+        conn = self._conn()
+        names = [r[0] for r in conn.execute("SELECT node_id FROM nodes ORDER BY code").fetchall()]
+        select = self._select(conn, node_id, start, end)
+        if select is None:
+            return _frame([], names)
+        return _frame(conn.execute(*select).fetchall(), names)
+
+    def iter_query(self, node_id=None, start=None, end=None, chunk_rows=50_000):
+        # own connection: a long export must not hold the cursor of the thread's shared one
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            nodes = conn.execute("SELECT node_id, lat, lng FROM nodes ORDER BY code").fetchall()
+            names = [r[0] for r in nodes]
+            lat = np.array([np.nan if r[1] is None else r[1] for r in nodes])
+            lng = np.array([np.nan if r[2] is None else r[2] for r in nodes])
+            select = self._select(conn, node_id, start, end)
+            if select is None:
+                return
+            cur = conn.execute(*select)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                df = _frame(rows, names)
+                codes = df["node_id"].cat.codes.to_numpy()
+                df["lat"], df["lng"] = lat[codes], lng[codes]  # node's last known position
+                yield df
+        finally:
+            conn.close()
+
+    def _per_node(self, sql, args):
+        """(node_id, rows) of ``sql`` (``node = ?`` bound first) for every node, on its own connection."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            for code, node_id in conn.execute("SELECT code, node_id FROM nodes ORDER BY code").fetchall():
+                rows = conn.execute(sql, (code, *args)).fetchall()
+                if rows:
+                    yield node_id, rows
+        finally:
+            conn.close()
+
+    def iter_rollup_cells(self, width_s, start, end):
+        # one node at a time: each query is a PK range and its GROUP BY sorts only that node's rows
+        sql = (f"SELECT ts / {int(width_s) * 1_000_000_000} AS b, COUNT(*), SUM(fault_code != 0), "
+               + ", ".join(f"SUM({f}), MIN({f}), MAX({f})" for f in ROLLUP_FIELDS)
+               + " FROM telemetry WHERE node = ? AND ts >= ? AND ts < ? GROUP BY b")
+        for node_id, rows in self._per_node(sql, (_ns(start), _ns(end))):
+            yield node_id, np.array([r[0] for r in rows], dtype=np.int64), np.array([r[1:] for r in rows], dtype=np.float64)
+
+    def iter_energy_deltas(self, start, end, max_kw):
+        # deltas of consecutive readings; the ones within an hour are summed per hour, the
+        # ones spanning hours (gaps) stay single so the ledger can spread them
+        sql = f"""
+            WITH d AS (
+                SELECT ts, energy_total AS m,
+                       LAG(energy_total) OVER w AS pm, LAG(ts) OVER w AS pts
+                FROM telemetry WHERE node = ? AND ts >= ? AND ts < ?
+                WINDOW w AS (ORDER BY ts, seq)
+            ), k AS (
+                SELECT pts, ts, CASE WHEN m - pm < -{RESET_EPS_KWH} THEN m ELSE m - pm END AS kwh
+                FROM d WHERE pm IS NOT NULL
+            )
+            SELECT MIN(pts), MAX(ts), SUM(kwh) FROM k
+            WHERE kwh > 0 AND kwh <= ? * (ts - pts) / {float(HOUR_NS)} + {SLACK_KWH}
+            GROUP BY CASE WHEN pts / {HOUR_NS} = ts / {HOUR_NS} THEN ts / {HOUR_NS} ELSE -ts END
+        """
+        for node_id, rows in self._per_node(sql, (_ns(start), _ns(end), float(max_kw))):
+            t0, t1, kwh = zip(*rows)
+            yield node_id, np.array(t0, dtype=np.int64), np.array(t1, dtype=np.int64), np.array(kwh, dtype=np.float64)
+
+    def prune(self, older_than):
+        """Drop rows older than ``older_than`` node by node (each delete is a PK range)."""
+        with self._write_lock:
+            conn = self._conn()
+            cutoff = _ns(older_than)
+            with conn:
+                for (code,) in conn.execute("SELECT code FROM nodes").fetchall():
+                    conn.execute("DELETE FROM telemetry WHERE node = ? AND ts < ?", (code, cutoff))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _ns(t):
+    return int(pd.Timestamp(t).value)
+
+
+def _frame(rows, names):
+    """Build a frame with the same columns / dtypes as TelemetryRing.frame()."""
+    cols = list(zip(*rows)) if rows else [()] * (2 + len(_VALUE_COLUMNS))
+    vals = dict(zip(_VALUE_COLUMNS, cols[2:]))
+    data = {
+        "node_id": pd.Categorical.from_codes(np.array(cols[0], dtype=np.int32), categories=names),
+        "timestamp": np.array(cols[1], dtype=np.int64).view("datetime64[ns]"),
+        **{f: np.array(vals[f], dtype=np.float64) for f in FLOAT_FIELDS},
+        "fault_code": np.array(vals["fault_code"], dtype=np.int16),
+        "status": pd.Categorical.from_codes(np.array(vals["status"], dtype=np.int8), categories=STATUS_LABELS),
+    }
+    return pd.DataFrame(data, columns=FRAME_COLUMNS)
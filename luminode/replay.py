@@ -0,0 +1,118 @@
+"""
+Replay a recorded telemetry file: ``python -m luminode.replay``.
+
+Reads a CSV or Parquet file written by export.py chunk by chunk (pandas
+``chunksize`` / pyarrow ``iter_batches``, so memory stays flat), turns every
+row back into a device payload and sends it through a transport from sim.py:
+``PoolTransport`` (in-process, what the dashboard uses with
+``LUMINODE_INGEST=replay``) or ``MQTTTransport`` (a real broker, e.g. for the
+ingestion worker). Either way the rows take the normal receive path: decode,
+buffer, normalize, fault rules, ring, rollups. The dashboard keeps them out
+of its database (``LUMINODE_REPLAY_DB``, in-memory by default); a worker
+fed over MQTT persists whatever it receives, so point it at a scratch
+``--db``.
+
+Rows are paced by their original timestamp gaps divided by ``speed``
+(``speed=0``: flat out). Timestamps are rewritten to replay time (first row
+= now, gaps compressed by ``speed``) so liveness and the live pages behave
+as for a live fleet; ``keep_timestamps`` sends them as recorded, e.g. to
+rebuild history in an empty database. With ``speed=0`` they are always kept.
+fault_code is not sent: the rule engine recomputes it.
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .export import pq
+from .ingest import TS_FORMAT
+from .ringbuffer import FLOAT_FIELDS
+from .sim import MQTTTransport, encode
+
+PAYLOAD_FIELDS = ("node_id", "timestamp", *FLOAT_FIELDS, "status", "lat", "lng")
+
+
+def read_chunks(path, chunk_rows=50_000):
+    """Frames of at most ``chunk_rows`` rows from a CSV or Parquet export."""
+    if str(path).endswith((".parquet", ".pq")):
+        if pq is None:
+            raise RuntimeError("Parquet replay needs pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    with pd.read_csv(path, chunksize=chunk_rows, dtype={"node_id": str, "status": str}) as reader:
+        yield from reader
+
+
+def payloads(df, timestamps):
+    """Device payloads for the rows of ``df``; ``timestamps`` are the strings to send."""
+    cols = [c for c in PAYLOAD_FIELDS if c in df.columns and c != "timestamp"]
+    df = df[cols].astype(object)
+    df = df.where(df.notna(), None)  # NaN is not JSON (orjson rejects it)
+    out = df.to_dict(orient="records")
+    for p, ts in zip(out, timestamps):
+        p["timestamp"] = ts
+    return out
+
+
+def replay(path, transport, topic, speed=1.0, keep_timestamps=False, stop=None, chunk_rows=50_000, codec="json"):
+    """Send every row of ``path`` through ``transport``; returns messages sent (see module doc)."""
+    stop = stop or threading.Event()
+    keep = keep_timestamps or not speed
+    sent, first = 0, None
+    wall0, now0 = time.monotonic(), np.datetime64(datetime.now(), "ns")
+    for df in read_chunks(path, chunk_rows):
+        if stop.is_set():
+            break
+        if not len(df):
+            continue
+        ts = pd.to_datetime(df["timestamp"]).to_numpy(dtype="datetime64[ns]")
+        if first is None:
+            first = ts[0]
+        offset = (ts - first).astype(np.int64) / 1e9  # recorded seconds since the first row
+        if keep:
+            sent_ts = pd.Series(ts).dt.strftime(TS_FORMAT)
+        else:
+            sent_ts = pd.Series(now0 + (offset / speed * 1e9).astype("timedelta64[ns]")).dt.strftime(TS_FORMAT)
+        due = wall0 + offset / speed if speed else None
+        for i, p in enumerate(payloads(df, sent_ts.tolist())):
+            if due is not None:
+                wait = due[i] - time.monotonic()
+                if wait > 0 and stop.wait(wait):
+                    return sent
+            transport.send(topic, encode(p, codec))
+            sent += 1
+    return sent
+
+
+def main(argv=None):
+    env = os.environ.get
+    p = argparse.ArgumentParser(prog="python -m luminode.replay", description=__doc__.strip().splitlines()[0])
+    p.add_argument("file", help="CSV or Parquet file from luminode.export")
+    p.add_argument("--broker", default=env("LUMINODE_BROKER", "localhost"))
+    p.add_argument("--port", type=int, default=int(env("LUMINODE_PORT", 1883)))
+    p.add_argument("--topic", default=env("LUMINODE_TOPIC", "luminode/v4/stream"))
+    p.add_argument("--speed", type=float, default=1.0, help="recorded seconds per wall second; 0 = flat out")
+    p.add_argument("--keep-timestamps", action="store_true", help="send the recorded timestamps unchanged")
+    p.add_argument("--chunk-rows", type=int, default=50_000)
+    args = p.parse_args(argv)
+
+    transport = MQTTTransport(args.broker, args.port)
+    print(f"[luminode.replay] {args.file} -> {args.broker}:{args.port} {args.topic} (x{args.speed:g})", flush=True)
+    t0 = time.monotonic()
+    try:
+        sent = replay(args.file, transport, args.topic, args.speed, args.keep_timestamps, chunk_rows=args.chunk_rows)
+    except KeyboardInterrupt:
+        sent = None
+    finally:
+        transport.close()
+    if sent is not None:
+        print(f"[luminode.replay] {sent:,} messages in {time.monotonic() - t0:.1f}s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Fixed-capacity columnar ring buffer for LumiNode telemetry.
+
+Each column is a NumPy array of length 2 * size and every row is written
+twice (at ``slot`` and ``slot + size``).  Any window of the most recent
+``n <= size`` rows is therefore one contiguous slice, so appends are O(1)
+and snapshots are plain views that pandas can wrap without copying.
+
+``size = capacity + headroom``: readers only ever see the newest ``capacity``
+rows, so a snapshot taken by one thread stays intact until the writer has
+appended another ``headroom`` rows behind it.
+"""
+import numpy as np
+import pandas as pd
+
+FLOAT_FIELDS = ("voltage", "current", "power", "lux", "energy_total")
+STATUS_LABELS = ["OFF", "ON"]
+
+# column name -> dtype of the backing array
+COLUMNS = {
+    "timestamp": "datetime64[ns]",
+    "node": np.int32,
+    "status": np.int8,
+    "fault_code": np.int16,
+    **{f: np.float64 for f in FLOAT_FIELDS},
+}
+
+# column order of the DataFrame snapshots (same as the old history frame)
+FRAME_COLUMNS = ["node_id", "timestamp", "voltage", "current", "power", "lux", "fault_code", "status", "energy_total"]
+
+
+class NodeIndex:
+    """Interns node_id strings into dense integer codes (0, 1, 2, ...)."""
+
+    def __init__(self):
+        self._codes = {}
+        self._names = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._codes
+
+    def code(self, name):
+        c = self._codes.get(name)
+        if c is None:
+            c = len(self._names)
+            self._codes[name] = c
+            self._names.append(name)
+        return c
+
+    def get(self, name, default=-1):
+        return self._codes.get(name, default)
+
+    def encode(self, names):
+        return np.fromiter((self.code(n) for n in names), dtype=np.int32, count=len(names))
+
+    def name(self, code):
+        return self._names[code]
+
+    @property
+    def names(self):
+        return list(self._names)
+
+
+class TelemetryRing:
+    def __init__(self, capacity=200_000, headroom=None, nodes=None):
+        self.capacity = int(capacity)
+        self.headroom = self.capacity // 4 if headroom is None else int(headroom)
+        self._size = self.capacity + self.headroom
+        self.nodes = nodes if nodes is not None else NodeIndex()
+        self._cols = {name: np.zeros(2 * self._size, dtype=dt) for name, dt in COLUMNS.items()}
+        self._head = 0  # total number of rows ever written
+
+    def __len__(self):
+        return min(self._head, self.capacity)
+
+    @property
+    def head(self):
+        """Monotonic row counter; usable as a cheap change marker."""
+        return self._head
+
+    # -----------------------------------------------------
+    # WRITE
+    # -----------------------------------------------------
+    def append_batch(self, columns):
+        """
+        Append many rows at once. ``columns`` maps every name in COLUMNS to an
+        array-like of equal length ("node" holds codes from ``self.nodes``).
+        """
+        n = len(columns["node"])
+        if n == 0:
+            return
+        skip = max(0, n - self._size)  # only the newest `size` rows survive anyway
+        slots = (self._head + skip + np.arange(n - skip)) % self._size
+        for name, col in self._cols.items():
+            values = np.asarray(columns[name])[skip:]
+            col[slots] = values
+            col[slots + self._size] = values
+        self._head += n
+
+    # -----------------------------------------------------
+    # READ
+    # -----------------------------------------------------
+    def _window(self, last=None):
+        head = self._head  # read once: the ingest thread may be appending
+        n = min(head, self.capacity)
+        if last is not None:
+            n = max(0, min(int(last), n))
+        start = (head - n) % self._size
+        return start, start + n
+
+    def column(self, name, last=None):
+        lo, hi = self._window(last)
+        return self._cols[name][lo:hi]
+
+    def node_rows(self, node_id, last=None):
+        """Buffer positions of the rows (among the newest ``last``) that belong to one node."""
+        lo, hi = self._window(last)
+        code = self.nodes.get(node_id)
+        if code < 0:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(self._cols["node"][lo:hi] == code) + lo
+
+    def frame(self, last=None, since=None):
+        """
+        DataFrame snapshot of the newest ``last`` rows. Numeric columns are
+        views over the buffer; node_id / status are categoricals built from the
+        integer codes.
+        """
+        lo, hi = self._window(last)
+        if since is not None:
+            # rows arrive roughly in time order: start at the first one >= since
+            newer = np.flatnonzero(self._cols["timestamp"][lo:hi] >= np.datetime64(since, "ns"))
+            lo = lo + int(newer[0]) if newer.size else hi
+        return self._build_frame(slice(lo, hi))
+
+    def node_frame(self, node_id, last=None):
+        return self._build_frame(self.node_rows(node_id, last))
+
+    def _build_frame(self, index):
+        c = self._cols
+        data = {
+            "node_id": pd.Categorical.from_codes(c["node"][index], categories=self.nodes.names),
+            "timestamp": c["timestamp"][index],
+            **{f: c[f][index] for f in ("voltage", "current", "power", "lux")},
+            "fault_code": c["fault_code"][index],
+            "status": pd.Categorical.from_codes(c["status"][index], categories=STATUS_LABELS),
+            "energy_total": c["energy_total"][index],
+        }
+        return pd.DataFrame(data, columns=FRAME_COLUMNS, copy=False)
+
+
+def columns_from_frame(df):
+    """Inverse of ``TelemetryRing.frame``: ring columns from a snapshot / backend frame."""
+    return {
+        "node": df["node_id"].cat.codes.to_numpy(dtype=np.int32),
+        "timestamp": df["timestamp"].to_numpy(dtype="datetime64[ns]"),
+        "status": df["status"].cat.codes.to_numpy(dtype=np.int8),
+        "fault_code": df["fault_code"].to_numpy(dtype=np.int16),
+        **{f: df[f].to_numpy(dtype=np.float64) for f in FLOAT_FIELDS},
+    }
+
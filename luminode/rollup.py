@@ -0,0 +1,287 @@
+"""
+Incremental multi-resolution rollups.
+
+Every tier is a ring of time buckets. Each bucket holds one fleet-wide cell
+(reading count, fault readings, sum / min / max of each field), updated per
+batch, so a fleet chart over a month reads a few hundred cells and never
+reduces over the nodes.
+
+Per-node cells (count, faults and the sums, i.e. means) exist only in the
+coarse tiers (``node_buckets`` > 0), with their own, shorter retention, and
+only for the nodes that reported in a bucket: a bucket is a sorted array of
+node codes plus one row of cells per code. Memory follows the readings,
+not fleet size x buckets. Per-node views of a window that only a fine tier
+resolves are bucketed from raw rows instead (see ``TelemetryStore.rollup``).
+Timestamps from clocks running ahead are clamped first (``clamp_future``).
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .liveness import clamp_future
+
+FIELDS = ("voltage", "current", "power", "lux")
+
+# fleet cell layout: count, faults, then (sum, min, max) per field
+_COUNT, _FAULTS = 0, 1
+_WIDTH = 2 + 3 * len(FIELDS)
+# node cell layout: count, faults, then sum per field
+_NODE_WIDTH = 2 + len(FIELDS)
+
+
+def _sum(i):
+    return 2 + 3 * i
+
+
+def _min(i):
+    return 3 + 3 * i
+
+
+def _max(i):
+    return 4 + 3 * i
+
+
+# name, bucket width (s), buckets kept, buckets kept per node (0 = fleet only)
+DEFAULT_TIERS = (
+    ("1min", 60, 6 * 60, 0),           # 6 hours
+    ("15min", 15 * 60, 3 * 96, 0),     # 3 days
+    ("1h", 3600, 35 * 24, 8 * 24),     # 35 days, per node 8 days
+    ("1d", 86400, 400, 62),            # ~13 months, per node 2 months
+)
+
+
+class RollupTier:
+    def __init__(self, name, width_s, n_buckets, node_buckets=0):
+        self.name = name
+        self.width_s = int(width_s)
+        self.width_ns = np.int64(self.width_s * 1_000_000_000)
+        self.n_buckets = int(n_buckets)
+        self.node_buckets = int(node_buckets)
+        self._bucket_of_slot = np.full(self.n_buckets, -1, dtype=np.int64)
+        self._fleet = np.zeros((self.n_buckets, _WIDTH))
+        self._reset_fleet(np.arange(self.n_buckets))
+        # per node slot: (sorted node codes, (k, _NODE_WIDTH) cells), None while empty
+        self._node_bucket_of_slot = np.full(self.node_buckets, -1, dtype=np.int64)
+        self._node_cells = [None] * self.node_buckets
+        self.newest = -1  # newest bucket index seen
+
+    @property
+    def span_s(self):
+        return self.width_s * self.n_buckets
+
+    @property
+    def node_span_s(self):
+        return self.width_s * self.node_buckets
+
+    def _reset_fleet(self, slots):
+        self._fleet[slots] = 0
+        for i in range(len(FIELDS)):
+            self._fleet[slots, _min(i)] = np.inf
+            self._fleet[slots, _max(i)] = -np.inf
+
+    def _admit(self, bucket):
+        """(rows inside the retention window, their distinct buckets); claims the buckets' slots."""
+        self.newest = max(self.newest, int(bucket.max()))
+        keep = bucket > self.newest - self.n_buckets
+        new_buckets = np.unique(bucket[keep])
+        new_slots = new_buckets % self.n_buckets
+        stale = self._bucket_of_slot[new_slots] != new_buckets
+        if stale.any():
+            self._reset_fleet(new_slots[stale])
+            self._bucket_of_slot[new_slots[stale]] = new_buckets[stale]
+        return keep, new_buckets
+
+    def update(self, node, ts, values, faults):
+        """``values`` is an (n, len(FIELDS)) array; ``faults`` a boolean array."""
+        bucket = ts.view(np.int64) // self.width_ns
+        keep, new_buckets = self._admit(bucket)
+        if not keep.all():
+            node, bucket, values, faults = node[keep], bucket[keep], values[keep], faults[keep]
+            if not len(node):
+                return
+
+        slot = bucket % self.n_buckets
+        d = self._fleet
+        np.add.at(d[:, _COUNT], slot, 1)
+        np.add.at(d[:, _FAULTS], slot, faults)
+        for i in range(len(FIELDS)):
+            v = values[:, i]
+            np.add.at(d[:, _sum(i)], slot, v)
+            np.minimum.at(d[:, _min(i)], slot, v)
+            np.maximum.at(d[:, _max(i)], slot, v)
+
+        if self.node_buckets:
+            for b in new_buckets[new_buckets > self.newest - self.node_buckets].tolist():
+                rows = bucket == b
+                self._update_nodes(b, node[rows], None, faults[rows], values[rows])
+
+    def fold(self, node, bucket, cells):
+        """
+        Pre-aggregated rows: one fleet-layout cell (count, faults, sum / min /
+        max per field) per (node, bucket index), e.g. from
+        ``backend.iter_rollup_cells``.
+        """
+        if not len(node):
+            return
+        keep, new_buckets = self._admit(bucket)
+        node, bucket, cells = node[keep], bucket[keep], cells[keep]
+        slot = bucket % self.n_buckets
+        d = self._fleet
+        np.add.at(d[:, _COUNT], slot, cells[:, _COUNT])
+        np.add.at(d[:, _FAULTS], slot, cells[:, _FAULTS])
+        for i in range(len(FIELDS)):
+            np.add.at(d[:, _sum(i)], slot, cells[:, _sum(i)])
+            np.minimum.at(d[:, _min(i)], slot, cells[:, _min(i)])
+            np.maximum.at(d[:, _max(i)], slot, cells[:, _max(i)])
+        if self.node_buckets:
+            sums = [_sum(i) for i in range(len(FIELDS))]
+            for b in new_buckets[new_buckets > self.newest - self.node_buckets].tolist():
+                rows = bucket == b
+                self._update_nodes(b, node[rows], cells[rows, _COUNT], cells[rows, _FAULTS], cells[rows][:, sums])
+
+    def _update_nodes(self, b, node, counts, faults, values):
+        """``counts``: readings behind each row (None: one each); ``values``: their sums."""
+        slot = b % self.node_buckets
+        entry = self._node_cells[slot]
+        if entry is None or self._node_bucket_of_slot[slot] != b:
+            entry = (np.zeros(0, dtype=np.int32), np.zeros((0, _NODE_WIDTH), dtype=np.float32))
+            self._node_bucket_of_slot[slot] = b
+        codes, cells = entry
+        seen = np.unique(node)
+        if not np.isin(seen, codes, assume_unique=True).all():
+            # first rows of some nodes in this bucket: insert their cells, keeping the codes sorted
+            merged = np.union1d(codes, seen).astype(np.int32)
+            grown = np.zeros((len(merged), _NODE_WIDTH), dtype=np.float32)
+            grown[np.searchsorted(merged, codes)] = cells
+            codes, cells = merged, grown
+        idx = np.searchsorted(codes, node)
+        k = len(codes)
+        cells[:, _COUNT] += np.bincount(idx, weights=counts, minlength=k)
+        cells[:, _FAULTS] += np.bincount(idx, weights=faults, minlength=k)
+        for i in range(len(FIELDS)):
+            cells[:, 2 + i] += np.bincount(idx, weights=values[:, i], minlength=k)
+        self._node_cells[slot] = (codes, cells)
+
+    def _buckets(self, start, end, n_buckets):
+        lo = int(np.datetime64(start, "ns").astype(np.int64) // self.width_ns)
+        hi = self.newest if end is None else int(np.datetime64(end, "ns").astype(np.int64) // self.width_ns)
+        lo = max(lo, self.newest - n_buckets + 1)
+        return np.arange(lo, hi + 1, dtype=np.int64)
+
+    def _slots(self, start, end=None):
+        """(bucket indices, slots) of the buckets in [start, end) that hold data."""
+        buckets = self._buckets(start, end, self.n_buckets)
+        slots = buckets % self.n_buckets
+        live = self._bucket_of_slot[slots] == buckets
+        return buckets[live], slots[live]
+
+    def _node_slots(self, start, end=None):
+        buckets = self._buckets(start, end, self.node_buckets) if self.node_buckets else np.zeros(0, np.int64)
+        slots = buckets % max(self.node_buckets, 1)
+        live = self._node_bucket_of_slot[slots] == buckets
+        return buckets[live], slots[live]
+
+    def _to_frame(self, buckets, count, faults, sums, mins=None, maxs=None):
+        out = {"timestamp": (buckets * self.width_ns).view("datetime64[ns]"), "count": count, "faults": faults}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for i, f in enumerate(FIELDS):
+                out[f] = sums[:, i] / count
+                out[f + "_min"] = np.full(len(count), np.nan) if mins is None else np.where(count > 0, mins[:, i], np.nan)
+                out[f + "_max"] = np.full(len(count), np.nan) if maxs is None else np.where(count > 0, maxs[:, i], np.nan)
+                out[f + "_sum"] = sums[:, i]
+        return out
+
+    def _node_frame(self, buckets, cells):
+        # per-node cells carry no min / max
+        return self._to_frame(buckets, cells[:, _COUNT], cells[:, _FAULTS], cells[:, 2:])
+
+    def node_frame(self, code, start, end=None):
+        """One row per bucket for a single node; ``f`` columns are means."""
+        buckets, slots = self._node_slots(start, end)
+        keep, rows = [], []
+        if code is not None and code >= 0:
+            for i, s in enumerate(slots.tolist()):
+                codes, cells = self._node_cells[s]
+                j = np.searchsorted(codes, code)
+                if j < len(codes) and codes[j] == code:
+                    keep.append(i)
+                    rows.append(cells[j])
+        cells = np.array(rows, dtype=np.float32).reshape(-1, _NODE_WIDTH)
+        return pd.DataFrame(self._node_frame(buckets[keep], cells))
+
+    def nodes_frame(self, names, start, end=None):
+        """Long format (bucket x node) for every node that reported in the window."""
+        buckets, slots = self._node_slots(start, end)
+        entries = [self._node_cells[s] for s in slots.tolist()]
+        sizes = [len(codes) for codes, _ in entries]
+        codes = np.concatenate([c for c, _ in entries]) if entries else np.zeros(0, np.int32)
+        cells = np.concatenate([c for _, c in entries]) if entries else np.zeros((0, _NODE_WIDTH), np.float32)
+        known = codes < len(names)
+        out = self._node_frame(np.repeat(buckets, sizes)[known], cells[known])
+        out["node_id"] = pd.Categorical.from_codes(codes[known], categories=list(names))
+        return pd.DataFrame(out)
+
+    def fleet_frame(self, start, end=None):
+        """One row per bucket aggregated over all nodes."""
+        buckets, slots = self._slots(start, end)
+        cells = self._fleet[slots]
+        has = cells[:, _COUNT] > 0
+        buckets, cells = buckets[has], cells[has]
+        return pd.DataFrame(self._to_frame(
+            buckets, cells[:, _COUNT], cells[:, _FAULTS], cells[:, [_sum(i) for i in range(len(FIELDS))]],
+            cells[:, [_min(i) for i in range(len(FIELDS))]], cells[:, [_max(i) for i in range(len(FIELDS))]]))
+
+    def frame_from_rows(self, df, per_node=False):
+        """``nodes_frame`` / ``node_frame`` layout bucketed from raw rows (tiers without node cells)."""
+        bucket = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64) // self.width_ns
+        keys = [df["node_id"], bucket] if per_node else [bucket]
+        g = df.assign(faults=df["fault_code"].to_numpy() != 0).groupby(keys, observed=True, sort=True)
+        agg = g.agg(count=("faults", "size"), faults=("faults", "sum"),
+                    **{f"{f}_{op}": (f, op) for f in FIELDS for op in ("sum", "min", "max")})
+        buckets = agg.index.get_level_values(-1).to_numpy(dtype=np.int64)
+        out = self._to_frame(buckets, agg["count"].to_numpy(np.float64), agg["faults"].to_numpy(np.float64),
+                             agg[[f + "_sum" for f in FIELDS]].to_numpy(np.float64),
+                             agg[[f + "_min" for f in FIELDS]].to_numpy(np.float64),
+                             agg[[f + "_max" for f in FIELDS]].to_numpy(np.float64))
+        if per_node:
+            out["node_id"] = agg.index.get_level_values(0)
+        return pd.DataFrame(out)
+
+
+class RollupSet:
+    """All tiers, updated together from ring-buffer columns."""
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = [RollupTier(*t) for t in tiers]
+        self.lock = threading.Lock()
+
+    def update(self, cols):
+        if not len(cols["node"]):
+            return
+        values = np.column_stack([cols[f] for f in FIELDS]).astype(np.float64)
+        faults = (np.asarray(cols["fault_code"]) != 0).astype(np.float64)
+        ts = clamp_future(np.asarray(cols["timestamp"]).view(np.int64)).view("datetime64[ns]")
+        with self.lock:
+            for tier in self.tiers:
+                tier.update(cols["node"], ts, values, faults)
+
+    def fold(self, tier, node, bucket, cells):
+        """``RollupTier.fold`` under the lock."""
+        with self.lock:
+            tier.fold(node, bucket, cells)
+
+    def pick(self, window_s, min_points=48, per_node=False):
+        """
+        Coarsest tier that still gives ``min_points`` buckets and keeps the
+        whole window; ``per_node``: among the tiers with per-node cells.
+        """
+        tiers = [t for t in self.tiers if t.node_buckets] if per_node else self.tiers
+        span = (lambda t: t.node_span_s) if per_node else (lambda t: t.span_s)
+        fits = [t for t in tiers if span(t) >= window_s]
+        if not fits:
+            return tiers[-1]
+        for tier in reversed(fits):
+            if window_s / tier.width_s >= min_points:
+                return tier
+        return fits[0]
@@ -0,0 +1,201 @@
+"""
+Shared-memory ring buffer between the ingestion worker and the dashboard.
+
+The worker (see worker.py) is the only writer: it appends normalized rows and
+then publishes them by bumping ``head`` in the header. Readers attach to the
+same segment read-only and follow ``head`` with their own cursor.
+
+Layout of the segment (one ``SharedMemory`` block):
+
+- header: int64 slots (magic, capacity, headroom, head, node count, ...)
+- one array per column, ``2 * size`` long with every row written twice
+  (same trick as ringbuffer.TelemetryRing), so any window is one slice
+- node-name table: ``max_nodes`` fixed-width UTF-8 slots, indexed by code
+
+Rows are appended in chunks of at most ``headroom``; a reader that copied
+rows while the writer was lapping it detects that from ``head`` and drops
+only the rows that may have been overwritten.
+"""
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .ringbuffer import COLUMNS
+
+# ring columns plus the coordinates the map needs for `latest`
+SHM_COLUMNS = {**COLUMNS, "lat": np.float64, "lng": np.float64}
+NAME_LEN = 64
+
+_MAGIC = 0x4C554D494E4F4445  # "LUMINODE"
+_HEADER = 16
+# header slots
+_H_MAGIC, _H_CAPACITY, _H_HEADROOM, _H_HEAD, _H_NODES, _H_MAX_NODES, _H_GENERATION, _H_HEARTBEAT = range(8)
+
+_created = set()  # blocks created by this process (their tracker registration must stay)
+
+
+def _align(n, to=64):
+    return -(-n // to) * to
+
+
+def _layout(size, max_nodes):
+    """Byte offset of every column and of the name table, plus the total size."""
+    offsets = {}
+    pos = _HEADER * 8
+    for name, dt in SHM_COLUMNS.items():
+        pos = _align(pos)
+        offsets[name] = pos
+        pos += 2 * size * np.dtype(dt).itemsize
+    pos = _align(pos)
+    offsets["_names"] = pos
+    return offsets, pos + max_nodes * NAME_LEN
+
+
+class SharedRing:
+    """Use ``SharedRing.create`` in the writer and ``SharedRing.attach`` in readers."""
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self._hdr = np.ndarray(_HEADER, dtype=np.int64, buffer=shm.buf)
+        if int(self._hdr[_H_MAGIC]) != _MAGIC:
+            raise ValueError(f"shared memory block {shm.name!r} is not a LumiNode ring")
+        self.capacity = int(self._hdr[_H_CAPACITY])
+        self.headroom = int(self._hdr[_H_HEADROOM])
+        self._size = self.capacity + self.headroom
+        self.max_nodes = int(self._hdr[_H_MAX_NODES])
+        self.generation = int(self._hdr[_H_GENERATION])
+        offsets, _ = _layout(self._size, self.max_nodes)
+        self._cols = {
+            name: np.ndarray(2 * self._size, dtype=dt, buffer=shm.buf, offset=offsets[name])
+            for name, dt in SHM_COLUMNS.items()
+        }
+        self._names = np.ndarray((self.max_nodes, NAME_LEN), dtype=np.uint8, buffer=shm.buf, offset=offsets["_names"])
+        if not owner:
+            for a in (*self._cols.values(), self._names):
+                a.flags.writeable = False
+        self._name_cache = []
+
+    @classmethod
+    def create(cls, name, capacity=200_000, headroom=None, max_nodes=65_536):
+        headroom = max(1, capacity // 4) if headroom is None else int(headroom)
+        _, nbytes = _layout(capacity + headroom, max_nodes)
+        try:
+            # a stale block from a worker that died without cleaning up
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+        hdr = np.ndarray(_HEADER, dtype=np.int64, buffer=shm.buf)
+        hdr[:] = 0
+        hdr[_H_CAPACITY] = capacity
+        hdr[_H_HEADROOM] = headroom
+        hdr[_H_MAX_NODES] = max_nodes
+        hdr[_H_GENERATION] = time.time_ns()
+        hdr[_H_MAGIC] = _MAGIC  # last: readers reject a half-initialised block
+        _created.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Read-only view of a ring created by another process; raises FileNotFoundError if absent."""
+        shm = shared_memory.SharedMemory(name=name)
+        if shm.name not in _created:
+            # before 3.13 the resource tracker would unlink the writer's block when this process exits
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        return cls(shm, owner=False)
+
+    def close(self):
+        self._cols = self._names = self._hdr = None
+        self._shm.close()
+        if self.owner:
+            _created.discard(self.name)
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    # -----------------------------------------------------
+    # STATE
+    # -----------------------------------------------------
+    @property
+    def head(self):
+        return int(self._hdr[_H_HEAD])
+
+    @property
+    def heartbeat(self):
+        """Wall-clock ns of the writer's last publish (or keep-alive)."""
+        return int(self._hdr[_H_HEARTBEAT])
+
+    def beat(self):
+        self._hdr[_H_HEARTBEAT] = time.time_ns()
+
+    def node_names(self):
+        """Node names in code order; only the newly published tail is decoded."""
+        n = int(self._hdr[_H_NODES])
+        cache = self._name_cache
+        for code in range(len(cache), n):
+            cache.append(self._names[code].tobytes().rstrip(b"\0").decode("utf-8", "replace"))
+        return cache[:n]
+
+    # -----------------------------------------------------
+    # WRITE (worker only)
+    # -----------------------------------------------------
+    def append_batch(self, columns, names):
+        """
+        ``columns`` maps every name in SHM_COLUMNS to equal-length arrays, "node"
+        holding codes into ``names`` (the writer's NodeIndex names, in code order).
+        """
+        n_nodes = int(self._hdr[_H_NODES])
+        if len(names) > self.max_nodes:
+            raise ValueError(f"more than {self.max_nodes} nodes; recreate the ring with a larger max_nodes")
+        for code in range(n_nodes, len(names)):
+            raw = str(names[code]).encode("utf-8")[:NAME_LEN]
+            self._names[code] = 0
+            self._names[code, :len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+        self._hdr[_H_NODES] = len(names)  # names first: a published row never has an unknown code
+
+        n = len(columns["node"])
+        skip = max(0, n - self.capacity)  # only the newest `capacity` rows could ever be read
+        for lo in range(skip, n, self.headroom):
+            hi = min(n, lo + self.headroom)
+            head = int(self._hdr[_H_HEAD])
+            slots = (head + np.arange(hi - lo)) % self._size
+            for name, col in self._cols.items():
+                values = np.asarray(columns[name])[lo:hi]
+                col[slots] = values
+                col[slots + self._size] = values
+            self._hdr[_H_HEAD] = head + (hi - lo)
+        self.beat()
+
+    # -----------------------------------------------------
+    # READ
+    # -----------------------------------------------------
+    def read(self, cursor, max_rows=None):
+        """
+        Copy the rows published after ``cursor``. Returns (columns, new cursor,
+        number of rows lost because the writer overwrote them first).
+        """
+        head = self.head
+        lost = 0
+        if cursor < head - self.capacity:
+            lost = head - self.capacity - cursor
+            cursor = head - self.capacity
+        n = head - cursor
+        if max_rows is not None:
+            n = min(n, int(max_rows))
+        lo = cursor % self._size
+        cols = {name: col[lo:lo + n].copy() for name, col in self._cols.items()}
+        # rows older than head - capacity may have been rewritten while we were copying
+        torn = min(n, max(0, self.head - self.capacity - cursor))
+        if torn:
+            cols = {name: a[torn:] for name, a in cols.items()}
+            lost += torn
+        return cols, cursor + n, lost
@@ -0,0 +1,262 @@
+"""
+Synthetic LumiNode fleet: ``python -m luminode.sim``.
+
+``FleetSimulator`` keeps per-lamp state in NumPy arrays (position, rated
+power, lux threshold, energy meter, injected fault) and turns one tick into
+one payload per lamp, in the same shape the devices publish. Lamps follow a
+day / night lux curve in AUTO mode; a seeded ``fault_rate`` share of them
+carries one of the faults the rule engine knows (see faults.py), so the
+Analytics and map pages have something to show.
+
+Control commands (the Control Center's ``mode`` / ``command`` /
+``lux_threshold`` / schedule fields) are applied with ``control``; in-process,
+``ControlLoopback`` stands in for the broker's command topic.
+
+Transports:
+
+- ``PoolTransport``: in-process, through ``MQTTPool.deliver`` (decode, stats
+  under its own source label and metrics included), no broker needed. The dashboard uses it with
+  ``LUMINODE_INGEST=sim``.
+- ``MQTTTransport``: a real broker, e.g. a local mosquitto, to load the
+  dashboard or the ingestion worker end to end.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .decode import encode_struct, msgpack
+from .ingest import TS_FORMAT
+
+FAULTS = ("lamp_dead", "over_voltage", "under_voltage", "daylight_on", "power_drift", "flapping")
+RATED_W = (40.0, 60.0, 90.0)
+AUTO, MANUAL, SCHEDULED = 0, 1, 2  # lamp modes, as the Control Center names them below
+MODES = {"AUTO": AUTO, "AUTO (Lux)": AUTO, "MANUAL": MANUAL, "SCHEDULED": SCHEDULED}
+CODEC_SUFFIX = {"json": "", "struct": "/bin", "msgpack": "/msgpack"}
+KM_PER_DEG = 111.32
+
+
+class FleetSimulator:
+    def __init__(self, nodes=1000, seed=0, center=(-8.65, 115.2), radius_km=5.0, fault_rate=0.02,
+                 period_s=5.0, prefix="LN", start=None):
+        n = int(nodes)
+        self.rng = rng = np.random.default_rng(seed)
+        self.period_s = float(period_s)
+        self.clock = start or datetime.now()
+        width = max(5, len(str(n - 1)))
+        self.names = [f"{prefix}-{i:0{width}d}" for i in range(n)]
+        # uniform over a disc around the city centre
+        r = radius_km * np.sqrt(rng.random(n))
+        theta = 2 * np.pi * rng.random(n)
+        self.lat = center[0] + r * np.sin(theta) / KM_PER_DEG
+        self.lng = center[1] + r * np.cos(theta) / (KM_PER_DEG * np.cos(np.radians(center[0])))
+        self.rated = rng.choice(RATED_W, n)
+        self.threshold = rng.normal(300, 30, n)  # AUTO mode: ON below this lux
+        self.shade = rng.uniform(0.6, 1.0, n)    # trees / buildings in front of the lux sensor
+        self.energy = rng.uniform(0, 50, n)      # kWh on the meter
+        self.fault = np.full(n, -1, dtype=np.int8)
+        faulty = rng.random(n) < fault_rate
+        self.fault[faulty] = rng.integers(0, len(FAULTS), int(faulty.sum()))
+        self.mode = np.full(n, AUTO, dtype=np.int8)
+        self.relay = np.zeros(n, dtype=bool)  # MANUAL: switched on
+        self.schedule = np.tile(np.array([18, 6], dtype=np.int8), (n, 1))  # SCHEDULED: on from / until (hour)
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def inject(self, nodes, kind):
+        """Give ``nodes`` (indexes) the fault ``kind`` (a name from FAULTS, or None to clear)."""
+        self.fault[np.asarray(nodes)] = -1 if kind is None else FAULTS.index(kind)
+
+    def control(self, msg):
+        """Apply a command message (``node_id`` or ``node_ids`` plus fields); returns the node ids it reached."""
+        names = msg.get("node_ids") or [msg.get("node_id")]
+        hit = [n for n in names if n in self._index]
+        idx = np.fromiter((self._index[n] for n in hit), dtype=np.int64, count=len(hit))
+        mode = msg.get("mode_update", msg.get("mode"))
+        if mode in MODES:
+            self.mode[idx] = MODES[mode]
+        if msg.get("command") in ("ON", "OFF"):
+            self.relay[idx] = msg["command"] == "ON"
+        if "lux_threshold" in msg:
+            self.threshold[idx] = float(msg["lux_threshold"])
+        for col, key in enumerate(("schedule_start", "schedule_end")):
+            if key in msg:
+                self.schedule[idx, col] = int(str(msg[key]).split(":")[0])
+        return hit
+
+    def _daylight(self, t):
+        h = t.hour + t.minute / 60
+        return max(0.0, np.sin(np.pi * (h - 6) / 12))
+
+    def tick(self, fraction=1.0):
+        """Advance the clock by one period; one payload per lamp (or a random ``fraction`` of them)."""
+        self.clock += timedelta(seconds=self.period_s)
+        rng, n = self.rng, len(self)
+        idx = np.arange(n) if fraction >= 1 else np.flatnonzero(rng.random(n) < fraction)
+        m = len(idx)
+        fault = self.fault[idx]
+
+        lux = np.maximum(0.0, 900 * self._daylight(self.clock) * self.shade[idx] + rng.normal(0, 10, m))
+        mode, (start, end) = self.mode[idx], self.schedule[idx].T
+        h = self.clock.hour
+        scheduled = np.where(start <= end, (start <= h) & (h < end), (h >= start) | (h < end))
+        on = np.select([mode == MANUAL, mode == SCHEDULED], [self.relay[idx], scheduled], lux < self.threshold[idx])
+        voltage = rng.normal(220, 2, m)
+        power = self.rated[idx] * rng.normal(1.0, 0.02, m)
+        # injected faults, same names as the rule engine's
+        voltage[fault == 1] = rng.normal(256, 2, int((fault == 1).sum()))
+        voltage[fault == 2] = rng.normal(184, 2, int((fault == 2).sum()))
+        on[fault == 3] = True
+        on[fault == 5] = rng.random(int((fault == 5).sum())) < 0.5
+        power[fault == 4] *= 1.5
+        power = np.where(on, power, 0.0)
+        power[(fault == 0) & on] = 0.0
+        current = power / voltage
+
+        self.energy[idx] += power * self.period_s / 3.6e6
+        ts = self.clock.strftime(TS_FORMAT)
+        names = self.names
+        return [
+            {"node_id": names[i], "timestamp": ts, "voltage": round(v, 1), "current": round(c, 3),
+             "power": round(p, 1), "lux": round(lx, 1), "status": "ON" if s else "OFF",
+             "energy_total": round(e, 4), "lat": la, "lng": lo}
+            for i, v, c, p, lx, s, e, la, lo in zip(
+                idx.tolist(), voltage.tolist(), current.tolist(), power.tolist(), lux.tolist(), on.tolist(),
+                self.energy[idx].tolist(), self.lat[idx].tolist(), self.lng[idx].tolist())
+        ]
+
+
+def encode(payload, codec="json"):
+    if codec == "struct":
+        return encode_struct(payload)
+    if codec == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("codec 'msgpack' needs the msgpack package")
+        return msgpack.packb(payload)
+    return json.dumps(payload).encode()
+
+
+# =========================================================
+# TRANSPORTS
+# =========================================================
+class PoolTransport:
+    """In-process: straight into an ``MQTTPool``'s receive path, counted under ``source``."""
+
+    def __init__(self, pool, source="sim"):
+        self.pool = pool
+        self.source = source
+
+    def send(self, topic, raw):
+        self.pool.deliver(topic, raw, self.source)
+
+    def close(self):
+        pass
+
+
+class ControlLoopback:
+    """
+    ``publish`` for a ``CommandPipeline`` when the lamps are a ``FleetSimulator``
+    in this process: commands reach the simulator, and with ``ack`` set (e.g.
+    ``pipeline.on_ack``) it acknowledges them like the firmware would.
+    """
+
+    def __init__(self, sim, ack=None):
+        self.sim = sim
+        self.ack = ack
+
+    def publish(self, topic, payload, qos=0):
+        msg = json.loads(payload)
+        hit = self.sim.control(msg)
+        if self.ack is not None and hit:
+            self.ack({"cmd_id": msg.get("cmd_id"), "node_ids": hit})
+
+
+class MQTTTransport:
+    def __init__(self, broker="localhost", port=1883, qos=0):
+        import paho.mqtt.client as mqtt
+
+        self.qos = qos
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"sim_{os.getpid()}")
+        self.client.connect(broker, port, keepalive=60)
+        self.client.loop_start()
+
+    def send(self, topic, raw):
+        self.client.publish(topic, raw, self.qos)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def topic_for(base, codec="json", shards=0, node_index=0):
+    """Device topic: ``<base>[/<shard>]<codec suffix>``, shards named like ``parse_shards("N")``."""
+    if shards:
+        base = f"{base}/{node_index % shards}"
+    return base + CODEC_SUFFIX[codec]
+
+
+def run(sim, transport, topic, codec="json", speed=1.0, backfill=0, duration=None, shards=0, stop=None):
+    """
+    Publish ``backfill`` ticks of history as fast as possible, then one tick
+    per ``period_s / speed`` seconds (``speed=0``: no pacing) until
+    ``duration`` seconds pass or ``stop`` is set. Returns messages sent.
+    """
+    stop = stop or threading.Event()
+    if backfill:
+        sim.clock = datetime.now() - timedelta(seconds=sim.period_s * (backfill + 1))
+    index = {name: i for i, name in enumerate(sim.names)} if shards else None
+    sent, ticks = 0, 0
+    t_end = None if duration is None else time.monotonic() + duration
+    next_at = time.monotonic()
+    while not stop.is_set() and (t_end is None or time.monotonic() < t_end):
+        for p in sim.tick():
+            transport.send(topic_for(topic, codec, shards, index[p["node_id"]] if shards else 0), encode(p, codec))
+            sent += 1
+        ticks += 1
+        if ticks <= backfill or not speed:
+            next_at = time.monotonic()
+            continue
+        next_at += sim.period_s / speed
+        stop.wait(max(0.0, next_at - time.monotonic()))
+    return sent
+
+
+def main(argv=None):
+    env = os.environ.get
+    p = argparse.ArgumentParser(prog="python -m luminode.sim", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--nodes", type=int, default=1000)
+    p.add_argument("--broker", default=env("LUMINODE_BROKER", "localhost"))
+    p.add_argument("--port", type=int, default=int(env("LUMINODE_PORT", 1883)))
+    p.add_argument("--topic", default=env("LUMINODE_TOPIC", "luminode/v4/stream"))
+    p.add_argument("--codec", choices=sorted(CODEC_SUFFIX), default="json")
+    p.add_argument("--shards", type=int, default=0, help="publish on <topic>/<i> for i < shards (worker --shards N)")
+    p.add_argument("--period", type=float, default=5.0, help="seconds of device time per reading")
+    p.add_argument("--speed", type=float, default=1.0, help="device seconds per wall second; 0 = flat out")
+    p.add_argument("--backfill", type=int, default=0, help="ticks of history sent first")
+    p.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    p.add_argument("--fault-rate", type=float, default=0.02)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+
+    sim = FleetSimulator(args.nodes, seed=args.seed, fault_rate=args.fault_rate, period_s=args.period)
+    transport = MQTTTransport(args.broker, args.port)
+    print(f"[luminode.sim] {args.nodes:,} lamps -> {args.broker}:{args.port} {args.topic} ({args.codec})", flush=True)
+    t0 = time.monotonic()
+    try:
+        sent = run(sim, transport, args.topic, args.codec, args.speed, args.backfill, args.duration, args.shards)
+    except KeyboardInterrupt:
+        sent = None
+    finally:
+        transport.close()
+    if sent is not None:
+        print(f"[luminode.sim] {sent:,} messages in {time.monotonic() - t0:.1f}s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""
+Process-wide telemetry store.
+
+One instance per Streamlit server process (see ``get_store`` in
+dashboard_real.py). The MQTT callback only enqueues payloads; a single ingest
+thread drains the queue in batches and updates the ring buffer and ``latest``.
+Sessions never write. They compare versions against what they saw last:
+``version`` moves on every batch, ``node_version(n)`` only when node ``n``
+reported, and ``nodes_version`` only when a new node appears. Liveness
+transitions (see liveness.py) count as a change of the node they concern.
+
+With a ``backend`` (see persist.py) every batch is also written to disk, and
+``history`` falls back to it for windows older than the ring. Rollup tiers
+(see rollup.py) and the energy ledger (see energy.py) are folded in per
+batch and rebuilt from disk on start, in a thread of their own so live
+ingest never waits for it.
+
+In shared-memory mode (``start(shm_name=...)``) the MQTT client, the queue
+and the writes to disk live in the ingestion worker (worker.py); the store
+only follows the worker's ring with a cursor and derives ``latest``, the
+rollups and its own ring from the new rows.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .buffer import IngestBuffer
+from .anomaly import AnomalyDetector
+from .energy import EnergyLedger
+from .faults import DEFAULT_RULES, FaultEngine
+from .geo import GeoIndex
+from .ingest import coordinates, last_per_node, latest_from_columns, normalize_batch, update_latest
+from .liveness import LivenessIndex, ONLINE, now_ns
+from .metrics import METRICS, NodeRates
+from .ringbuffer import TelemetryRing, columns_from_frame
+from .rollup import RollupSet
+from .shm import SharedRing
+
+PRUNE_INTERVAL_S = 3600
+SHM_REATTACH_S = 5.0  # no new rows for this long: check whether the worker was restarted
+LIVENESS_TICK_S = 1.0
+DRAIN_BUDGET_S = 1.0  # a drain stops early after this long, so ticks and flushes keep their pace
+BACKFILL_FOLD_ROWS = 100_000  # rollup cells folded at once while rebuilding from disk
+LATEST_FIELDS = ("power", "energy_total", "fault_code")  # kept column-wise for KPI sums
+POSITION_EPS_DEG = 1e-5  # ~1 m: smaller GPS jitter does not count as a move
+
+log = logging.getLogger("luminode.store")
+
+
+class TelemetryStore:
+    def __init__(self, capacity=200_000, max_batch=100_000, flush_interval=0.2,
+                 backend=None, retention_days=None, buffer_size=200_000, overload_policy="coalesce",
+                 persist=True, stale_after_s=60, offline_after_s=300, fault_rules=DEFAULT_RULES):
+        self.queue = IngestBuffer(buffer_size, overload_policy)
+        self.ring = TelemetryRing(capacity, headroom=max(max_batch, capacity // 4))
+        self.nodes = self.ring.nodes
+        self.backend = backend
+        self.persist = persist  # False when another process (the worker) writes the backend
+        self.retention_days = retention_days
+        if backend is not None:
+            for name in backend.load_nodes():  # keep node codes identical to the ones on disk
+                self.nodes.code(name)
+        self.latest = {}
+        self.rollups = RollupSet()
+        self.liveness = LivenessIndex(stale_after_s, offline_after_s)
+        self.faults = FaultEngine(fault_rules)
+        self.anomaly = AnomalyDetector()
+        self.rates = NodeRates()
+        self.energy = EnergyLedger()
+        self._last_tick = 0.0
+        self.version = 0  # bumped once per ingested batch
+        self.nodes_version = 0  # bumped when the set of known nodes grows
+        self.positions_version = 0  # bumped when a node gets a position or moves
+        self._node_versions = np.zeros(64, dtype=np.int64)
+        # newest value per node code, for vectorized aggregates over `latest`
+        self._reported = np.zeros(64, dtype=bool)
+        self._latest_cols = {f: np.zeros(64, dtype=np.float64) for f in LATEST_FIELDS}
+        self._lat = np.full(64, np.nan)
+        self._lng = np.full(64, np.nan)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.shared = None  # SharedRing being followed, shared-memory mode only
+        self.shm_lost = 0  # rows the worker overwrote before we read them
+        # while the rollup backfill runs: rows older than this (int64 ns) are left to it
+        self._backfill_until = None
+
+    # -----------------------------------------------------
+    # INGEST
+    # -----------------------------------------------------
+    def ingest(self, payloads):
+        if not payloads:
+            return
+        with self._lock:
+            with METRICS.time("normalize"):
+                cols = normalize_batch(payloads, self.nodes)
+                cols.update(coordinates(payloads))  # positions reach the backend like in the worker
+            with METRICS.time("apply"):
+                self._apply(cols, payloads)
+        if self.backend is not None and self.persist:
+            with METRICS.time("persist"):
+                self.backend.append(cols, self.nodes)
+
+    def ingest_columns(self, cols):
+        """Rows that are already normalized (codes from ``self.nodes``), e.g. read from the worker's ring."""
+        if not len(cols["node"]):
+            return
+        with self._lock:
+            with METRICS.time("apply"):
+                self._apply(cols)
+        if self.backend is not None and self.persist:
+            with METRICS.time("persist"):
+                self.backend.append(cols, self.nodes)
+
+    def _apply(self, cols, payloads=None):
+        cols["fault_code"] = self.faults.evaluate(cols)
+        self.ring.append_batch(cols)
+        latest = self.latest
+        codes, counts = np.unique(cols["node"], return_counts=True)
+        grew = any(self.nodes.name(c) not in latest for c in codes.tolist())
+        if grew:
+            # new nodes: swap in a copy so readers iterating the old dict never see it resize
+            latest = dict(latest)
+        if payloads is None:
+            latest_from_columns(latest, cols, self.nodes)
+        else:
+            update_latest(latest, payloads, cols, self.nodes)
+        self.latest = latest
+        folded = cols
+        if self._backfill_until is not None:
+            newer = cols["timestamp"].view(np.int64) >= self._backfill_until
+            if not newer.all():
+                folded = {k: v[newer] for k, v in cols.items()}
+        self.rollups.update(folded)
+        self.energy.update(folded)
+        self.anomaly.update(cols)
+        self.version += 1
+        self._grow_node_arrays(len(self.nodes))
+        self._node_versions[codes] = self.version
+        last_codes, last_idx = last_per_node(cols["node"])
+        for f in LATEST_FIELDS:
+            self._latest_cols[f][last_codes] = cols[f][last_idx]
+        self._reported[last_codes] = True
+        # end-to-end lag: payload timestamp -> applied here
+        ts = cols["timestamp"].view(np.int64)
+        lag = np.maximum(0, now_ns() - ts) / 1e9
+        METRICS.observe_many("e2e_lag", lag)
+        METRICS.inc("rows", len(ts))
+        METRICS.inc("batches")
+        self.rates.update(last_codes, counts, lag[last_idx])
+        if "lat" in cols:
+            self._update_positions(last_codes, cols["lat"][last_idx], cols["lng"][last_idx])
+        self.liveness.heartbeat(last_codes.astype(np.int64), cols["timestamp"][last_idx].view(np.int64))
+        if grew:
+            self.nodes_version += 1
+
+    def _update_positions(self, codes, lat, lng):
+        ok = ~(np.isnan(lat) | np.isnan(lng))
+        codes, lat, lng = codes[ok], lat[ok], lng[ok]
+        old_lat, old_lng = self._lat[codes], self._lng[codes]
+        moved = np.isnan(old_lat) | (np.abs(old_lat - lat) > POSITION_EPS_DEG) | (np.abs(old_lng - lng) > POSITION_EPS_DEG)
+        if moved.any():
+            self._lat[codes[moved]] = lat[moved]
+            self._lng[codes[moved]] = lng[moved]
+            self.positions_version += 1
+
+    def tick_liveness(self):
+        """Expire heartbeat deadlines (at most once per LIVENESS_TICK_S); bumps versions on transitions."""
+        now = time.monotonic()
+        if now - self._last_tick < LIVENESS_TICK_S:
+            return
+        self._last_tick = now
+        changed = self.liveness.tick()
+        if changed.size:
+            with self._lock:
+                self.version += 1
+                self._grow_node_arrays(int(changed.max()) + 1)
+                self._node_versions[changed] = self.version
+
+    def _grow_node_arrays(self, n):
+        if n <= len(self._node_versions):
+            return
+        size = 2 * n
+
+        def grow(a, fill=0):
+            out = np.full(size, fill, dtype=a.dtype)
+            out[:len(a)] = a
+            return out
+
+        self._node_versions = grow(self._node_versions)
+        self._reported = grow(self._reported)
+        self._latest_cols = {f: grow(a) for f, a in self._latest_cols.items()}
+        self._lat, self._lng = grow(self._lat, np.nan), grow(self._lng, np.nan)
+
+    def start(self, shm_name=None):
+        """Drain ``self.queue`` in a thread, or with ``shm_name`` follow the worker's shared ring."""
+        if self._thread is None:
+            if shm_name:
+                self._thread = threading.Thread(target=self._follow, args=(shm_name,),
+                                                name="luminode-follow", daemon=True)
+            else:
+                self._thread = threading.Thread(target=self._run, name="luminode-ingest", daemon=True)
+            self._thread.start()
+        return self
+
+    def _start_backfill(self):
+        """
+        Rebuild the rollups and the energy ledger from disk in a thread. Rows
+        stamped before the cut-off taken here are left to the backfill, newer
+        ones are folded live: a row is never counted twice; one with a late
+        device timestamp that reaches the disk after the backfill read its
+        node is not counted at all.
+        """
+        self._backfill_until = now_ns()
+        threading.Thread(target=self._backfill_rollups, args=(self._backfill_until,),
+                         name="luminode-backfill", daemon=True).start()
+
+    def _backfill_rollups(self, until):
+        span_s = max(t.span_s for t in self.rollups.tiers)
+        if self.retention_days:
+            span_s = min(span_s, self.retention_days * 86400)  # the backend keeps no more anyway
+        start = until - span_s * 10**9
+        t0 = time.monotonic()
+        try:
+            try:
+                self._backfill_aggregated(start, until)
+            except NotImplementedError:
+                self._backfill_rows(start, until)
+            log.info("rollups rebuilt from disk in %.1f s", time.monotonic() - t0)
+        except Exception:
+            log.exception("rollup backfill failed, rollups cover live data only")
+        finally:
+            self._backfill_until = None
+            with self._lock:
+                self.version += 1
+
+    def _backfill_aggregated(self, start, until):
+        """Buckets and meter deltas aggregated by the backend: no raw row reaches Python."""
+        end = np.datetime64(int(until), "ns")
+        # [width_s, from (ns), tiers]: a coarser tier reuses the scan of the one before it
+        # when that one already reaches back (nearly) as far, e.g. 1d from 1h
+        scans = []
+        for tier in self.rollups.tiers:
+            w = int(tier.width_ns)
+            lo = max(start, (until // w - tier.n_buckets + 1) * w)  # first bucket the ring keeps
+            if scans and tier.width_s % scans[-1][0] == 0 and scans[-1][1] - lo <= scans[-1][0] * 10**9:
+                scans[-1][1] = min(scans[-1][1], lo)
+                scans[-1][2].append(tier)
+            else:
+                scans.append([tier.width_s, lo, [tier]])
+        for width_s, lo, tiers in scans:
+            parts = []
+            for name, bucket, cells in self.backend.iter_rollup_cells(width_s, np.datetime64(int(lo), "ns"), end):
+                code = self.nodes.get(name)  # the worker may have coded it differently
+                if code >= 0:
+                    parts.append((np.full(len(bucket), code, dtype=np.int32), bucket, cells))
+                if sum(len(p[1]) for p in parts) >= BACKFILL_FOLD_ROWS:  # many nodes per fold
+                    self._fold_cells(tiers, width_s, parts)
+            self._fold_cells(tiers, width_s, parts)
+        for name, t0, t1, kwh in self.backend.iter_energy_deltas(np.datetime64(int(start), "ns"), end,
+                                                                  self.energy.max_kw):
+            code = self.nodes.get(name)
+            if code >= 0:
+                self.energy.add_deltas(np.full(len(kwh), code, dtype=np.int32), t0, t1, kwh)
+
+    def _fold_cells(self, tiers, width_s, parts):
+        """Fold collected (node, bucket, cells) of a ``width_s`` scan into ``tiers``; empties ``parts``."""
+        if not parts:
+            return
+        node, bucket, cells = (np.concatenate(p) for p in zip(*parts))
+        for tier in tiers:
+            self.rollups.fold(tier, node, bucket * width_s // tier.width_s, cells)
+        parts.clear()
+
+    def _backfill_rows(self, start, until):
+        """Backends that cannot aggregate: stream every node's raw rows."""
+        since, until = np.datetime64(int(start), "ns"), np.datetime64(int(until), "ns")
+        for name in list(self.nodes.names):
+            df = self.backend.query(name, start=since, end=until)
+            if not df.empty:
+                cols = columns_from_frame(df)
+                self.rollups.update(cols)
+                self.energy.update(cols, carry=False)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self.backend is not None:
+            self._start_backfill()
+        last_flush = 0.0
+        last_prune = time.monotonic()
+        while not self._stop.is_set():
+            self.tick_liveness()
+            if self.backend is not None and self.persist and self.retention_days \
+                    and time.monotonic() - last_prune > PRUNE_INTERVAL_S:
+                last_prune = time.monotonic()
+                try:
+                    self.backend.prune(datetime.now() - timedelta(days=self.retention_days))
+                except Exception:
+                    log.exception("pruning rows older than %d days failed", self.retention_days)
+            try:
+                first = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            got, waited = time.monotonic(), self.queue.last_wait  # oldest payload's wait so far
+            # let small trickles accumulate into one batch per flush interval
+            wait = self.flush_interval - (time.monotonic() - last_flush)
+            if wait > 0:
+                time.sleep(wait)
+            with METRICS.time("drain"):
+                batch = [first] + self.queue.drain(self.max_batch - 1, DRAIN_BUDGET_S)
+            METRICS.observe("queue_wait", waited + time.monotonic() - got)
+            try:
+                self.ingest(batch)
+            except Exception:
+                METRICS.inc("dropped_batches")
+                METRICS.inc("dropped_rows", len(batch))
+                log.exception("batch of %d payloads dropped", len(batch))
+            last_flush = time.monotonic()
+
+    def _attach(self, shm_name):
+        try:
+            return SharedRing.attach(shm_name)
+        except (FileNotFoundError, ValueError):  # worker not started yet / still initialising
+            return None
+
+    def _follow(self, shm_name):
+        shared, cursor, remap = None, 0, np.zeros(0, dtype=np.int32)
+        backfilled = False
+        last_rows = time.monotonic()
+        while not self._stop.is_set():
+            self.tick_liveness()
+            if shared is None:
+                shared = self._attach(shm_name)
+                if shared is None:
+                    time.sleep(1.0)
+                    continue
+                # rows the worker already wrote to disk come back via history() and the rollup backfill
+                cursor = shared.head if self.backend is not None else max(0, shared.head - shared.capacity)
+                remap = np.zeros(0, dtype=np.int32)
+                self.shared = shared
+                if self.backend is not None and not backfilled:
+                    # rows behind `cursor` are on disk; cut off now so they go to the backfill
+                    self._start_backfill()
+                    backfilled = True
+            if shared.head == cursor:
+                if time.monotonic() - last_rows > SHM_REATTACH_S:
+                    # a restarted worker creates a new block under the same name
+                    fresh = self._attach(shm_name)
+                    if fresh is None or fresh.generation != shared.generation:
+                        shared.close()
+                        shared, self.shared = fresh, fresh
+                        cursor, remap = 0, np.zeros(0, dtype=np.int32)
+                    else:
+                        fresh.close()
+                    last_rows = time.monotonic()
+                time.sleep(self.flush_interval)
+                continue
+            cols, cursor, lost = shared.read(cursor, self.max_batch)
+            self.shm_lost += lost
+            names = shared.node_names()
+            if len(names) > len(remap):
+                # worker codes -> our codes (ours may be preloaded from the backend in another order)
+                remap = np.fromiter((self.nodes.code(n) for n in names), dtype=np.int32, count=len(names))
+            cols["node"] = remap[cols["node"]]
+            try:
+                self.ingest_columns(cols)
+            except Exception:
+                METRICS.inc("dropped_batches")
+                METRICS.inc("dropped_rows", len(cols["node"]))
+                log.exception("batch of %d rows from shared memory dropped", len(cols["node"]))
+            last_rows = time.monotonic()
+            if shared.head - cursor < self.max_batch:
+                time.sleep(self.flush_interval)
+
+    # -----------------------------------------------------
+    # READ
+    # -----------------------------------------------------
+    def node_version(self, node_id):
+        code = self.nodes.get(node_id)
+        versions = self._node_versions
+        return int(versions[code]) if 0 <= code < len(versions) else 0
+
+    def data_version(self, node_id=None):
+        """Version of everything (``None``) or of a single node's data."""
+        return self.version if node_id is None else self.node_version(node_id)
+
+    def aggregates(self, node_id=None):
+        """KPI sums over the newest reading of every node (or of one node)."""
+        reported = self._reported
+        cols = self._latest_cols
+        if node_id is None:
+            mask = reported
+        else:
+            mask = np.zeros(len(reported), dtype=bool)
+            code = self.nodes.get(node_id)
+            if 0 <= code < len(mask):
+                mask[code] = reported[code]
+        nodes = int(mask.sum())
+        faulted = mask & (cols["fault_code"] != 0)
+        online = self.liveness.states(len(mask)) == ONLINE
+        return {
+            "nodes": nodes,
+            "faults": int(faulted.sum()),
+            "healthy": int((mask & online & ~faulted).sum()),  # reporting and no fault
+            **self.liveness.counts(mask),
+            "power": float(cols["power"][mask].sum()),
+            "energy_total": float(cols["energy_total"][mask].sum()),
+        }
+
+    def geo_index(self):
+        """Spatial index over every node with a known position; rebuild on ``positions_version``."""
+        n = min(len(self.nodes), len(self._lat))
+        lat, lng = self._lat[:n], self._lng[:n]
+        codes = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng)))
+        return GeoIndex(codes, lat[codes], lng[codes])
+
+    def node_flags(self):
+        """Boolean arrays by node code: newest reading faulted, node online."""
+        n = len(self._reported)
+        faulted = self._reported & (self._latest_cols["fault_code"] != 0)
+        return faulted, self.liveness.states(n) == ONLINE
+
+    def node_rates(self):
+        """Per-node messages, msg/s, end-to-end lag and silence (see metrics.NodeRates)."""
+        return self.rates.frame(self.nodes.names)
+
+    def energy_between(self, start, end=None, node_id=None):
+        """{"kwh", "tier"}: metered consumption in [start, end) for one node or the fleet."""
+        code = None if node_id is None else self.nodes.get(node_id)
+        if code == -1:
+            return {"kwh": 0.0, "tier": None}
+        kwh, tier = self.energy.kwh(start, end, code)
+        return {"kwh": kwh, "tier": tier}
+
+    def liveness_events(self, node_id=None, since=None):
+        code = None if node_id is None else self.nodes.get(node_id)
+        return self.liveness.events_frame(self.nodes.names, since, code)
+
+    def fault_events(self, node_id=None, since=None):
+        """Raise / clear events from the fault engine's log (no history scan)."""
+        code = None if node_id is None else self.nodes.get(node_id)
+        if code == -1:
+            code = -2  # unknown node: empty result rather than "all nodes"
+        return self.faults.events(self.nodes.names, since, code)
+
+    def anomalies(self, node_id=None, top=10):
+        """Anomaly scores with per-field |z|: the ``top`` nodes, or one node."""
+        if node_id is not None:
+            return self.anomaly.frame(self.nodes.names, [self.nodes.get(node_id)])
+        return self.anomaly.top(self.nodes.names, top)
+
+    def ring_covers(self, since):
+        """True when the ring still reaches back to ``since``."""
+        if self.backend is None:
+            return True  # nowhere else to look
+        oldest = self.ring.column("timestamp")[:1]
+        return oldest.size > 0 and oldest[0] <= np.datetime64(since, "ns")
+
+    def history(self, node_id=None, since=None):
+        """
+        Rows for one node (or all nodes) newer than ``since``. Served from the
+        ring when it still reaches back that far, otherwise from the backend.
+        """
+        if since is not None and self.backend is not None and not self.ring_covers(since):
+            return self.backend.query(node_id, start=since)
+        df = self.ring.frame(since=since) if node_id is None else self.ring.node_frame(node_id)
+        if node_id is not None and since is not None:
+            df = df[df["timestamp"] >= np.datetime64(since, "ns")]
+        return df
+
+    def iter_history(self, node_id=None, start=None, end=None, chunk_rows=50_000):
+        """Rows in [start, end) as frames of at most ``chunk_rows`` rows, oldest first (see export.py)."""
+        if self.backend is not None:
+            yield from self.backend.iter_query(node_id, start, end, chunk_rows)
+            return
+        df = self.history(node_id, since=start)
+        if end is not None:
+            df = df[df["timestamp"] < np.datetime64(end, "ns")]
+        codes = df["node_id"].cat.codes.to_numpy()
+        df = df.assign(lat=self._lat[codes], lng=self._lng[codes])  # node's last known position
+        for i in range(0, len(df), chunk_rows):
+            yield df.iloc[i:i + chunk_rows]
+
+    def rollup(self, since, node_id=None, per_node=False):
+        """
+        (tier, frame) for the window starting at ``since``, from the coarsest
+        rollup tier that fits it. Fleet-wide unless ``node_id`` or ``per_node``.
+        """
+        window_s = (datetime.now() - since).total_seconds()
+        tier = self.rollups.pick(window_s)
+        if node_id is None and not per_node:
+            with self.rollups.lock:
+                return tier, tier.fleet_frame(since)
+        if not tier.node_buckets and (node_id is not None or self.ring_covers(since)):
+            # fine tiers keep no per-node cells: bucket raw rows (one node by PK range, or the ring)
+            return tier, tier.frame_from_rows(self.history(node_id, since=since), per_node=node_id is None)
+        tier = self.rollups.pick(window_s, per_node=True)
+        with self.rollups.lock:
+            if node_id is not None:
+                return tier, tier.node_frame(self.nodes.get(node_id), since)
+            return tier, tier.nodes_frame(self.nodes.names, since)
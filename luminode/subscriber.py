@@ -0,0 +1,206 @@
+"""
+Pool of MQTT connections feeding one ingest buffer.
+
+Devices can publish on sharded topics ``<base>/<shard>/...``; each shard is
+served by exactly one connection in the pool (round-robin), and every
+connection runs its own paho network loop thread. The plain ``<base>``
+topics (and their binary codec variants) stay on the first connection, so
+unsharded devices keep working.
+
+Per-shard counters are only written by the loop thread that owns the shard,
+so they need no lock; ``stats()`` reads them from any thread. Messages fed
+in-process with ``deliver(..., source=...)`` (simulator, replay) get their
+own row under that label and no lag: they never crossed the broker, and a
+replay may carry recorded timestamps.
+"""
+import random
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+from .decode import Decoder
+from .metrics import METRICS
+
+UNSHARDED = "-"
+LAG_ALPHA = 0.05  # EWMA weight of the newest lag sample
+RATE_WINDOW_S = 1.0
+
+
+def parse_shards(spec):
+    """Shard names from a spec: "8" -> 0..7, "north,south" -> those two, empty -> none."""
+    spec = (spec or "").strip()
+    if not spec:
+        return []
+    if spec.isdigit():
+        return [str(i) for i in range(int(spec))]
+    return [s.strip() for s in spec.split(",") if s.strip()]
+
+
+class ShardStats:
+    __slots__ = ("shard", "connection", "messages", "bytes", "rejected", "lag_s", "last_seen",
+                 "_mark_count", "_mark_time", "rate")
+
+    def __init__(self, shard, connection):
+        self.shard = shard
+        self.connection = connection
+        self.messages = self.bytes = self.rejected = 0
+        self.lag_s = None  # EWMA once a lag sample arrives
+        self.last_seen = 0.0
+        self._mark_count, self._mark_time = 0, time.monotonic()
+        self.rate = 0.0
+
+    def snapshot(self):
+        now = time.monotonic()
+        if now - self._mark_time >= RATE_WINDOW_S:
+            self.rate = (self.messages - self._mark_count) / (now - self._mark_time)
+            self._mark_count, self._mark_time = self.messages, now
+        return {
+            "shard": self.shard,
+            "connection": self.connection,
+            "messages": self.messages,
+            "msg_per_s": round(self.rate, 1),
+            "lag_s": None if self.lag_s is None else round(self.lag_s, 2),
+            "idle_s": round(time.time() - self.last_seen, 1) if self.last_seen else None,
+            "bytes": self.bytes,
+            "rejected": self.rejected,
+        }
+
+
+class _Message:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic, self.payload = topic, payload
+
+
+class MQTTPool:
+    def __init__(self, broker, port, sink, topic_codecs, base_topic, shards=(), connections=1,
+                 client_prefix="dash", subscribe=True):
+        """
+        ``sink`` gets every decoded payload (``put``). ``topic_codecs`` are the
+        unsharded filters (see decode.Decoder); a codec variant ``<base><suffix>``
+        also applies to ``<base>/<shard><suffix>``, anything else on a shard
+        decodes as JSON. With ``subscribe=False`` the pool only publishes.
+        """
+        self.broker, self.port = broker, port
+        self.sink = sink
+        self.base_topic = base_topic
+        self.shards = list(shards)
+        n = max(1, min(int(connections), len(self.shards) or 1))
+        self._filters = [[] for _ in range(n)]
+        self._filters[0].extend(topic_codecs)
+        for i, shard in enumerate(self.shards):
+            self._filters[i % n].append(f"{base_topic}/{shard}/#")
+        codecs = dict(topic_codecs)
+        if self.shards:
+            for f, codec in topic_codecs.items():
+                if f.startswith(base_topic + "/"):
+                    codecs.setdefault(f"{base_topic}/+{f[len(base_topic):]}", codec)  # e.g. <base>/3/bin
+        self._stats = {UNSHARDED: ShardStats(UNSHARDED, 0)}
+        for i, shard in enumerate(self.shards):
+            self._stats[shard] = ShardStats(shard, i % n)
+        self.clients = []
+        self.decoders = []
+        for i in range(n):
+            decoder = Decoder(codecs)
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,
+                                 client_id=f"{client_prefix}_{random.randint(1000,9999)}_{i}",
+                                 userdata={"filters": self._filters[i] if subscribe else [], "decoder": decoder})
+            client.on_connect = self._on_connect
+            client.on_message = self._on_message
+            self.clients.append(client)
+            self.decoders.append(decoder)
+
+    @property
+    def client(self):
+        """Connection used for publishing (control commands)."""
+        return self.clients[0]
+
+    def start(self, blocking=True):
+        """Connect every client and start its loop thread. ``blocking`` raises on the first failed connect."""
+        for client in self.clients:
+            if blocking:
+                client.connect(self.broker, self.port, keepalive=60)
+            else:
+                client.connect_async(self.broker, self.port, keepalive=60)  # loop retries until the broker answers
+            client.loop_start()
+        return self
+
+    def stop(self):
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+    def route(self, topic, callback):
+        """Deliver ``topic`` to ``callback(payload_bytes)`` on the publishing connection (e.g. command acks)."""
+        client = self.clients[0]
+        client.message_callback_add(topic, lambda c, u, message: callback(message.payload))
+        client.user_data_get()["filters"].append(topic)  # also resubscribed on reconnect
+        if client.is_connected():
+            client.subscribe(topic)
+
+    def deliver(self, topic, raw, source=None):
+        """
+        Feed ``raw`` through the receive path as if the broker had sent it.
+        With a ``source`` label (e.g. "replay") it is counted under that label
+        instead of the topic's shard and takes no lag sample.
+        """
+        client = self.clients[0]
+        if source is None:
+            self._on_message(client, client.user_data_get(), _Message(topic, raw))
+            return
+        stats = self._stats.get(source)
+        if stats is None:
+            stats = self._stats[source] = ShardStats(source, None)
+        self._receive(client.user_data_get()["decoder"], topic, raw, stats, lag=False)
+
+    # -----------------------------------------------------
+    # CALLBACKS (one loop thread per client)
+    # -----------------------------------------------------
+    @staticmethod
+    def _on_connect(client, userdata, flags, reason_code, properties=None):
+        # (re)subscribe on every connect so a broker restart does not silently end the stream
+        if userdata["filters"]:
+            client.subscribe([(t, 0) for t in userdata["filters"]])
+
+    def _shard_of(self, topic):
+        base = self.base_topic
+        if len(topic) > len(base) and topic.startswith(base) and topic[len(base)] == "/":
+            shard = topic[len(base) + 1:].split("/", 1)[0]
+            if shard in self._stats:
+                return shard
+        return UNSHARDED
+
+    def _on_message(self, client, userdata, message):
+        self._receive(userdata["decoder"], message.topic, message.payload, self._stats[self._shard_of(message.topic)])
+
+    def _receive(self, decoder, topic, raw, stats, lag=True):
+        t0 = time.perf_counter()
+        stats.messages += 1
+        stats.bytes += len(raw)
+        stats.last_seen = now = time.time()
+        METRICS.inc("messages")
+        t1 = time.perf_counter()
+        payload = decoder.decode(topic, raw)
+        METRICS.observe("decode", time.perf_counter() - t1)
+        if payload is None:
+            stats.rejected += 1
+            METRICS.inc("rejected")
+            return
+        ts = payload["timestamp"]
+        if lag and isinstance(ts, datetime):
+            sample = now - ts.timestamp()
+            stats.lag_s = sample if stats.lag_s is None else stats.lag_s + LAG_ALPHA * (sample - stats.lag_s)
+        self.sink.put(payload)
+        METRICS.observe("receive", time.perf_counter() - t0)
+
+    # -----------------------------------------------------
+    # STATS
+    # -----------------------------------------------------
+    def stats(self):
+        """
+        One dict per shard; the unsharded topics show up as shard "-" once they
+        carry traffic, in-process sources under their label (lag_s None).
+        """
+        return [s.snapshot() for s in list(self._stats.values()) if s.messages or s.shard != UNSHARDED]
@@ -0,0 +1,153 @@
+"""
+Standalone ingestion worker: ``python -m luminode.worker``.
+
+Owns the MQTT connections (see subscriber.py), decodes and normalizes
+telemetry in batches and publishes the rows into a shared-memory ring (see
+shm.py), plus the SQLite backend when one is configured. Run the dashboard with
+``LUMINODE_INGEST=shm`` to attach to it instead of subscribing itself; the
+worker keeps collecting while the dashboard restarts.
+"""
+import argparse
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .buffer import IngestBuffer
+from .faults import FaultEngine, select_rules
+from .ingest import coordinates, normalize_batch
+from .metrics import METRICS, MetricsExporter
+from .persist import SQLiteBackend
+from .ringbuffer import NodeIndex
+from .shm import SharedRing
+from .subscriber import MQTTPool, parse_shards
+
+PRUNE_INTERVAL_S = 3600
+HEARTBEAT_S = 1.0
+DRAIN_BUDGET_S = 1.0  # a drain stops early after this long, so prunes and heartbeats keep their pace
+
+log = logging.getLogger("luminode.worker")
+
+
+class IngestWorker:
+    def __init__(self, shared, backend=None, retention_days=None, max_batch=100_000, flush_interval=0.2,
+                 buffer_size=200_000, overload_policy="coalesce", fault_rules=None):
+        self.shared = shared
+        self.backend = backend
+        self.retention_days = retention_days
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.queue = IngestBuffer(buffer_size, overload_policy)
+        self.nodes = NodeIndex()
+        # same rules as the dashboard, so the fault_code written to disk matches what it shows
+        self.faults = FaultEngine(select_rules(fault_rules))
+        if backend is not None:
+            for name in backend.load_nodes():  # same codes as on disk
+                self.nodes.code(name)
+        self.rows = 0
+        self._stop = threading.Event()
+
+    def process(self, payloads):
+        with METRICS.time("normalize"):
+            cols = normalize_batch(payloads, self.nodes)
+        with METRICS.time("apply"):
+            cols["fault_code"] = self.faults.evaluate(cols)
+            cols.update(coordinates(payloads))
+            self.shared.append_batch(cols, self.nodes.names)
+        self.rows += len(payloads)
+        METRICS.inc("rows", len(payloads))
+        METRICS.inc("batches")
+        if self.backend is not None:
+            with METRICS.time("persist"):
+                self.backend.append(cols, self.nodes)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        last_flush = 0.0
+        last_prune = time.monotonic()
+        while not self._stop.is_set():
+            if self.backend is not None and self.retention_days and time.monotonic() - last_prune > PRUNE_INTERVAL_S:
+                last_prune = time.monotonic()
+                try:
+                    self.backend.prune(datetime.now() - timedelta(days=self.retention_days))
+                except Exception:
+                    log.exception("pruning rows older than %d days failed", self.retention_days)
+            try:
+                first = self.queue.get(timeout=HEARTBEAT_S)
+            except queue.Empty:
+                self.shared.beat()  # lets readers tell "quiet" from "dead"
+                continue
+            got, waited = time.monotonic(), self.queue.last_wait
+            wait = self.flush_interval - (time.monotonic() - last_flush)
+            if wait > 0:
+                time.sleep(wait)
+            with METRICS.time("drain"):
+                batch = [first] + self.queue.drain(self.max_batch - 1, DRAIN_BUDGET_S)
+            METRICS.observe("queue_wait", waited + time.monotonic() - got)
+            try:
+                self.process(batch)
+            except Exception:
+                METRICS.inc("dropped_batches")
+                METRICS.inc("dropped_rows", len(batch))
+                log.exception("batch of %d payloads dropped", len(batch))
+            last_flush = time.monotonic()
+
+
+def main(argv=None):
+    env = os.environ.get
+    p = argparse.ArgumentParser(prog="python -m luminode.worker", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--broker", default=env("LUMINODE_BROKER", "broker.hivemq.com"))
+    p.add_argument("--port", type=int, default=int(env("LUMINODE_PORT", 1883)))
+    p.add_argument("--topic", default=env("LUMINODE_TOPIC", "luminode/v4/stream"))
+    p.add_argument("--shards", default=env("LUMINODE_SHARDS", ""), help='"8" or "north,south"; topic/<shard>/#')
+    p.add_argument("--connections", type=int, default=int(env("LUMINODE_MQTT_CONNECTIONS", 1)))
+    p.add_argument("--shm-name", default=env("LUMINODE_SHM_NAME", "luminode"))
+    p.add_argument("--capacity", type=int, default=int(env("LUMINODE_SHM_CAPACITY", 1_000_000)))
+    p.add_argument("--db", default=env("LUMINODE_DB", "luminode.db"), help="empty string disables persistence")
+    p.add_argument("--retention-days", type=int, default=int(env("LUMINODE_RETENTION_DAYS", 35)))
+    p.add_argument("--max-batch", type=int, default=int(env("LUMINODE_INGEST_MAX_BATCH", 100_000)))
+    p.add_argument("--buffer-size", type=int, default=int(env("LUMINODE_INGEST_BUFFER_SIZE", 200_000)))
+    p.add_argument("--overload-policy", default=env("LUMINODE_OVERLOAD_POLICY", "coalesce"))
+    p.add_argument("--fault-rules", default=env("LUMINODE_FAULT_RULES", ""), help="comma list, empty = all")
+    p.add_argument("--metrics-file", default=env("LUMINODE_METRICS_FILE", ""),
+                   help="write metrics here every --metrics-interval s (.json, else Prometheus text)")
+    p.add_argument("--metrics-interval", type=float, default=float(env("LUMINODE_METRICS_INTERVAL", 10)))
+    p.add_argument("--log-level", default=env("LUMINODE_LOG_LEVEL", "INFO"))
+    args = p.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    shared = SharedRing.create(args.shm_name, capacity=args.capacity, headroom=args.max_batch)
+    backend = SQLiteBackend(args.db) if args.db else None
+    worker = IngestWorker(shared, backend, args.retention_days, max_batch=args.max_batch,
+                          buffer_size=args.buffer_size, overload_policy=args.overload_policy,
+                          fault_rules=args.fault_rules)
+    codecs = {args.topic: "json", args.topic + "/bin": "struct", args.topic + "/msgpack": "msgpack"}
+    pool = MQTTPool(args.broker, args.port, worker.queue, codecs, args.topic,
+                    shards=parse_shards(args.shards), connections=args.connections, client_prefix="ingest")
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: worker.stop())
+    METRICS.gauge("queue_size", worker.queue.qsize)
+    METRICS.gauge("queue_dropped", lambda: worker.queue.dropped)
+    METRICS.gauge("shm_head", lambda: shared.head)
+    METRICS.gauge("nodes", lambda: len(worker.nodes))
+    if args.metrics_file:
+        MetricsExporter(METRICS, args.metrics_file, args.metrics_interval).start()
+    try:
+        pool.start(blocking=False)
+        log.info("%s:%d %s (%d connection(s), %d shard(s)) -> shm '%s' (%s rows)", args.broker, args.port, args.topic,
+                 len(pool.clients), len(pool.shards), args.shm_name, f"{args.capacity:,}")
+        worker.run()
+    finally:
+        pool.stop()
+        if backend is not None:
+            backend.close()
+        shared.close()  # unlinks the block; attached dashboards wait for the next worker
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import queue
+import time
+
+import pytest
+
+from luminode.buffer import DRAIN_CHUNK, IngestBuffer
+
+
+def msg(node, i):
+    return {"node_id": node, "i": i}
+
+
+def fill(buf, items):
+    for item in items:
+        buf.put(item)
+
+
+def test_fifo_below_capacity():
+    buf = IngestBuffer(10, "drop_oldest")
+    fill(buf, [msg("a", i) for i in range(3)])
+    assert [buf.get()["i"] for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(queue.Empty):
+        buf.get_nowait()
+    with pytest.raises(queue.Empty):
+        buf.get(timeout=0.01)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        IngestBuffer(10, "block")
+
+
+def test_drop_oldest_keeps_the_newest():
+    buf = IngestBuffer(3, "drop_oldest")
+    fill(buf, [msg("a", i) for i in range(5)])
+    assert [p["i"] for p in buf.drain(10)] == [2, 3, 4]
+    assert buf.stats() == {"policy": "drop_oldest", "size": 0, "maxsize": 3, "high_water": 3,
+                           "received": 5, "dropped": 2, "coalesced": 0}
+
+
+def test_sample_admits_every_nth_overflow_payload():
+    buf = IngestBuffer(2, "sample", sample_every=3)
+    fill(buf, [msg("a", i) for i in range(8)])
+    # overflow payloads 2..7: the 3rd and 6th (i = 4 and 7) get in, each evicting the oldest
+    assert [p["i"] for p in buf.drain(10)] == [4, 7]
+    assert buf.dropped == 6
+
+
+def test_coalesce_keeps_latest_per_node():
+    buf = IngestBuffer(3, "coalesce")
+    fill(buf, [msg("a", 0), msg("b", 1), msg("c", 2)])
+    fill(buf, [msg("x", 3), msg("x", 4), msg("y", 5), msg("x", 6)])
+    assert buf.qsize() == 3
+    out = buf.drain(10)
+    # "x" and "y" took the slots of the two oldest queued payloads; only their newest reading is kept
+    assert [(p["node_id"], p["i"]) for p in out] == [("c", 2), ("x", 6), ("y", 5)]
+    assert (buf.dropped, buf.coalesced) == (2, 2)
+
+
+def test_coalesced_node_stays_coalesced_until_drained():
+    buf = IngestBuffer(2, "coalesce")
+    fill(buf, [msg("a", 0), msg("b", 1), msg("x", 2)])
+    buf.get()  # room again, but "x" already has a coalesced reading
+    buf.put(msg("x", 3))
+    assert [(p["node_id"], p["i"]) for p in buf.drain(10)] == [("x", 3)]
+
+
+def test_drain_respects_max_items():
+    buf = IngestBuffer(10, "coalesce")
+    fill(buf, [msg("a", i) for i in range(5)])
+    assert [p["i"] for p in buf.drain(2)] == [0, 1]
+    assert buf.qsize() == 3
+    assert buf.drain(0) == []
+
+
+def test_last_wait_tracks_the_oldest_payload():
+    buf = IngestBuffer(10)
+    assert buf.last_wait == 0.0
+    buf.put(msg("a", 0))
+    time.sleep(0.05)
+    buf.put(msg("a", 1))
+    buf.get()
+    assert buf.last_wait >= 0.05
+    buf.drain(10)  # the second payload counts from when the first one left
+    assert buf.last_wait < 0.05
+
+
+def test_drain_stops_after_its_time_budget():
+    buf = IngestBuffer(3 * DRAIN_CHUNK)
+    fill(buf, [msg("a", i) for i in range(3 * DRAIN_CHUNK)])
+    # a spent budget still returns the first chunk
+    assert len(buf.drain(10 * DRAIN_CHUNK, max_seconds=0)) == DRAIN_CHUNK
+    assert len(buf.drain(10 * DRAIN_CHUNK, max_seconds=60)) == 2 * DRAIN_CHUNK
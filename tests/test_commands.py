@@ -0,0 +1,141 @@
+import json
+
+import pytest
+
+from luminode import commands
+from luminode.commands import ACKED, FAILED, PENDING, SENT, CommandPipeline
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(commands, "time", c)
+    return c
+
+
+def pipeline(sent, **kw):
+    kw.setdefault("debounce_s", 0.5)
+    kw.setdefault("ack_timeout_s", 5.0)
+    p = CommandPipeline(lambda topic, payload, qos: sent.append(json.loads(payload)), "ctl", **kw)
+    p._tokens = p.max_rate
+    return p
+
+
+def test_debounce_and_coalesce(clock):
+    sent = []
+    p = pipeline(sent)
+    p.submit("a", {"mode": "MANUAL"})
+    clock.now += 0.3
+    p.submit("a", {"relay": "ON"})
+    assert p.status("a")["fields"] == {"mode": "MANUAL", "relay": "ON"}
+    clock.now += 0.3
+    p._tick()
+    assert sent == []  # quiet for 0.3 s only
+    clock.now += 0.3
+    p._tick()
+    assert [{k: v for k, v in m.items() if k != "cmd_id"} for m in sent] == [{"node_id": "a", "mode": "MANUAL", "relay": "ON"}]
+    assert p.status("a")["state"] == SENT
+    assert p.stats["coalesced"] == 1
+
+
+def test_identical_fields_share_a_message(clock):
+    sent = []
+    p = pipeline(sent, batch_size=2)
+    for n in ("a", "b", "c"):
+        p.submit(n, {"relay": "OFF"}, debounce=False)
+    p._tick()
+    assert [m.get("node_ids") or [m["node_id"]] for m in sent] == [["a", "b"], ["c"]]
+    assert len({m["cmd_id"] for m in sent}) == 1
+
+
+def test_ack_stops_retries(clock):
+    sent = []
+    p = pipeline(sent)
+    cmd_id = p.submit_group(["a", "b"], {"relay": "ON"})
+    p._tick()
+    p.on_ack(json.dumps({"cmd_id": cmd_id, "node_id": "a"}).encode())
+    assert p.status("a")["state"] == ACKED
+    clock.now += 6
+    p._tick()
+    assert sent[-1] == {"cmd_id": cmd_id, "node_id": "b", "relay": "ON"}  # only the unacked node again
+    assert p.stats["retries"] == 1
+    p.on_ack({"cmd_id": cmd_id, "node_ids": ["b"]})
+    assert p.summary()["awaiting_ack"] == 0
+    assert p.stats["acked"] == 2
+
+
+def test_unacked_nodes_fail_after_max_retries(clock):
+    sent = []
+    p = pipeline(sent, max_retries=2)
+    p.submit("a", {"relay": "ON"}, debounce=False)
+    for _ in range(5):
+        p._tick()
+        clock.now += 6
+    assert len(sent) == 3  # first attempt + 2 retries
+    assert p.status("a")["state"] == FAILED
+    assert p.stats["failed"] == 1
+
+
+def test_fire_and_forget_without_ack_timeout(clock):
+    sent = []
+    p = pipeline(sent, ack_timeout_s=0)
+    p.submit("a", {"relay": "ON"}, debounce=False)
+    for _ in range(3):
+        p._tick()
+        clock.now += 10
+    assert len(sent) == 1
+    assert p.status("a")["state"] == SENT
+    assert p.summary()["awaiting_ack"] == 0
+
+
+def test_group_command_supersedes_pending_and_inflight(clock):
+    sent = []
+    p = pipeline(sent)
+    p.submit("a", {"relay": "ON"}, debounce=False)
+    p._tick()
+    old = sent[-1]["cmd_id"]
+    p.submit("a", {"relay": "OFF", "mode": "AUTO"})  # pending, debounced
+    p.submit_group(["a", "b"], {"relay": "ON", "mode": "MANUAL"})
+    assert "a" not in p._pending  # every pending field was overridden
+    assert old not in p._inflight  # the older command stops retrying for "a"
+    assert p.status("a")["state"] == PENDING
+
+
+def test_rate_limit_defers_the_rest(clock):
+    sent = []
+    p = pipeline(sent, batch_size=1, max_rate=2)
+    p.submit_group(["a", "b", "c"], {"relay": "ON"})
+    p._tick()
+    assert len(sent) == 2
+    p._tokens = p.max_rate
+    p._tick()
+    assert len(sent) == 3
+
+
+def test_publish_failure_retries_next_tick(clock):
+    sent, up = [], {"ok": False}
+
+    class Info:
+        @property
+        def rc(self):
+            return 0 if up["ok"] else 4
+
+    p = CommandPipeline(lambda t, payload, q: (sent.append(payload), Info())[1], "ctl", ack_timeout_s=0)
+    p._tokens = p.max_rate
+    p.submit("a", {"relay": "ON"}, debounce=False)
+    p._tick()
+    assert p.status("a")["state"] == PENDING
+    up["ok"] = True
+    p._tick()
+    assert p.status("a")["state"] == SENT
@@ -0,0 +1,79 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from luminode import decode
+from luminode.decode import Decoder, encode_struct, parse_timestamp
+
+READING = {"node_id": "LN-7", "timestamp": "2026-03-01 12:30:05", "voltage": 229.5, "current": 0.4,
+           "power": 91.0, "lux": 12.5, "energy_total": 1234.25, "status": "ON", "lat": 52.5, "lng": 13.25}
+TS = datetime(2026, 3, 1, 12, 30, 5)
+
+
+def test_json_round_trip():
+    d = Decoder()
+    out = d.decode("lamps/telemetry", json.dumps(READING).encode())
+    assert out == {**READING, "timestamp": TS}
+    assert d.decoded == 1 and d.rejected == {}
+
+
+def test_struct_round_trip():
+    d = Decoder({"lamps/+/bin": "struct"})
+    raw = encode_struct(READING)
+    assert len(raw) == decode.STRUCT_SIZE
+    out = d.decode("lamps/a/bin", raw)
+    assert out["node_id"] == "LN-7" and out["timestamp"] == TS and out["status"] == "ON"
+    for f in ("voltage", "current", "power", "lux", "energy_total", "lat", "lng"):
+        assert out[f] == pytest.approx(READING[f]), f
+    assert d.decode("lamps/a/bin", raw[:-1]) is None  # short record
+    # topics outside the filter still decode as JSON
+    assert d.decode("lamps/a/json", raw) is None
+    assert d.rejected == {"decode": 2}
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    d = Decoder({"lamps/mp": "msgpack"})
+    out = d.decode("lamps/mp", msgpack.packb(READING))
+    assert out == {**READING, "timestamp": TS}
+
+
+def test_timestamp_formats():
+    assert parse_timestamp("2026-03-01T12:30:05") == TS
+    assert parse_timestamp("2026-03-01 12:30:05.250") == datetime(2026, 3, 1, 12, 30, 5, 250000)
+    assert parse_timestamp("2026-13-01 00:00:00") is None
+    assert parse_timestamp("yesterday") is None
+
+
+@pytest.mark.parametrize("raw, reason", [
+    (b"{not json", "decode"),
+    (b"[1, 2]", "not_object"),
+    (json.dumps({**READING, "node_id": ""}), "node_id"),
+    (json.dumps({**READING, "node_id": True}), "node_id"),
+    (json.dumps({**READING, "power": "abc"}), "power"),
+    (json.dumps({**READING, "lat": {"deg": 52}}), "lat"),
+    (json.dumps({**READING, "status": 1}), "status"),
+    (json.dumps({**READING, "timestamp": "2026-13-01 00:00:00"}), "timestamp"),
+])
+def test_rejections(raw, reason):
+    d = Decoder()
+    assert d.decode("lamps/telemetry", raw) is None
+    assert d.rejected == {reason: 1}
+    assert d.decoded == 0
+
+
+def test_lenient_fields():
+    d = Decoder()
+    out = d.decode("t", json.dumps({"node_id": 7, "power": "91.5"}))
+    assert out["power"] == "91.5"  # numeric strings are left to normalize
+    assert isinstance(out["timestamp"], datetime)  # missing timestamp: receive time
+
+
+def test_topic_lookups_are_bounded(monkeypatch):
+    monkeypatch.setattr(decode, "MAX_TOPICS", 3)
+    d = Decoder({"lamps/+/bin": "struct"})
+    for i in range(10):
+        d.codec_for(f"lamps/{i}/bin")
+    assert list(d._by_topic) == ["lamps/7/bin", "lamps/8/bin", "lamps/9/bin"]
+    assert d.decode("lamps/0/bin", encode_struct(READING))["node_id"] == "LN-7"
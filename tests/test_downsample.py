@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from luminode.downsample import downsample_frame, lttb, minmax
+
+T0 = np.datetime64("2026-01-01T00:00:00", "ns")
+
+
+def series(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.sin(np.arange(n) / 50) + rng.normal(0, 0.05, n)
+    y[n * 2 // 5], y[n * 7 // 10] = 25.0, -25.0  # one spike, one dip
+    return T0 + np.arange(n) * np.timedelta64(60, "s"), y
+
+
+def test_lttb_keeps_ends_and_spikes():
+    x, y = series()
+    idx = lttb(x, y, 100)
+    assert len(idx) == 100
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert (np.diff(idx) > 0).all()  # one point per bucket, in order
+    assert 400 in idx and 700 in idx
+    assert lttb(np.arange(len(y)), y, 100).tolist() == idx.tolist()  # datetimes are plain seconds
+
+
+def test_lttb_passthrough_and_nan():
+    x, y = series(50)
+    assert lttb(x, y, 80).tolist() == list(range(50))
+    assert lttb(x, y, 2).tolist() == list(range(50))
+    y[10:20] = np.nan
+    assert len(lttb(x, y, 10)) == 10
+
+
+def test_minmax_keeps_every_extreme():
+    _, y = series()
+    idx = minmax(y, 100)
+    assert len(idx) <= 102 and idx[0] == 0 and idx[-1] == len(y) - 1
+    assert (np.diff(idx) > 0).all()
+    assert 400 in idx and 700 in idx
+    # every bucket's min and max survive, so the envelope is unchanged
+    assert y[idx].max() == y.max() and y[idx].min() == y.min()
+    assert minmax(y, 3).tolist() == list(range(len(y)))
+
+
+def test_minmax_uneven_tail():
+    y = np.arange(101, dtype=np.float64)[::-1]
+    idx = minmax(y, 10)
+    assert idx[-1] == 100 and idx.max() < len(y)
+
+
+def frame(nodes=3, per=500):
+    x, _ = series(per)
+    parts = [pd.DataFrame({"timestamp": x, "power": series(per, seed=i)[1], "node_id": f"LN-{i}"}) for i in range(nodes)]
+    return pd.concat(parts, ignore_index=True)
+
+
+def test_downsample_frame_per_trace():
+    df = frame()
+    out = downsample_frame(df, "timestamp", "power", max_points=100, by="node_id")
+    assert out["node_id"].value_counts().tolist() == [100] * 3
+    assert out.index.is_monotonic_increasing
+    # the same with a categorical key
+    cat = df.assign(node_id=df["node_id"].astype("category"))
+    assert downsample_frame(cat, "timestamp", "power", 100, by="node_id").index.tolist() == out.index.tolist()
+
+
+def test_downsample_frame_budget_and_passthrough():
+    df = frame()
+    out = downsample_frame(df, "timestamp", "power", max_points=200, by="node_id", max_total=150)
+    assert out["node_id"].value_counts().tolist() == [50] * 3  # floor of 50 per trace
+    one = df[df["node_id"] == "LN-0"]
+    assert len(downsample_frame(one, "timestamp", "power", 80, method="minmax")) <= 82
+    assert downsample_frame(one, "timestamp", "power", 1000) is one
+    assert downsample_frame(df.iloc[:0], "timestamp", "power", 10, by="node_id").empty
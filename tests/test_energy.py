@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from luminode.energy import EnergyLedger
+
+T0 = np.datetime64("2026-01-01T00:00:00", "ns")
+H = np.timedelta64(3600, "s")
+
+
+def cols(node, minutes, meter):
+    return {
+        "node": np.asarray(node, dtype=np.int32),
+        "timestamp": T0 + np.asarray(minutes) * np.timedelta64(60, "s"),
+        "energy_total": np.asarray(meter, dtype=np.float64),
+    }
+
+
+def test_deltas_per_node():
+    ledger = EnergyLedger()
+    ledger.update(cols([0, 1, 0, 1], [0, 0, 30, 30], [100.0, 50.0, 100.2, 50.1]))
+    assert ledger.kwh(T0, T0 + H, code=0) == (pytest.approx(0.2), "hourly")
+    assert ledger.kwh(T0, T0 + H, code=1)[0] == pytest.approx(0.1)
+    assert ledger.kwh(T0, T0 + H)[0] == pytest.approx(0.3)
+    assert ledger.consumed[:2].tolist() == pytest.approx([0.2, 0.1])
+
+
+def test_meter_state_carries_over_batches():
+    ledger = EnergyLedger()
+    ledger.update(cols([0], [0], [100.0]))
+    ledger.update(cols([0], [30], [100.5]))
+    assert ledger.kwh(T0, T0 + H, code=0)[0] == pytest.approx(0.5)
+
+
+def test_reset_counts_the_new_reading():
+    ledger = EnergyLedger()
+    ledger.update(cols([0, 0, 0], [0, 20, 40], [100.0, 100.3, 0.2]))
+    assert ledger.kwh(T0, T0 + H, code=0)[0] == pytest.approx(0.5)
+    assert ledger.stats["resets"] == 1
+
+
+def test_implausible_delta_is_rejected():
+    ledger = EnergyLedger(max_kw=2.0)
+    # 50 kWh in 30 minutes is a meter swap, not a lamp
+    ledger.update(cols([0, 0, 0], [0, 30, 60], [100.0, 150.0, 150.4]))
+    assert ledger.kwh(T0, T0 + 2 * H, code=0)[0] == pytest.approx(0.4)
+    assert ledger.stats["rejected"] == 1
+
+
+def test_out_of_order_readings_are_ignored():
+    ledger = EnergyLedger()
+    ledger.update(cols([0, 0], [0, 30], [100.0, 100.5]))
+    ledger.update(cols([0, 0], [10, 40], [100.1, 100.6]))
+    assert ledger.stats["out_of_order"] == 1
+    assert ledger.kwh(T0, T0 + H, code=0)[0] == pytest.approx(0.6)
+
+
+def test_rows_of_a_batch_are_sorted_by_time():
+    ledger = EnergyLedger()
+    ledger.update(cols([0, 0, 0], [30, 0, 15], [100.6, 100.0, 100.2]))
+    assert ledger.kwh(T0, T0 + H, code=0)[0] == pytest.approx(0.6)
+    assert ledger.stats["resets"] == 0
+
+
+def test_gap_is_spread_over_the_hours():
+    ledger = EnergyLedger()
+    # 0.4 kWh between 00:30 and 02:30
+    ledger.update(cols([0, 0], [30, 150], [100.0, 100.4]))
+    hourly = ledger.tiers[0]
+    per_hour = [hourly.kwh(int((T0 + i * H).astype(np.int64)), int((T0 + (i + 1) * H).astype(np.int64)), 0)
+                for i in range(3)]
+    assert per_hour == pytest.approx([0.1, 0.2, 0.1])
+    # a window ending mid-bucket is pro-rated
+    assert ledger.kwh(T0 + H, T0 + H + H / 2, code=0)[0] == pytest.approx(0.1)
+
+
+def test_history_replay_does_not_touch_live_state():
+    ledger = EnergyLedger()
+    ledger.update(cols([0], [60], [200.0]))
+    ledger.update(cols([0, 0], [0, 30], [100.0, 100.3]), carry=False)
+    assert ledger.kwh(T0, T0 + H, code=0)[0] == pytest.approx(0.3)
+    assert ledger._meter[0] == 200.0
+    assert ledger.stats["out_of_order"] == 0
+
+
+def test_pick_falls_back_to_coarser_tiers():
+    ledger = EnergyLedger()
+    ledger.update(cols([0, 0], [0, 10 * 24 * 60], [100.0, 110.0]))
+    assert ledger.kwh(T0 + 9 * 24 * H, T0 + 10 * 24 * H, code=0) == (pytest.approx(1.0), "hourly")
+    assert ledger.kwh(T0, code=0)[1] == "daily"
+    assert ledger.kwh(T0, T0 + 5 * 24 * H, code=0)[0] == pytest.approx(5.0)
+    assert ledger.kwh(T0, code=7)[0] == 0.0
+
+
+def test_future_timestamp_is_clamped():
+    ledger = EnergyLedger()
+    now = np.datetime64(datetime.now(), "ns")
+    m = np.timedelta64(60, "s")
+    ledger.update({"node": np.zeros(3, np.int32), "timestamp": now - np.array([40, 30, 20]) * m,
+                   "energy_total": np.array([100.0, 100.1, 100.2])})
+    ledger.update({"node": np.array([1, 1], np.int32), "timestamp": np.array([now - m, np.datetime64("2099-01-01", "ns")]),
+                   "energy_total": np.array([50.0, 50.02])})
+    ledger.update({"node": np.zeros(1, np.int32), "timestamp": np.array([now]), "energy_total": np.array([100.3])})
+    # hourly / daily / monthly rings still hold the real readings
+    for tier in ledger.tiers:
+        assert tier.kwh(0, code=0) == pytest.approx(0.3, abs=1e-6)
+    assert ledger.kwh(now - 60 * m, code=1)[0] == pytest.approx(0.02)
+    assert ledger._ts[1] <= (now + 2 * m).astype(np.int64)
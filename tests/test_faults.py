@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from luminode.faults import DEFAULT_RULES, FaultEngine, Rule, select_rules
+
+T0 = np.datetime64("2026-01-01T20:00:00", "ns")
+
+
+def batch(node, voltage=220.0, power=60.0, lux=0.0, status=1, start=0, step_s=5):
+    """Ring columns for ``len(node)`` readings, ``step_s`` apart from ``start`` steps after T0."""
+    node = np.asarray(node, dtype=np.int32)
+    n = len(node)
+
+    def full(v, dtype=np.float64):
+        return np.broadcast_to(np.asarray(v, dtype=dtype), n).copy()
+
+    return {
+        "node": node,
+        "timestamp": T0 + (start + np.arange(n)) * np.timedelta64(step_s, "s"),
+        "status": full(status, np.int8),
+        "voltage": full(voltage),
+        "current": full(power) / full(voltage),
+        "power": full(power),
+        "lux": full(lux),
+    }
+
+
+def over_voltage_only():
+    return FaultEngine(select_rules("over_voltage"))
+
+
+def test_debounce_needs_consecutive_readings():
+    engine = over_voltage_only()
+    codes = engine.evaluate(batch([0] * 6, voltage=[255, 255, 220, 255, 255, 255]))
+    # two high readings are not enough; the third in a row raises
+    assert codes.tolist() == [0, 0, 0, 0, 0, 1]
+    assert engine.active(0) == ["over_voltage"]
+
+
+def test_hysteresis_holds_between_thresholds_and_clears_after_debounce():
+    engine = over_voltage_only()
+    engine.evaluate(batch([0] * 3, voltage=255))
+    # 247 V is below the raise threshold but above the clear one: the fault holds
+    codes = engine.evaluate(batch([0] * 6, voltage=[247, 247, 240, 240, 240, 247], start=3))
+    assert codes.tolist() == [1, 1, 1, 1, 0, 0]
+    assert engine.active(0) == []
+
+
+def test_debounce_counters_carry_over_batches():
+    engine = over_voltage_only()
+    assert engine.evaluate(batch([0, 0], voltage=255)).tolist() == [0, 0]
+    assert engine.evaluate(batch([0], voltage=255, start=2)).tolist() == [1]
+
+
+def test_nodes_are_independent_and_order_is_preserved():
+    engine = over_voltage_only()
+    cols = batch([0, 1, 0, 1, 0, 1], voltage=[255, 220, 255, 220, 255, 220])
+    assert engine.evaluate(cols).tolist() == [0, 0, 0, 0, 1, 0]
+
+
+def test_events_are_logged_once_per_transition():
+    engine = over_voltage_only()
+    engine.evaluate(batch([0] * 8, voltage=[255, 255, 255, 255, 240, 240, 240, 240]))
+    events = engine.events(["LN-1"])
+    assert events["event"].tolist() == ["RAISED", "CLEARED"]
+    assert events["fault"].tolist() == ["over_voltage", "over_voltage"]
+    assert events["value"].tolist() == pytest.approx([255, 240])
+    assert engine.events(["LN-1"], node_code=0).shape[0] == 2
+    assert engine.events(["LN-1"], since=T0 + np.timedelta64(16, "s")).shape[0] == 1
+
+
+def test_lamp_dead_and_first_active_rule_wins():
+    engine = FaultEngine()
+    codes = engine.evaluate(batch([0] * 3, voltage=255, power=0.0))
+    # lamp_dead has no debounce and comes first in DEFAULT_RULES
+    assert codes.tolist() == [4, 4, 4]
+    assert engine.active(0) == ["lamp_dead", "over_voltage"]
+
+
+def test_off_lamp_is_not_dead():
+    engine = FaultEngine(select_rules("lamp_dead"))
+    assert engine.evaluate(batch([0] * 2, power=0.0, status=0)).tolist() == [0, 0]
+
+
+def test_flapping_raises_on_frequent_status_changes():
+    engine = FaultEngine(select_rules("flapping"))
+    codes = engine.evaluate(batch([0] * 10, status=[1, 0] * 5, power=[60, 0] * 5))
+    # the 7th change (10th reading) pushes the score above 6
+    assert codes.tolist() == [0] * 7 + [6] * 3
+
+
+def test_select_rules():
+    assert [r.name for r in select_rules("lamp_dead, flapping")] == ["lamp_dead", "flapping"]
+    assert select_rules("") == DEFAULT_RULES
+
+
+def test_custom_rule():
+    rule = Rule("hot", 9, lambda c: c["lux"] > 10, lambda c: c["lux"] <= 10, debounce=2, value="lux")
+    engine = FaultEngine([rule])
+    # raise and clear are both debounced
+    assert engine.evaluate(batch([3] * 4, lux=[11, 11, 5, 5])).tolist() == [0, 9, 9, 0]
@@ -0,0 +1,84 @@
+import numpy as np
+
+from luminode.liveness import OFFLINE, ONLINE, STALE, UNKNOWN, LivenessIndex
+
+S = 1_000_000_000
+T0 = 1_000_000 * S
+
+
+def beat(idx, codes, at, now=None):
+    codes = np.asarray(codes, dtype=np.int64)
+    idx.heartbeat(codes, np.full(len(codes), at, dtype=np.int64), now=at if now is None else now)
+
+
+def test_online_stale_offline():
+    idx = LivenessIndex(stale_after_s=60, offline_after_s=300)
+    beat(idx, [0], T0)
+    assert idx.state_of(0) == "online"
+    assert idx.tick(T0 + 59 * S).tolist() == []
+    assert idx.tick(T0 + 60 * S).tolist() == [0]
+    assert idx.state_of(0) == "stale"
+    assert idx.tick(T0 + 299 * S).tolist() == []
+    assert idx.tick(T0 + 300 * S).tolist() == [0]
+    assert idx.state_of(0) == "offline"
+    assert idx.tick(T0 + 3600 * S).tolist() == []  # nothing left in the heap
+    assert idx._heap == []
+
+
+def test_heartbeat_pushes_the_deadline_back():
+    idx = LivenessIndex(stale_after_s=60, offline_after_s=300)
+    beat(idx, [0, 1], T0)
+    beat(idx, [0], T0 + 50 * S)
+    assert idx.tick(T0 + 70 * S).tolist() == [1]
+    assert idx.states(2).tolist() == [ONLINE, STALE]
+    assert idx.tick(T0 + 110 * S).tolist() == [0]
+
+
+def test_coming_back_is_logged():
+    idx = LivenessIndex(stale_after_s=60, offline_after_s=300)
+    beat(idx, [0], T0)
+    idx.tick(T0 + 400 * S)
+    beat(idx, [0], T0 + 500 * S)
+    assert idx.state_of(0) == "online"
+    # the very first heartbeat (from unknown) is not a transition; a late tick still passes through stale
+    assert [(c, old, new) for _, c, old, new in idx.transitions] == \
+        [(0, ONLINE, STALE), (0, STALE, OFFLINE), (0, OFFLINE, ONLINE)]
+    idx.tick(T0 + 900 * S)
+    ev = idx.events_frame(["LN-0"])
+    assert ev["status"].tolist() == ["STALE", "OFFLINE", "ONLINE", "STALE", "OFFLINE"]
+    assert len(idx.events_frame(["LN-0"], since=np.datetime64(T0 + 450 * S, "ns"))) == 3
+    assert len(idx.events_frame(["LN-0"], code=1)) == 0
+
+
+def test_old_and_future_readings():
+    idx = LivenessIndex(stale_after_s=60, offline_after_s=300)
+    beat(idx, [0], T0 + 100 * S)
+    beat(idx, [0], T0, now=T0 + 100 * S)  # older than what we have: ignored
+    assert idx._last[0] == T0 + 100 * S
+    beat(idx, [1], T0 + 10_000 * S, now=T0 + 100 * S)  # clock ahead: clamped to now
+    assert idx._last[1] == T0 + 100 * S
+    # a late reading that is already stale does not bring a node online
+    beat(idx, [2], T0, now=T0 + 100 * S)
+    assert idx.state_of(2) == "unknown"
+    idx.tick(T0 + 100 * S)
+    assert idx.state_of(2) == "stale"
+
+
+def test_counts_and_unknown_nodes():
+    idx = LivenessIndex(stale_after_s=60, offline_after_s=300)
+    beat(idx, [0, 1, 2], T0)
+    beat(idx, [2], T0 + 100 * S)
+    idx.tick(T0 + 100 * S)
+    assert idx.counts(np.array([True, True, True, True])) == {"online": 1, "stale": 2, "offline": 0}
+    assert idx.counts(np.array([False, False, True])) == {"online": 1, "stale": 0, "offline": 0}
+    assert idx.states(300)[3:].tolist() == [UNKNOWN] * 297
+    assert idx.state_of(10_000) == "unknown"
+
+
+def test_offline_never_before_stale():
+    idx = LivenessIndex(stale_after_s=120, offline_after_s=30)
+    beat(idx, [0], T0)
+    assert idx.tick(T0 + 60 * S).tolist() == []
+    idx.tick(T0 + 120 * S)
+    assert idx.state_of(0) == "offline"
+    assert idx.states(1).tolist() == [OFFLINE]
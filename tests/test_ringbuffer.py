@@ -0,0 +1,78 @@
+import numpy as np
+
+from luminode.ringbuffer import FLOAT_FIELDS, FRAME_COLUMNS, NodeIndex, TelemetryRing, columns_from_frame
+
+T0 = np.datetime64("2026-01-01T00:00:00", "ns")
+
+
+def rows(start, n, node=0):
+    i = np.arange(start, start + n)
+    return {
+        "timestamp": T0 + i * np.timedelta64(1, "s"), "node": np.full(n, node, np.int32),
+        "status": (i % 2).astype(np.int8), "fault_code": np.zeros(n, np.int16),
+        **{f: i.astype(np.float64) for f in FLOAT_FIELDS},
+    }
+
+
+def ring(capacity=10, headroom=4):
+    r = TelemetryRing(capacity, headroom)
+    r.nodes.encode(["a", "b"])
+    return r
+
+
+def test_wrap_keeps_the_newest_rows_contiguous():
+    r = ring()
+    for start in range(0, 37, 5):
+        r.append_batch(rows(start, 5))
+    assert r.head == 40 and len(r) == 10
+    power = r.column("power")
+    assert power.tolist() == list(range(30, 40))
+    assert power.base is not None  # a view, not a copy
+    assert r.column("power", last=3).tolist() == [37, 38, 39]
+    assert r.frame(last=0).empty
+
+
+def test_oversized_batch_keeps_its_tail():
+    r = ring()
+    r.append_batch(rows(0, 3))
+    r.append_batch(rows(100, 50))  # more than the whole ring (size 14)
+    assert r.head == 53
+    assert r.column("power").tolist() == list(range(140, 150))
+    r.append_batch(rows(150, 2))
+    assert r.column("power").tolist() == list(range(142, 152))
+    r.append_batch(rows(0, 0))
+    assert r.head == 55
+
+
+def test_snapshot_survives_headroom_appends():
+    r = ring()
+    r.append_batch(rows(0, 12))
+    df = r.frame()
+    assert list(df.columns) == FRAME_COLUMNS
+    assert df["power"].tolist() == list(range(2, 12))
+    assert df["status"].tolist() == ["OFF", "ON"] * 5
+    r.append_batch(rows(100, 4))  # exactly the headroom
+    assert df["power"].tolist() == list(range(2, 12))
+    assert df["timestamp"].iloc[0] == T0 + np.timedelta64(2, "s")
+
+
+def test_since_and_node_frames():
+    r = ring()
+    r.append_batch(rows(0, 4, node=0))
+    r.append_batch(rows(4, 4, node=1))
+    assert r.frame(since=T0 + np.timedelta64(6, "s"))["power"].tolist() == [6, 7]
+    assert r.frame(since=T0 + np.timedelta64(60, "s")).empty
+    b = r.node_frame("b", last=6)
+    assert b["node_id"].astype(str).tolist() == ["b"] * 4
+    assert r.node_frame("zzz").empty
+    # a frame round-trips into the ring's columns
+    cols = columns_from_frame(r.frame())
+    assert cols["node"].tolist() == [0] * 4 + [1] * 4
+    assert cols["status"].tolist() == rows(0, 8)["status"].tolist()
+
+
+def test_node_index():
+    idx = NodeIndex()
+    assert idx.encode(["x", "y", "x"]).tolist() == [0, 1, 0]
+    assert idx.get("z") == -1 and "z" not in idx
+    assert idx.names == ["x", "y"] and idx.name(1) == "y"
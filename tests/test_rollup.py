@@ -0,0 +1,137 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from luminode.rollup import FIELDS, RollupSet, RollupTier
+
+T0 = np.datetime64("2026-01-01T00:00:00", "ns")
+NAMES = ["LN-0", "LN-1", "LN-2"]
+
+
+def cols(node, minutes, power, fault_code=0):
+    node = np.asarray(node, dtype=np.int32)
+    n = len(node)
+    power = np.asarray(power, dtype=np.float64)
+    return {
+        "node": node,
+        "timestamp": T0 + np.asarray(minutes) * np.timedelta64(60, "s"),
+        "fault_code": np.broadcast_to(np.asarray(fault_code, dtype=np.int16), n).copy(),
+        **{f: power.copy() if f == "power" else np.full(n, 220.0 if f == "voltage" else 1.0) for f in FIELDS},
+    }
+
+
+def tier_set(node_buckets=10):
+    return RollupSet([("10min", 600, 6, 0), ("1h", 3600, 24, node_buckets)])
+
+
+def test_fleet_cells_sum_min_max_per_bucket():
+    rs = tier_set()
+    rs.update(cols([0, 1, 0, 2], [1, 2, 11, 12], [10, 30, 50, 70], fault_code=[0, 4, 0, 0]))
+    df = rs.tiers[0].fleet_frame(T0)
+    assert df["timestamp"].tolist() == [T0, T0 + np.timedelta64(600, "s")]
+    assert df["count"].tolist() == [2, 2]
+    assert df["faults"].tolist() == [1, 0]
+    assert df["power"].tolist() == pytest.approx([20, 60])
+    assert df["power_min"].tolist() == pytest.approx([10, 50])
+    assert df["power_max"].tolist() == pytest.approx([30, 70])
+
+
+def test_updates_accumulate_across_batches():
+    rs = tier_set()
+    rs.update(cols([0], [1], [10]))
+    rs.update(cols([1], [2], [20]))
+    df = rs.tiers[1].fleet_frame(T0)
+    assert df["count"].tolist() == [2]
+    assert df["power_sum"].tolist() == pytest.approx([30])
+
+
+def test_ring_drops_buckets_older_than_retention():
+    rs = tier_set()
+    rs.update(cols([0], [0], [10]))
+    rs.update(cols([0], [70], [20]))  # 7 buckets later: bucket 0 fell out of the 6-bucket ring
+    df = rs.tiers[0].fleet_frame(T0)
+    assert df["count"].tolist() == [1]
+    assert df["power"].tolist() == pytest.approx([20])
+    rs.update(cols([0], [5], [99]))  # too old to keep
+    assert rs.tiers[0].fleet_frame(T0)["count"].sum() == 1
+
+
+def test_fine_tiers_keep_no_node_cells():
+    rs = tier_set()
+    rs.update(cols([0, 1], [1, 2], [10, 20]))
+    assert rs.tiers[0].nodes_frame(NAMES, T0).empty
+    assert rs.tiers[0].node_frame(0, T0).empty
+
+
+def test_node_cells_only_for_reporting_nodes():
+    rs = tier_set()
+    rs.update(cols([2, 0, 2], [1, 2, 61], [10, 20, 30]))
+    tier = rs.tiers[1]
+    df = tier.nodes_frame(NAMES, T0)
+    assert sorted(zip(df["node_id"].astype(str), df["count"], df["power"])) == \
+        [("LN-0", 1, 20), ("LN-2", 1, 10), ("LN-2", 1, 30)]
+    one = tier.node_frame(2, T0)
+    assert one["power"].tolist() == pytest.approx([10, 30])
+    assert one["power_min"].isna().all()  # node cells carry means only
+    assert tier.node_frame(1, T0).empty
+    # a bucket only holds the codes that reported in it
+    codes = [entry[0].tolist() for entry in tier._node_cells if entry is not None]
+    assert sorted(codes) == [[0, 2], [2]]
+
+
+def test_node_retention_is_shorter_than_fleet_retention():
+    rs = tier_set(node_buckets=2)
+    rs.update(cols([0], [0], [10]))
+    rs.update(cols([0], [180], [20]))  # 3 hours later
+    tier = rs.tiers[1]
+    assert tier.fleet_frame(T0)["count"].tolist() == [1, 1]
+    assert tier.node_frame(0, T0)["power"].tolist() == pytest.approx([20])
+
+
+def test_frame_from_rows_matches_node_cells():
+    rs = tier_set()
+    c = cols([0, 1, 0], [1, 2, 30], [10, 20, 40])
+    rs.update(c)
+    rows = pd.DataFrame({
+        "node_id": pd.Categorical.from_codes(c["node"], categories=NAMES),
+        "timestamp": c["timestamp"], "fault_code": c["fault_code"],
+        **{f: c[f] for f in FIELDS},
+    })
+    tier = rs.tiers[1]
+    raw = tier.frame_from_rows(rows, per_node=True)
+    cells = tier.nodes_frame(NAMES, T0)
+    key = ["node_id", "timestamp"]
+    raw = raw.assign(node_id=raw["node_id"].astype(str)).sort_values(key).reset_index(drop=True)
+    cells = cells.assign(node_id=cells["node_id"].astype(str)).sort_values(key).reset_index(drop=True)
+    assert raw["count"].tolist() == cells["count"].tolist()
+    assert raw["power"].tolist() == pytest.approx(cells["power"].tolist())
+
+
+def test_pick():
+    rs = RollupSet()
+    assert rs.pick(3600).name == "1min"
+    assert rs.pick(7 * 86400).name == "1h"
+    assert rs.pick(30 * 86400).name == "1h"
+    assert rs.pick(3600, per_node=True).name == "1h"
+    assert rs.pick(30 * 86400, per_node=True).name == "1d"
+
+
+def test_tier_span():
+    tier = RollupTier("x", 60, 10, 4)
+    assert (tier.span_s, tier.node_span_s) == (600, 240)
+
+
+def test_future_timestamp_does_not_move_the_ring():
+    rs = tier_set()
+    now = np.datetime64(datetime.now(), "ns")
+    m = np.timedelta64(60, "s")
+    rs.update({**cols([0] * 30, np.arange(30), np.full(30, 10.0)), "timestamp": now - 30 * m + np.arange(30) * m})
+    rs.update({**cols([1], [0], [99.0]), "timestamp": np.array([np.datetime64("2099-01-01", "ns")])})
+    rs.update({**cols([2], [0], [20.0]), "timestamp": np.array([now + np.timedelta64(5, "s")])})
+    df = rs.tiers[0].fleet_frame(now - np.timedelta64(3600, "s"))
+    # the 2099 reading lands in the current bucket instead of emptying the ring
+    assert df["count"].sum() == 32
+    assert df["power_max"].max() == pytest.approx(99)
+    assert rs.tiers[0].newest <= (now + 2 * m).astype(np.int64) // rs.tiers[0].width_ns
@@ -0,0 +1,86 @@
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+from luminode.shm import SHM_COLUMNS, SharedRing
+
+T0 = np.datetime64("2026-01-01T00:00:00", "ns")
+_names = itertools.count()
+
+
+def rows(start, n):
+    i = np.arange(start, start + n)
+    cols = {name: np.zeros(n, dtype=dt) for name, dt in SHM_COLUMNS.items()}
+    cols["timestamp"] = T0 + i * np.timedelta64(1, "s")
+    cols["node"] = (i % 2).astype(np.int32)
+    cols["power"] = i.astype(np.float64)
+    return cols
+
+
+@pytest.fixture
+def ring():
+    writer = SharedRing.create(f"lumi_test_{os.getpid()}_{next(_names)}", capacity=10, headroom=4, max_nodes=4)
+    reader = SharedRing.attach(writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+class Lapping(dict):
+    """Column map whose iteration lets the writer append ``n`` rows after the first column was copied."""
+
+    def __init__(self, cols, writer, n):
+        super().__init__(cols)
+        self.writer, self.n = writer, n
+
+    def items(self):
+        for i, item in enumerate(super().items()):
+            if i == 1:
+                start = self.writer.head
+                self.writer.append_batch(rows(start, self.n), ["a", "b"])
+            yield item
+
+
+def seconds(cols):
+    return ((cols["timestamp"] - T0) // np.timedelta64(1, "s")).tolist()
+
+
+def test_reader_follows_the_writer(ring):
+    writer, reader = ring
+    writer.append_batch(rows(0, 6), ["a", "b"])
+    assert reader.node_names() == ["a", "b"]
+    cols, cursor, lost = reader.read(0, max_rows=4)
+    assert (cols["power"].tolist(), cursor, lost) == ([0, 1, 2, 3], 4, 0)
+    cols, cursor, lost = reader.read(cursor)
+    assert (cols["power"].tolist(), cursor, lost) == ([4, 5], 6, 0)
+    assert reader.read(cursor)[0]["power"].size == 0
+    with pytest.raises(ValueError):
+        reader._cols["power"][0] = 1  # readers map the block read-only
+
+
+def test_reader_that_fell_behind_skips_ahead(ring):
+    writer, reader = ring
+    for start in (0, 8, 16):
+        writer.append_batch(rows(start, 8), ["a", "b"])  # published in chunks of `headroom`
+    cols, cursor, lost = reader.read(0)
+    assert cols["power"].tolist() == list(range(14, 24))
+    assert (cursor, lost) == (24, 14)
+
+
+def test_rows_lapped_during_the_copy_are_dropped(ring):
+    writer, reader = ring
+    writer.append_batch(rows(0, 10), ["a", "b"])
+    # the writer publishes 6 rows (more than the headroom) while the reader copies
+    reader._cols = Lapping(reader._cols, writer, 6)
+    cols, cursor, lost = reader.read(0)
+    # rows 0..5 may mix old and new values across columns: only 6..9 are kept, and they agree
+    assert (cursor, lost) == (10, 6)
+    assert cols["power"].tolist() == [6, 7, 8, 9]
+    assert seconds(cols) == [6, 7, 8, 9]
+    assert cols["node"].tolist() == [0, 1, 0, 1]
+    reader._cols = dict(reader._cols)
+    cols, cursor, lost = reader.read(cursor)
+    assert (cols["power"].tolist(), cursor, lost) == ([10, 11, 12, 13, 14, 15], 16, 0)
+    assert seconds(cols) == cols["power"].astype(int).tolist()